@@ -0,0 +1,143 @@
+import os
+import threading
+
+import httpx
+
+from api_utils import load_api_key, load_setting
+
+# 各服务商的 API key 名称、接口地址与默认代理（env 使用环境变量中的代理，direct 直连）
+PROVIDERS = {
+    "groq": {"key": "GROQ_API_KEY", "base_url": "https://api.groq.com", "proxy": "env"},
+    "deepseek": {"key": "DEEPSEEK_API_KEY", "base_url": "https://api.deepseek.com/v1", "proxy": "env"},
+    "moonshot": {"key": "MOONSHOT_API_KEY", "base_url": "https://api.moonshot.cn/v1", "proxy": "env"},
+    "gemini": {"key": "GEMINI_API_KEY", "base_url": "https://generativelanguage.googleapis.com",
+               "proxy": "direct", "auth_header": "x-goog-api-key"},
+    "dashscope": {"key": "DASHSCOPE_API_KEY", "base_url": "https://dashscope.aliyuncs.com", "proxy": "direct"},
+}
+
+def provider_proxy(provider):
+    """返回服务商的代理设置：env、direct 或代理地址，可在 api_key.ini 的 [PROXY] 中覆盖"""
+    proxy = load_setting("PROXY", provider, PROVIDERS[provider]["proxy"]).strip()
+    return proxy or "direct"
+
+def default_ollama_host():
+    host = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+    if not host.startswith(("http://", "https://")):
+        host = f"http://{host}"
+    return host.rstrip("/")
+
+def _http2_available():
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+class ProviderRegistry:
+    """进程内唯一的客户端注册表，所有 API 节点共享同一组长连接"""
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                instance = super(ProviderRegistry, cls).__new__(cls)
+                instance._lock = threading.RLock()
+                instance._api_keys = {}
+                instance._http_clients = {}
+                instance._sdk_clients = {}
+                instance._load_http_settings()
+                cls._instance = instance
+        return cls._instance
+
+    def _load_http_settings(self):
+        self.http2 = load_setting("HTTP", "http2", False, bool) and _http2_available()
+        self.limits = httpx.Limits(
+            max_connections=load_setting("HTTP", "max_connections", 20, int),
+            max_keepalive_connections=load_setting("HTTP", "max_keepalive_connections", 10, int),
+            keepalive_expiry=load_setting("HTTP", "keepalive_expiry", 120.0, float),
+        )
+        self.timeout = httpx.Timeout(
+            load_setting("HTTP", "timeout", 120.0, float),
+            connect=load_setting("HTTP", "connect_timeout", 10.0, float),
+        )
+
+    def api_key(self, provider):
+        with self._lock:
+            if provider not in self._api_keys:
+                self._api_keys[provider] = load_api_key(PROVIDERS[provider]["key"])
+            return self._api_keys[provider]
+
+    def http(self, base_url, headers=None, proxy="env"):
+        """按 base_url 和代理设置复用带连接池的 httpx.Client，代理只作用于该客户端，不修改进程环境变量"""
+        cache_key = (base_url, proxy, tuple(sorted((headers or {}).items())))
+        with self._lock:
+            client = self._http_clients.get(cache_key)
+            if client is None:
+                client = httpx.Client(
+                    base_url=base_url,
+                    headers=headers,
+                    http2=self.http2,
+                    limits=self.limits,
+                    timeout=self.timeout,
+                    trust_env=proxy == "env",
+                    proxy=None if proxy in ("env", "direct") else proxy,
+                )
+                self._http_clients[cache_key] = client
+            return client
+
+    def http_client(self, provider):
+        """返回已带上鉴权头的服务商客户端，未配置 API key 时返回 None"""
+        api_key = self.api_key(provider)
+        if not api_key:
+            return None
+        auth_header = PROVIDERS[provider].get("auth_header")
+        headers = {auth_header: api_key} if auth_header else {"Authorization": f"Bearer {api_key}"}
+        return self.http(PROVIDERS[provider]["base_url"], headers, provider_proxy(provider))
+
+    def _sdk_client(self, name, factory):
+        with self._lock:
+            if name not in self._sdk_clients:
+                self._sdk_clients[name] = factory()
+            return self._sdk_clients[name]
+
+    def groq(self):
+        api_key = self.api_key("groq")
+        if not api_key:
+            return None
+
+        def factory():
+            from groq import Groq
+            # 重试由 rate_limit 统一处理，关闭 SDK 自带的重试
+            return Groq(api_key=api_key, http_client=self.http(PROVIDERS["groq"]["base_url"], proxy=provider_proxy("groq")), max_retries=0)
+        return self._sdk_client("groq", factory)
+
+    def moonshot(self):
+        api_key = self.api_key("moonshot")
+        if not api_key:
+            return None
+
+        def factory():
+            from openai import OpenAI
+            return OpenAI(api_key=api_key, base_url=PROVIDERS["moonshot"]["base_url"],
+                          http_client=self.http(PROVIDERS["moonshot"]["base_url"], proxy=provider_proxy("moonshot")),
+                          max_retries=0)
+        return self._sdk_client("moonshot", factory)
+
+    def ollama(self, host=None):
+        host = (host or default_ollama_host()).rstrip("/")
+
+        def factory():
+            from ollama import Client
+            return Client(host=host, timeout=self.timeout, limits=self.limits, http2=self.http2)
+        return self._sdk_client(f"ollama:{host}", factory)
+
+    def close(self):
+        with self._lock:
+            for client in self._http_clients.values():
+                client.close()
+            self._http_clients.clear()
+            self._sdk_clients.clear()
+
+def get_registry():
+    return ProviderRegistry()
@@ -1,10 +1,25 @@
 import os
 import configparser
 
+INI_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'api_key.ini')
+
 def load_api_key(key_name):
     config = configparser.ConfigParser()
-    ini_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'api_key.ini')
-    if os.path.exists(ini_path):
-        config.read(ini_path)
+    if os.path.exists(INI_PATH):
+        config.read(INI_PATH)
         return config.get('API_KEYS', key_name, fallback=None)
-    return None
\ No newline at end of file
+    return None
+
+def load_setting(section, key, fallback=None, cast=str):
+    """从 api_key.ini 的指定小节读取一个可选设置，缺失或无法解析时返回 fallback"""
+    config = configparser.ConfigParser()
+    if not os.path.exists(INI_PATH):
+        return fallback
+    config.read(INI_PATH)
+    try:
+        if cast is bool:
+            return config.getboolean(section, key, fallback=fallback)
+        value = config.get(section, key, fallback=None)
+        return fallback if value is None or value == "" else cast(value)
+    except ValueError:
+        return fallback
@@ -0,0 +1,65 @@
+import atexit
+import asyncio
+import threading
+
+from api_utils import load_setting
+
+class AsyncRuntime:
+    """常驻后台线程的事件循环，同步节点通过 run() 提交协程，按 base_url 复用 aiohttp 会话"""
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                instance = super(AsyncRuntime, cls).__new__(cls)
+                instance._sessions = {}
+                instance._loop = asyncio.new_event_loop()
+                instance._thread = threading.Thread(target=instance._run_loop, name="dw-async-runtime", daemon=True)
+                instance._thread.start()
+                atexit.register(instance.close)
+                cls._instance = instance
+        return cls._instance
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+    def run(self, coro, timeout=None):
+        """在后台事件循环中执行协程并阻塞等待结果"""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result(timeout)
+
+    async def session(self, base_url, trust_env=False):
+        """返回 base_url 对应的共享会话，只能在后台事件循环中调用；trust_env 为 True 时使用环境变量中的代理"""
+        import aiohttp
+        session = self._sessions.get((base_url, trust_env))
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=load_setting("HTTP", "max_connections", 20, int),
+                keepalive_timeout=load_setting("HTTP", "keepalive_expiry", 120.0, float),
+            )
+            timeout = aiohttp.ClientTimeout(
+                total=load_setting("HTTP", "timeout", 120.0, float),
+                connect=load_setting("HTTP", "connect_timeout", 10.0, float),
+            )
+            session = aiohttp.ClientSession(connector=connector, timeout=timeout, trust_env=trust_env)
+            self._sessions[(base_url, trust_env)] = session
+        return session
+
+    async def _close_sessions(self):
+        sessions = list(self._sessions.values())
+        self._sessions.clear()
+        for session in sessions:
+            await session.close()
+
+    def close(self):
+        if not self._loop.is_running():
+            return
+        try:
+            self.run(self._close_sessions(), timeout=5)
+        except Exception:
+            pass
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+def get_async_runtime():
+    return AsyncRuntime()
@@ -0,0 +1,81 @@
+"""对比 Gemma 节点各推理模式（精度 / 动态 int8 / 线程数 / torch.compile）在 CPU 上的生成速度。
+
+用法：
+    python benchmarks/gemma_cpu_benchmark.py [--model-path DIR] [--modes float32,bfloat16,int8_dynamic]
+                                             [--threads 0,4,8] [--compile] [--max-new-tokens 128]
+
+不指定 --model-path 时按 Gemma 节点相同的候选目录查找 gemma-2-2b-it；线程数 0 表示使用 PyTorch 默认值。
+"""
+import os
+import sys
+import time
+import argparse
+
+import torch
+from transformers import AutoTokenizer, AutoModelForCausalLM
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cpu_inference import PRECISIONS, intra_op_threads, optimize_model, resolve_precision
+from model_resolver import resolve_model
+
+PROMPT = ("<start_of_turn>user\nGenerate a Stable Diffusion prompt based on the following theme: "
+          "a lighthouse on a cliff during a storm\n<end_of_turn>\n<start_of_turn>model\n")
+
+def load(model_path, precision, compile_model):
+    torch_dtype, quantize = resolve_precision(precision, "cpu")
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    model = AutoModelForCausalLM.from_pretrained(model_path, torch_dtype=torch_dtype)
+    return optimize_model(model, "cpu", quantize=quantize, compile_model=compile_model), tokenizer
+
+def measure(model, tokenizer, threads, max_new_tokens, repeat):
+    input_ids = tokenizer(PROMPT, return_tensors="pt").input_ids
+    kwargs = dict(attention_mask=torch.ones_like(input_ids), do_sample=False, pad_token_id=tokenizer.eos_token_id)
+    with torch.no_grad(), intra_op_threads(threads):
+        # 预热一次，torch.compile 的编译时间不计入结果
+        model.generate(input_ids, max_new_tokens=8, **kwargs)
+
+        start = time.perf_counter()
+        model.generate(input_ids, max_new_tokens=1, **kwargs)
+        prefill = time.perf_counter() - start
+
+        # 解码速度：扣除预填充（含第一个 token）的耗时和 token 数
+        tokens, elapsed = 0, 0.0
+        for _ in range(repeat):
+            start = time.perf_counter()
+            output = model.generate(input_ids, max_new_tokens=max_new_tokens, min_new_tokens=max_new_tokens, **kwargs)
+            elapsed += max(time.perf_counter() - start - prefill, 1e-9)
+            tokens += output.shape[-1] - input_ids.shape[-1] - 1
+    return prefill, tokens / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model-path")
+    parser.add_argument("--modes", default="float32,bfloat16,int8_dynamic")
+    parser.add_argument("--threads", default="0")
+    parser.add_argument("--compile", action="store_true", help="额外测试每种模式开启 torch.compile 的结果")
+    parser.add_argument("--max-new-tokens", type=int, default=128)
+    parser.add_argument("--repeat", type=int, default=2)
+    args = parser.parse_args()
+
+    model_path = args.model_path or resolve_model("gemma-2-2b-it", [
+        "models/LLavacheckpoints/gemma-2-2b-it",
+        "LLavacheckpoints/gemma-2-2b-it",
+        "gemma-2-2b-it",
+    ])
+    modes = [mode for mode in args.modes.split(",") if mode in PRECISIONS]
+    threads = [int(value) for value in args.threads.split(",")]
+    compile_options = [False, True] if args.compile else [False]
+
+    print(f"model: {model_path}  torch {torch.__version__}  default threads: {torch.get_num_threads()}")
+    print(f"{'mode':<14}{'compile':<9}{'threads':<9}{'prefill s':>10}{'decode tok/s':>14}")
+    for mode in modes:
+        for compile_model in compile_options:
+            model, tokenizer = load(model_path, mode, compile_model)
+            for num_threads in threads:
+                prefill, speed = measure(model, tokenizer, num_threads, args.max_new_tokens, args.repeat)
+                print(f"{mode:<14}{str(compile_model):<9}{num_threads or 'auto':<9}{prefill:>10.2f}{speed:>14.2f}")
+            del model
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import os
+import hashlib
+import threading
+
+import torch
+
+from api_utils import load_setting
+from response_cache import CACHE_DIR, ResponseCache
+
+try:
+    import xxhash
+    _new_hasher = xxhash.xxh3_128
+except ImportError:
+    _new_hasher = lambda: hashlib.blake2b(digest_size=16)
+
+def image_hash(images):
+    """IMAGE 张量内容的快速哈希（包含形状与 dtype），安装 xxhash 时使用 xxh3"""
+    tensor = images.detach()
+    if tensor.dtype == torch.bfloat16:
+        tensor = tensor.float()
+    array = tensor.contiguous().cpu().numpy()
+    hasher = _new_hasher()
+    hasher.update(f"{tuple(array.shape)}:{array.dtype}".encode())
+    hasher.update(array.reshape(-1).view("uint8"))
+    return hasher.hexdigest()
+
+class CaptionCache:
+    """图片描述缓存，按 (图片哈希, 模型, 提示词, 生成参数) 寻址，复用响应缓存的持久化与 LRU 淘汰"""
+
+    def __init__(self, store):
+        self.store = store
+
+    @staticmethod
+    def make_key(digest, model, prompt, **params):
+        return ResponseCache.make_key("caption", model, prompt, image=digest, **params)
+
+    def cached(self, images, model, prompt, func, **params):
+        """整张（或整批）图片对应一条描述时使用：命中直接返回，否则调用 func 并缓存"""
+        return self.store.cached(self.make_key(image_hash(images), model, prompt, **params), func)
+
+    def cached_frames(self, frames, model, prompt, func, **params):
+        """逐帧查缓存，只对未命中的帧调用 func(帧序号列表)，返回按帧排列的描述列表"""
+        keys = [self.make_key(image_hash(frame), model, prompt, **params) for frame in frames]
+        return self._cached_many(keys, func)
+
+    def cached_prompts(self, image, model, prompts, func, **params):
+        """同一张图片的多个问题逐个查缓存，只对未命中的问题调用 func(问题序号列表)，返回按问题排列的回答列表"""
+        digest = image_hash(image)
+        return self._cached_many([self.make_key(digest, model, prompt, **params) for prompt in prompts], func)
+
+    def _cached_many(self, keys, func):
+        captions = [self.store.get(key) for key in keys]
+        missing = [i for i, caption in enumerate(captions) if caption is None]
+        if missing:
+            for i, caption in zip(missing, func(missing)):
+                captions[i] = caption
+                if isinstance(caption, str) and caption:
+                    self.store.set(keys[i], caption)
+        return captions
+
+    def stats(self):
+        return self.store.stats()
+
+    def clear(self):
+        self.store.clear()
+
+_caption_cache = None
+_caption_cache_lock = threading.Lock()
+
+def get_caption_cache():
+    """返回进程共享的图片描述缓存，在 api_key.ini 的 [CAPTION_CACHE] 中关闭时返回 None"""
+    global _caption_cache
+    if not load_setting("CAPTION_CACHE", "enabled", True, bool):
+        return None
+    with _caption_cache_lock:
+        if _caption_cache is None:
+            _caption_cache = CaptionCache(ResponseCache(
+                os.path.join(CACHE_DIR, "captions.sqlite3"),
+                max_bytes=load_setting("CAPTION_CACHE", "max_mb", 32, int) * 1024 * 1024,
+                max_age=load_setting("CAPTION_CACHE", "max_age_days", 90, float) * 24 * 3600,
+            ))
+        return _caption_cache
@@ -0,0 +1,87 @@
+from collections import deque
+
+# 每条消息在请求中的固定开销（角色标记等）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+def _is_cjk(ch):
+    code = ord(ch)
+    return (0x2E80 <= code <= 0x9FFF) or (0xAC00 <= code <= 0xD7AF) or (0xF900 <= code <= 0xFAFF) or (0xFF00 <= code <= 0xFFEF)
+
+def estimate_tokens(text):
+    """本地估算 token 数：中日韩字符按 1 个 token，其他字符约 4 个字符 1 个 token"""
+    if not text:
+        return 0
+    cjk = sum(1 for ch in text if _is_cjk(ch))
+    return cjk + (len(text) - cjk + 3) // 4
+
+class ConversationHistory:
+    """带 token 预算的多轮对话历史，系统消息固定保留，超出预算时从最早的轮次开始淘汰"""
+
+    def __init__(self, token_budget=4096):
+        self.token_budget = token_budget
+        self.system_message = None
+        self._system_tokens = 0
+        self._turns = deque()  # (message, tokens)
+        self._turn_tokens = 0
+
+    def reset(self):
+        self.system_message = None
+        self._system_tokens = 0
+        self._turns.clear()
+        self._turn_tokens = 0
+
+    def set_system(self, content):
+        self.system_message = {"role": "system", "content": content}
+        self._system_tokens = estimate_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+
+    def append(self, role, content):
+        tokens = estimate_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+        self._turns.append(({"role": role, "content": content}, tokens))
+        self._turn_tokens += tokens
+
+    def pop(self):
+        message, tokens = self._turns.pop()
+        self._turn_tokens -= tokens
+        return message
+
+    def pop_if_last(self, role, content):
+        """最后一条消息正是 (role, content) 时撤回它，返回是否撤回"""
+        if self._turns and self._turns[-1][0] == {"role": role, "content": content}:
+            self.pop()
+            return True
+        return False
+
+    @property
+    def total_tokens(self):
+        return self._system_tokens + self._turn_tokens
+
+    def trim(self, token_budget=None):
+        """淘汰最早的轮次直到总量落入预算，最后一条消息始终保留"""
+        budget = self.token_budget if token_budget is None else token_budget
+        if not budget:
+            return
+        while len(self._turns) > 1 and self.total_tokens > budget:
+            self._drop_oldest()
+        # 不以助手回复开头，避免出现没有提问的回答
+        while len(self._turns) > 1 and self._turns[0][0]["role"] == "assistant":
+            self._drop_oldest()
+
+    def _drop_oldest(self):
+        _, tokens = self._turns.popleft()
+        self._turn_tokens -= tokens
+
+    def messages(self, token_budget=None):
+        self.trim(token_budget)
+        return list(self)
+
+    def __iter__(self):
+        if self.system_message:
+            yield self.system_message
+        for message, _ in self._turns:
+            yield message
+
+    def __len__(self):
+        return len(self._turns) + (1 if self.system_message else 0)
+
+    def __bool__(self):
+        return len(self) > 0
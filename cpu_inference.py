@@ -0,0 +1,77 @@
+from contextlib import contextmanager
+
+import torch
+
+# 本地 LLM 节点的精度选项：前两项保持原有行为，bfloat16 / int8_dynamic 面向 CPU 推理
+PRECISIONS = ["float32", "float16", "bfloat16", "int8_dynamic"]
+
+_bf16_supported = None
+
+def _cpu_flags():
+    try:
+        with open("/proc/cpuinfo", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("flags"):
+                    return set(line.split(":", 1)[1].split())
+    except OSError:
+        pass
+    return set()
+
+def _mkldnn_bf16_supported():
+    # 没有 /proc/cpuinfo 的系统（Windows、macOS）改用 oneDNN 自带的 CPU 检测
+    try:
+        return torch.backends.mkldnn.is_available() and bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        return False
+
+def cpu_bf16_supported():
+    """CPU 是否有原生 bfloat16 指令（AVX512-BF16 / AMX），没有时 bf16 矩阵乘会退化成很慢的软件实现；
+    Linux 读取 /proc/cpuinfo，其他系统使用 oneDNN 的检测结果，无法检测时按不支持处理"""
+    global _bf16_supported
+    if _bf16_supported is None:
+        flags = _cpu_flags()
+        _bf16_supported = bool({"avx512_bf16", "amx_bf16"} & flags) if flags else _mkldnn_bf16_supported()
+    return _bf16_supported
+
+def resolve_precision(precision, device):
+    """返回 (加载用的 dtype, 是否做动态 int8 量化)；当前设备不支持时回退并打印原因"""
+    on_cpu = not str(device).startswith("cuda")
+    if precision == "int8_dynamic":
+        if on_cpu:
+            return torch.float32, True
+        print("[CPUInference] int8_dynamic only runs on CPU, using float16 on cuda")
+        return torch.float16, False
+    if precision == "bfloat16":
+        if on_cpu and not cpu_bf16_supported():
+            print("[CPUInference] this CPU has no native bfloat16 support, using float32")
+            return torch.float32, False
+        return torch.bfloat16, False
+    if precision == "float16":
+        return torch.float16, False
+    return torch.float32, False
+
+def optimize_model(model, device, quantize=False, compile_model=False):
+    """加载后的优化：CPU 上对 Linear 层做动态 int8 量化，可选 torch.compile"""
+    model.eval()
+    if quantize:
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    if compile_model:
+        try:
+            # 生成时序列长度不断变化，使用动态形状避免每个 token 重新编译
+            model.forward = torch.compile(model.forward, dynamic=True)
+        except Exception as e:
+            print(f"[CPUInference] torch.compile unavailable, running eagerly: {e}")
+    return model
+
+@contextmanager
+def intra_op_threads(num_threads):
+    """在推理期间临时设置 intra-op 线程数，0 表示不修改；结束后恢复，避免影响其他节点"""
+    if not num_threads or num_threads <= 0:
+        yield
+        return
+    previous = torch.get_num_threads()
+    torch.set_num_threads(num_threads)
+    try:
+        yield
+    finally:
+        torch.set_num_threads(previous)
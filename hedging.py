@@ -0,0 +1,146 @@
+import time
+import asyncio
+import threading
+from collections import deque
+
+from api_clients import PROVIDERS, get_registry, provider_proxy
+from api_utils import load_setting
+from async_runtime import get_async_runtime
+from rate_limit import call_with_limits_async, estimate_request_tokens
+
+# 节点上可选的备用服务商，"none" 表示不对冲
+HEDGE_PROVIDERS = ["none", "groq", "deepseek", "moonshot", "gemini"]
+
+DEFAULT_MODELS = {
+    "groq": "llama-3.1-70b-versatile",
+    "deepseek": "deepseek-chat",
+    "moonshot": "moonshot-v1-8k",
+    "gemini": "gemini-1.5-flash",
+}
+
+def _chat_url(provider):
+    base_url = PROVIDERS[provider]["base_url"]
+    if provider == "groq":
+        return f"{base_url}/openai/v1/chat/completions"
+    if provider == "gemini":
+        return f"{base_url}/v1beta/models/{{model}}:generateContent"
+    return f"{base_url}/chat/completions"
+
+class LatencyTracker:
+    """记录各服务商最近的响应耗时，用于计算对冲等待时间"""
+
+    def __init__(self, window=200):
+        self._lock = threading.Lock()
+        self._samples = {}
+        self.window = window
+
+    def record(self, provider, seconds):
+        with self._lock:
+            samples = self._samples.get(provider)
+            if samples is None:
+                samples = self._samples[provider] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def percentile(self, provider, q, min_samples=10):
+        with self._lock:
+            samples = sorted(self._samples.get(provider, ()))
+        if len(samples) < min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(q / 100 * len(samples)))]
+
+LATENCY = LatencyTracker()
+
+def hedge_delay(provider):
+    """主服务商超过其历史 P{percentile} 耗时仍未返回时才发出对冲请求；样本不足时使用默认值"""
+    percentile = load_setting("HEDGING", "percentile", 95, float)
+    delay = LATENCY.percentile(provider, percentile, load_setting("HEDGING", "min_samples", 10, int))
+    if delay is None:
+        delay = load_setting("HEDGING", "default_delay", 3.0, float)
+    return max(delay, load_setting("HEDGING", "min_delay", 0.5, float))
+
+def default_model(provider):
+    return load_setting("HEDGING", f"{provider}_model", DEFAULT_MODELS[provider])
+
+async def _provider_session(provider):
+    """按服务商的代理设置返回会话和请求级代理地址"""
+    proxy = provider_proxy(provider)
+    session = await get_async_runtime().session(PROVIDERS[provider]["base_url"], trust_env=proxy == "env")
+    return session, None if proxy in ("env", "direct") else proxy
+
+async def _openai_compatible(provider, model, messages, temperature, max_tokens, api_key):
+    session, proxy = await _provider_session(provider)
+    data = {"model": model, "messages": messages, "temperature": temperature, "max_tokens": max_tokens}
+    headers = {"Authorization": f"Bearer {api_key}"}
+    async with session.post(_chat_url(provider), headers=headers, json=data, proxy=proxy) as response:
+        response.raise_for_status()
+        result = await response.json()
+    return result['choices'][0]['message']['content']
+
+async def _gemini(model, messages, temperature, max_tokens, api_key):
+    session, proxy = await _provider_session("gemini")
+    system = [m["content"] for m in messages if m["role"] == "system" and m["content"]]
+    data = {
+        "contents": [{"role": "model" if m["role"] == "assistant" else "user", "parts": [{"text": m["content"]}]}
+                     for m in messages if m["role"] != "system"],
+        "generationConfig": {"temperature": temperature, "maxOutputTokens": max_tokens},
+    }
+    if system:
+        data["systemInstruction"] = {"parts": [{"text": "\n\n".join(system)}]}
+    async with session.post(_chat_url("gemini").format(model=model), headers={"x-goog-api-key": api_key}, json=data, proxy=proxy) as response:
+        response.raise_for_status()
+        result = await response.json()
+    return "".join(part.get("text", "") for part in result['candidates'][0]['content']['parts'])
+
+async def complete_chat(provider, model, messages, temperature, max_tokens):
+    """向指定服务商发送一次聊天请求并记录耗时"""
+    api_key = get_registry().api_key(provider)
+    if not api_key:
+        raise RuntimeError(f"{PROVIDERS[provider]['key']} not found in api_key.ini")
+    start = time.perf_counter()
+    try:
+        if provider == "gemini":
+            request = lambda: _gemini(model, messages, temperature, max_tokens, api_key)
+        else:
+            request = lambda: _openai_compatible(provider, model, messages, temperature, max_tokens, api_key)
+        text = await call_with_limits_async(provider, request, estimate_request_tokens(messages, max_tokens=max_tokens))
+    except asyncio.CancelledError:
+        # 被取消的慢请求也计入样本（作为下限），避免分位数只反映快的请求
+        LATENCY.record(provider, time.perf_counter() - start)
+        raise
+    LATENCY.record(provider, time.perf_counter() - start)
+    return text
+
+async def _hedged(calls, delay):
+    primary = asyncio.ensure_future(complete_chat(*calls[0]))
+    done, _ = await asyncio.wait({primary}, timeout=delay)
+    errors = []
+    tasks = {}
+    if primary in done:
+        if primary.exception() is None:
+            return primary.result(), calls[0][0]
+        errors.append(f"{calls[0][0]}: {primary.exception()}")
+    else:
+        tasks[primary] = calls[0][0]
+    # 主请求超时未返回或已失败，发出备用请求
+    tasks[asyncio.ensure_future(complete_chat(*calls[1]))] = calls[1][0]
+    try:
+        while tasks:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                provider = tasks.pop(task)
+                if task.exception() is None:
+                    return task.result(), provider
+                errors.append(f"{provider}: {task.exception()}")
+        raise RuntimeError("; ".join(errors))
+    finally:
+        # 先完成者胜出，取消仍在进行的请求
+        for task in tasks:
+            task.cancel()
+
+def hedged_chat(primary, primary_model, messages, temperature, max_tokens, secondary, secondary_model=None):
+    """对冲请求：主服务商超过等待时间未返回时同时请求备用服务商，返回 (文本, 实际服务的服务商)"""
+    calls = [
+        (primary, primary_model, messages, temperature, max_tokens),
+        (secondary, secondary_model or default_model(secondary), messages, temperature, max_tokens),
+    ]
+    return get_async_runtime().run(_hedged(calls, hedge_delay(primary)))
@@ -0,0 +1,124 @@
+import base64
+import threading
+import weakref
+from io import BytesIO
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+from PIL import Image
+
+from api_utils import load_setting
+
+MIME_TYPES = {"jpeg": "image/jpeg", "webp": "image/webp", "png": "image/png"}
+
+class EncodedImage:
+    """编码后的图片数据，按各 API 需要的形式取 base64 或 data URI"""
+    __slots__ = ("data", "format", "width", "height")
+
+    def __init__(self, data, fmt, width, height):
+        self.data = data
+        self.format = fmt
+        self.width = width
+        self.height = height
+
+    @property
+    def mime_type(self):
+        return MIME_TYPES[self.format]
+
+    @property
+    def b64(self):
+        return base64.b64encode(self.data).decode()
+
+    @property
+    def data_uri(self):
+        return f"data:{self.mime_type};base64,{self.b64}"
+
+def upload_settings(max_side=None, fmt=None, quality=None):
+    """读取 [IMAGE_UPLOAD] 设置，调用方传入的参数优先"""
+    if max_side is None:
+        max_side = load_setting("IMAGE_UPLOAD", "max_side", 1536, int)
+    if fmt is None:
+        fmt = load_setting("IMAGE_UPLOAD", "format", "jpeg")
+    if quality is None:
+        quality = load_setting("IMAGE_UPLOAD", "quality", 90, int)
+    fmt = fmt.strip().lower().replace("jpg", "jpeg")
+    if fmt not in MIME_TYPES:
+        raise ValueError(f"Unsupported image upload format: {fmt}")
+    return max_side, fmt, quality
+
+def to_uint8(images):
+    """IMAGE 张量 [B,H,W,C]（0~1 浮点）直接在原设备上转成 uint8 numpy 数组，不经过 float64"""
+    if images.dim() == 3:
+        images = images.unsqueeze(0)
+    return images.detach().mul(255).clamp_(0, 255).to(torch.uint8).cpu().numpy()
+
+def encode_array(array, max_side, fmt, quality):
+    """把单帧 uint8 数组缩放到 max_side 以内并编码"""
+    img = Image.fromarray(array[..., 0] if array.shape[-1] == 1 else array)
+    if max_side and max(img.size) > max_side:
+        img.thumbnail((max_side, max_side), Image.LANCZOS)
+    buffered = BytesIO()
+    if fmt == "png":
+        img.save(buffered, format="PNG", compress_level=1)
+    else:
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        img.save(buffered, format=fmt.upper(), quality=quality)
+    return EncodedImage(buffered.getvalue(), fmt, img.width, img.height)
+
+class ImagePayloadEncoder:
+    """API 视觉节点共享的图片编码器：批量图片在线程池中并行编码，同一张量的结果在其存活期间复用"""
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                instance = super(ImagePayloadEncoder, cls).__new__(cls)
+                instance._lock = threading.Lock()
+                instance._cache = OrderedDict()
+                instance._max_items = max(0, load_setting("IMAGE_UPLOAD", "cache_items", 16, int))
+                instance._pool = ThreadPoolExecutor(
+                    max_workers=max(1, load_setting("IMAGE_UPLOAD", "workers", 4, int)),
+                    thread_name_prefix="dw-image-encode",
+                )
+                cls._instance = instance
+        return cls._instance
+
+    def _forget(self, tensor_id):
+        with self._lock:
+            for key in [key for key in self._cache if key[0] == tensor_id]:
+                del self._cache[key]
+
+    def encode(self, images, max_side=None, fmt=None, quality=None):
+        """编码 IMAGE 张量中的每一帧，返回 EncodedImage 列表"""
+        settings = upload_settings(max_side, fmt, quality)
+        # 张量 id 加上原地修改计数作为键，张量被回收（工作流输出被释放）时对应条目随之删除
+        key = (id(images), getattr(images, "_version", 0)) + settings
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return cached
+
+        frames = to_uint8(images)
+        if len(frames) == 1:
+            encoded = [encode_array(frames[0], *settings)]
+        else:
+            encoded = list(self._pool.map(lambda frame: encode_array(frame, *settings), frames))
+
+        if self._max_items:
+            with self._lock:
+                if not any(k[0] == key[0] for k in self._cache):
+                    weakref.finalize(images, self._forget, key[0])
+                self._cache[key] = encoded
+                while len(self._cache) > self._max_items:
+                    self._cache.popitem(last=False)
+        return encoded
+
+def get_image_encoder():
+    return ImagePayloadEncoder()
+
+def encode_images(images, max_side=None, fmt=None, quality=None):
+    return get_image_encoder().encode(images, max_side, fmt, quality)
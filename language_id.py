@@ -0,0 +1,86 @@
+import numpy as np
+
+from api_utils import load_setting
+
+# 码位区间上界（不含）与对应的文字类别，用 searchsorted 一次性统计整段文本
+_SCRIPT_BOUNDS = np.array([
+    0x0041, 0x005B, 0x0061, 0x007B,  # A-Z, a-z
+    0x00C0, 0x0250,                  # 拉丁扩展
+    0x3040, 0x3100,                  # 平假名、片假名
+    0x3400, 0xA000,                  # CJK 统一汉字（含扩展 A）
+    0xAC00, 0xD7B0,                  # 韩文音节
+    0xF900, 0xFB00,                  # CJK 兼容汉字
+], dtype=np.uint32)
+_BIN_SCRIPTS = [None, "latin", None, "latin", None, "latin", None, "kana", None, "han", None, "hangul", None, "han", None]
+
+# 语言代码与主要文字的对应关系
+LANGUAGE_SCRIPTS = {"en": "latin", "zh": "han", "ja": "kana", "ko": "hangul"}
+
+def script_histogram(text):
+    """统计文本中各文字类别的字符数"""
+    if not text:
+        return {}
+    codepoints = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+    counts = np.bincount(np.searchsorted(_SCRIPT_BOUNDS, codepoints, side="right"), minlength=len(_BIN_SCRIPTS))
+    histogram = {}
+    for script, count in zip(_BIN_SCRIPTS, counts):
+        if script and count:
+            histogram[script] = histogram.get(script, 0) + int(count)
+    return histogram
+
+class ScriptRatioDetector:
+    """按文字比例判断语言：确定性、无需加载模型，适合区分中日韩与英文"""
+    name = "script"
+
+    def __init__(self, min_ratio=0.3):
+        self.min_ratio = min_ratio
+
+    def detect(self, text):
+        histogram = script_histogram(text)
+        total = sum(histogram.values())
+        if not total:
+            return None
+        # 有假名即为日文，汉字和拉丁字母按比例判断（英文提示词里常夹少量中文，反之亦然）
+        if histogram.get("kana", 0) / total >= 0.1:
+            return "ja"
+        if histogram.get("hangul", 0) / total >= self.min_ratio:
+            return "ko"
+        # 一个汉字约相当于一个英文单词，拉丁字母按每 4 个折算
+        han = histogram.get("han", 0)
+        latin = histogram.get("latin", 0) / 4
+        if han and han / (han + latin) >= self.min_ratio:
+            return "zh"
+        return "en" if latin else None
+
+class LangdetectDetector:
+    """langdetect 的封装：固定随机种子，并把 zh-cn / zh-tw 统一为 zh"""
+    name = "langdetect"
+
+    def __init__(self):
+        from langdetect import DetectorFactory
+        DetectorFactory.seed = 0
+
+    def detect(self, text):
+        from langdetect import detect
+        from langdetect.lang_detect_exception import LangDetectException
+        try:
+            return detect(text).split("-")[0]
+        except LangDetectException:
+            return None
+
+DETECTORS = {
+    ScriptRatioDetector.name: ScriptRatioDetector,
+    LangdetectDetector.name: LangdetectDetector,
+}
+
+_detectors = {}
+
+def get_language_detector(name=None):
+    """返回语言检测器，默认使用 api_key.ini 中 [TRANSLATION] language_detector 的配置"""
+    name = name or load_setting("TRANSLATION", "language_detector", ScriptRatioDetector.name)
+    if name not in _detectors:
+        _detectors[name] = DETECTORS[name]()
+    return _detectors[name]
+
+def is_language(text, lang, detector=None):
+    return (detector or get_language_detector()).detect(text) == lang
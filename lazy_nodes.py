@@ -0,0 +1,176 @@
+import os
+import json
+import hashlib
+import time
+import importlib
+import threading
+
+PACKAGE_DIR = os.path.dirname(os.path.realpath(__file__))
+NODES_DIR = os.path.join(PACKAGE_DIR, "nodes")
+CACHE_DIR = os.path.join(PACKAGE_DIR, "cache")
+MANIFEST_PATH = os.path.join(CACHE_DIR, "node_manifest.json")
+REPORT_PATH = os.path.join(CACHE_DIR, "import_report.json")
+MANIFEST_VERSION = 2
+
+# ComfyUI 会从节点类上读取的类属性
+CLASS_ATTRIBUTES = ("RETURN_TYPES", "RETURN_NAMES", "FUNCTION", "CATEGORY", "OUTPUT_NODE",
+                    "OUTPUT_IS_LIST", "INPUT_IS_LIST", "OUTPUT_TOOLTIPS", "DESCRIPTION", "DEPRECATED", "EXPERIMENTAL",
+                    "NOT_IDEMPOTENT")
+# IS_CHANGED / VALIDATE_INPUTS 在类上调用，check_lazy_status 在节点实例上调用
+CLASS_HOOKS = ("IS_CHANGED", "VALIDATE_INPUTS", "check_lazy_status")
+INSTANCE_HOOKS = ("check_lazy_status",)
+
+# 每个模块的导入耗时（秒）及导入方式
+IMPORT_TIMES = {}
+_import_lock = threading.Lock()
+
+_helpers_signature = None
+
+def _helpers_digest():
+    # 节点的输入定义可能来自插件根目录的共享模块（如 cpu_inference.PRECISIONS），这些模块变化时所有清单都失效
+    global _helpers_signature
+    if _helpers_signature is None:
+        digest = hashlib.sha1()
+        for name in sorted(os.listdir(PACKAGE_DIR)):
+            if name.endswith(".py"):
+                with open(os.path.join(PACKAGE_DIR, name), "rb") as f:
+                    digest.update(name.encode("utf-8"))
+                    digest.update(f.read())
+        _helpers_signature = digest.hexdigest()
+    return _helpers_signature
+
+def _module_signature(module_name):
+    # 按源码内容判断清单是否过期，镜像复制导致的 mtime 变化不会让清单失效
+    with open(os.path.join(NODES_DIR, f"{module_name}.py"), "rb") as f:
+        return hashlib.sha1(f.read() + _helpers_digest().encode("ascii")).hexdigest()
+
+def _read_json(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _write_json(path, data):
+    try:
+        text = json.dumps(data, ensure_ascii=False, indent=2)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+    except (OSError, TypeError, ValueError) as e:
+        print(f"[DW] Failed to write {path}: {e}")
+
+def _as_tuple(value):
+    return tuple(value) if isinstance(value, list) else value
+
+def _restore_input_types(input_types):
+    # JSON 会把元组存成列表，还原成 ComfyUI 习惯的 (type, options) 元组
+    return {section: {name: _as_tuple(spec) if isinstance(spec, list) else spec for name, spec in inputs.items()}
+            for section, inputs in input_types.items()}
+
+def import_node_module(package, module_name, mode):
+    with _import_lock:
+        start = time.perf_counter()
+        module = importlib.import_module(f".nodes.{module_name}", package)
+        elapsed = time.perf_counter() - start
+        if module_name not in IMPORT_TIMES or IMPORT_TIMES[module_name]["mode"] == "lazy":
+            IMPORT_TIMES[module_name] = {"seconds": round(elapsed, 4), "mode": mode}
+            if mode == "deferred":
+                print(f"[DW] Deferred import of nodes.{module_name}: {elapsed:.2f}s")
+                _write_json(REPORT_PATH, IMPORT_TIMES)
+        return module
+
+def _describe_module(module_name, module):
+    nodes = {}
+    for node_name, node_class in module.NODE_CLASS_MAPPINGS.items():
+        nodes[node_name] = {
+            "input_types": node_class.INPUT_TYPES(),
+            "attrs": {attr: getattr(node_class, attr) for attr in CLASS_ATTRIBUTES if hasattr(node_class, attr)},
+            "hooks": [hook for hook in CLASS_HOOKS if hasattr(node_class, hook)],
+        }
+    entry = {
+        "signature": _module_signature(module_name),
+        "nodes": nodes,
+        "display_names": getattr(module, "NODE_DISPLAY_NAME_MAPPINGS", {}),
+    }
+    json.dumps(entry)  # 无法序列化的输入定义不能走懒加载
+    return entry
+
+def _make_stub(package, module_name, node_name, meta):
+    real_class = None
+
+    def resolve():
+        nonlocal real_class
+        if real_class is None:
+            module = import_node_module(package, module_name, "deferred")
+            real_class = module.NODE_CLASS_MAPPINGS[node_name]
+        return real_class
+
+    def input_types(cls):
+        # 真实模块加载后以真实定义为准
+        if real_class is not None:
+            return real_class.INPUT_TYPES()
+        return _restore_input_types(meta["input_types"])
+
+    def init(self):
+        object.__setattr__(self, "_real", resolve()())
+
+    def getattr_(self, name):
+        return getattr(object.__getattribute__(self, "_real"), name)
+
+    attrs = {attr: _as_tuple(value) for attr, value in meta["attrs"].items()}
+    attrs.update({
+        "INPUT_TYPES": classmethod(input_types),
+        "__init__": init,
+        "__getattr__": getattr_,
+        "__module__": f"{package}.nodes.{module_name}",
+    })
+    for hook in meta["hooks"]:
+        if hook in INSTANCE_HOOKS:
+            attrs[hook] = lambda self, *args, _hook=hook, **kwargs: getattr(object.__getattribute__(self, "_real"), _hook)(*args, **kwargs)
+        else:
+            attrs[hook] = classmethod(lambda cls, *args, _hook=hook, **kwargs: getattr(resolve(), _hook)(*args, **kwargs))
+    return type(node_name, (object,), attrs)
+
+def load_node_modules(package, eager_modules, lazy_modules):
+    """导入节点模块并返回 (NODE_CLASS_MAPPINGS, NODE_DISPLAY_NAME_MAPPINGS)。
+
+    eager_modules 立即导入；lazy_modules 若在 node_manifest.json 中有与源文件匹配的记录，
+    则只注册占位类，真正的导入推迟到节点第一次执行时。
+    """
+    manifest = _read_json(MANIFEST_PATH)
+    if manifest.get("version") != MANIFEST_VERSION:
+        manifest = {"version": MANIFEST_VERSION, "modules": {}}
+    manifest_changed = False
+
+    class_mappings = {}
+    display_mappings = {}
+    for module_name in [*eager_modules, *lazy_modules]:
+        entry = manifest["modules"].get(module_name)
+        if module_name in lazy_modules and entry and entry["signature"] == _module_signature(module_name):
+            IMPORT_TIMES[module_name] = {"seconds": 0.0, "mode": "lazy"}
+            for node_name, meta in entry["nodes"].items():
+                class_mappings[node_name] = _make_stub(package, module_name, node_name, meta)
+            display_mappings.update(entry["display_names"])
+            continue
+
+        module = import_node_module(package, module_name, "eager")
+        class_mappings.update(module.NODE_CLASS_MAPPINGS)
+        display_mappings.update(getattr(module, "NODE_DISPLAY_NAME_MAPPINGS", {}))
+        if module_name in lazy_modules:
+            try:
+                manifest["modules"][module_name] = _describe_module(module_name, module)
+                manifest_changed = True
+            except Exception as e:
+                print(f"[DW] Could not record nodes.{module_name} for lazy loading: {e}")
+
+    if manifest_changed:
+        _write_json(MANIFEST_PATH, manifest)
+    _write_json(REPORT_PATH, IMPORT_TIMES)
+    print_import_report()
+    return class_mappings, display_mappings
+
+def print_import_report():
+    print("[DW] Node module import times:")
+    for module_name, info in sorted(IMPORT_TIMES.items(), key=lambda item: -item[1]["seconds"]):
+        print(f"  {info['seconds']:7.3f}s  {info['mode']:<8} nodes.{module_name}")
@@ -0,0 +1,194 @@
+import gc
+import os
+import time
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from api_utils import load_setting
+
+def _system_ram_bytes():
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (ValueError, OSError, AttributeError):
+        return 16 * 1024 ** 3
+
+def _cuda_total_bytes():
+    import torch
+    if not torch.cuda.is_available():
+        return 0
+    return torch.cuda.get_device_properties(0).total_memory
+
+def estimate_size(obj):
+    """估算已加载对象占用的显存/内存字节数，支持 nn.Module、pipeline 以及它们组成的元组"""
+    if obj is None:
+        return 0
+    if isinstance(obj, (tuple, list)):
+        return sum(estimate_size(item) for item in obj)
+    if hasattr(obj, "parameters") and hasattr(obj, "buffers"):
+        tensors = [*obj.parameters(), *obj.buffers()]
+        return sum(t.numel() * t.element_size() for t in tensors)
+    if hasattr(obj, "model"):
+        return estimate_size(obj.model)
+    return 0
+
+class _Resident:
+    __slots__ = ("value", "device", "size", "last_used", "pins")
+
+    def __init__(self, value, device, size):
+        self.value = value
+        self.device = device
+        self.size = size
+        self.last_used = time.monotonic()
+        self.pins = 0
+
+class ModelResidencyManager:
+    """所有本地模型节点共享的常驻管理器：按内存/显存预算做 LRU 淘汰，空闲超时后后台卸载"""
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                instance = super(ModelResidencyManager, cls).__new__(cls)
+                instance._lock = threading.RLock()
+                instance._residents = OrderedDict()
+                instance._known_sizes = {}
+                instance._loading = {}
+                instance._reaper = None
+                instance._load_settings()
+                cls._instance = instance
+        return cls._instance
+
+    def _load_settings(self):
+        vram_mb = load_setting("MODELS", "vram_budget_mb", 0, int)
+        ram_mb = load_setting("MODELS", "ram_budget_mb", 0, int)
+        # 未配置时默认使用 60% 显存和 50% 内存
+        self.vram_budget = vram_mb * 1024 ** 2 if vram_mb else int(_cuda_total_bytes() * 0.6)
+        self.ram_budget = ram_mb * 1024 ** 2 if ram_mb else int(_system_ram_bytes() * 0.5)
+        self.idle_timeout = load_setting("MODELS", "idle_timeout", 600, float)
+
+    def _budget(self, device):
+        return self.vram_budget if str(device).startswith("cuda") else self.ram_budget
+
+    def _pool(self, device):
+        return "cuda" if str(device).startswith("cuda") else "cpu"
+
+    def _used(self, pool):
+        return sum(r.size for r in self._residents.values() if self._pool(r.device) == pool)
+
+    @contextmanager
+    def use(self, key, loader, device="cpu", size_hint=None):
+        """取出（必要时加载）模型，使用期间固定在内存中不被淘汰"""
+        resident = self._acquire(key, loader, device, size_hint)
+        try:
+            yield resident.value
+        finally:
+            with self._lock:
+                resident.pins -= 1
+                resident.last_used = time.monotonic()
+
+    def _acquire(self, key, loader, device, size_hint):
+        while True:
+            with self._lock:
+                resident = self._residents.get(key)
+                if resident is not None:
+                    self._residents.move_to_end(key)
+                    resident.pins += 1
+                    resident.last_used = time.monotonic()
+                    return resident
+                loading = self._loading.get(key)
+                if loading is None:
+                    loading = self._loading[key] = threading.Event()
+                    # 先按已知大小腾出空间，再在锁外加载
+                    expected = self._known_sizes.get(key, size_hint or 0)
+                    self._make_room(device, expected)
+                    break
+            # 同一模型正由其他调用加载，等待完成后重新查找
+            loading.wait()
+
+        try:
+            value = loader()
+            size = estimate_size(value) or expected
+            with self._lock:
+                self._known_sizes[key] = size
+                resident = _Resident(value, device, size)
+                resident.pins = 1
+                self._residents[key] = resident
+                self._make_room(device, 0)
+                self._ensure_reaper()
+            print(f"[ModelResidency] loaded {key} on {device} ({size / 1024 ** 2:.0f} MB)")
+            return resident
+        finally:
+            with self._lock:
+                self._loading.pop(key, None)
+            loading.set()
+
+    def _make_room(self, device, incoming):
+        pool = self._pool(device)
+        budget = self._budget(device)
+        if not budget:
+            return
+        for key in list(self._residents):
+            if self._used(pool) + incoming <= budget:
+                break
+            resident = self._residents[key]
+            if self._pool(resident.device) == pool and resident.pins == 0:
+                self._evict(key, "budget")
+
+    def _evict(self, key, reason):
+        resident = self._residents.pop(key)
+        device = resident.device
+        resident.value = None
+        del resident
+        gc.collect()
+        if self._pool(device) == "cuda":
+            import torch
+            torch.cuda.empty_cache()
+        print(f"[ModelResidency] unloaded {key} ({reason})")
+
+    def unload(self, key):
+        with self._lock:
+            resident = self._residents.get(key)
+            if resident is not None and resident.pins == 0:
+                self._evict(key, "requested")
+
+    def unload_all(self):
+        with self._lock:
+            for key in list(self._residents):
+                if self._residents[key].pins == 0:
+                    self._evict(key, "requested")
+
+    def _ensure_reaper(self):
+        if self.idle_timeout <= 0 or (self._reaper is not None and self._reaper.is_alive()):
+            return
+        self._reaper = threading.Thread(target=self._reap_idle, name="dw-model-reaper", daemon=True)
+        self._reaper.start()
+
+    def _reap_idle(self):
+        interval = max(1.0, min(30.0, self.idle_timeout / 4))
+        while True:
+            time.sleep(interval)
+            with self._lock:
+                now = time.monotonic()
+                for key in list(self._residents):
+                    resident = self._residents[key]
+                    if resident.pins == 0 and now - resident.last_used > self.idle_timeout:
+                        self._evict(key, "idle")
+                if not self._residents:
+                    self._reaper = None
+                    return
+
+    def stats(self):
+        with self._lock:
+            return {
+                "vram_budget": self.vram_budget,
+                "ram_budget": self.ram_budget,
+                "vram_used": self._used("cuda"),
+                "ram_used": self._used("cpu"),
+                "models": {str(key): {"device": str(r.device), "size": r.size, "pinned": r.pins > 0}
+                           for key, r in self._residents.items()},
+            }
+
+def get_residency_manager():
+    return ModelResidencyManager()
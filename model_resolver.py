@@ -0,0 +1,165 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+from api_utils import load_setting
+from response_cache import CACHE_DIR
+
+MANIFEST_NAME = ".dw_manifest.json"
+# huggingface_hub 在 local_dir 下保存的下载元数据，不计入清单
+IGNORED_DIRS = {".cache", ".git"}
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _model_files(model_dir):
+    for root, dirs, files in os.walk(model_dir):
+        dirs[:] = [d for d in dirs if d not in IGNORED_DIRS]
+        for name in files:
+            if name != MANIFEST_NAME:
+                path = os.path.join(root, name)
+                yield os.path.relpath(path, model_dir).replace(os.sep, "/"), path
+
+def _fallback_manifest_path(model_dir):
+    # 模型目录只读（共享挂载）时把清单放到插件的 cache 目录
+    digest = hashlib.sha1(os.path.abspath(model_dir).encode("utf-8")).hexdigest()
+    return os.path.join(CACHE_DIR, "model_manifests", f"{digest}.json")
+
+def save_manifest(model_dir, manifest):
+    for path in (os.path.join(model_dir, MANIFEST_NAME), _fallback_manifest_path(model_dir)):
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(manifest, f, indent=2, sort_keys=True)
+            return True
+        except OSError as e:
+            print(f"[ModelResolver] could not write manifest {path}: {e}")
+    return False
+
+def build_manifest(model_dir, repo_id=None):
+    """记录目录下所有模型文件的大小，写入清单文件；sha256 在 hash 模式首次校验时才计算"""
+    files = {rel: {"size": os.path.getsize(path)} for rel, path in _model_files(model_dir)}
+    manifest = {"repo_id": repo_id, "created_at": time.time(), "files": files}
+    save_manifest(model_dir, manifest)
+    return manifest
+
+def load_manifest(model_dir):
+    for path in (os.path.join(model_dir, MANIFEST_NAME), _fallback_manifest_path(model_dir)):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            continue
+    return None
+
+def verify_manifest(model_dir, manifest, mode="size"):
+    """按清单校验本地文件，返回不一致的文件列表；mode 为 none、size 或 hash，hash 模式下缺少的 sha256 在首次校验时补记"""
+    if mode == "none":
+        return []
+    problems = []
+    for rel, info in manifest.get("files", {}).items():
+        path = os.path.join(model_dir, rel)
+        if not os.path.isfile(path) or os.path.getsize(path) != info["size"]:
+            problems.append(rel)
+        elif mode == "hash":
+            digest = _file_sha256(path)
+            if info.setdefault("sha256", digest) != digest:
+                problems.append(rel)
+    return problems
+
+def _non_empty_dir(path):
+    return os.path.isdir(path) and any(os.scandir(path))
+
+def _interrupted_download(model_dir):
+    """huggingface_hub 下载中断时会在 .cache/huggingface/download 下留下 .incomplete 文件"""
+    for root, _, files in os.walk(os.path.join(model_dir, ".cache", "huggingface", "download")):
+        if any(name.endswith(".incomplete") for name in files):
+            return True
+    return False
+
+def _downloads_allowed():
+    offline = os.environ.get("HF_HUB_OFFLINE", "").lower() in ("1", "true", "yes")
+    return not offline and load_setting("MODEL_RESOLVER", "download_missing", True, bool)
+
+class ModelResolver:
+    """离线优先的本地模型定位：先查本地目录和文件清单，只有显式更新（或缺失且允许下载）时才访问网络"""
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                instance = super(ModelResolver, cls).__new__(cls)
+                instance._lock = threading.RLock()
+                instance._resolved = {}
+                cls._instance = instance
+        return cls._instance
+
+    def resolve(self, name, candidates, repo_id=None, update=False):
+        """返回模型目录；candidates 为候选目录，需要下载时下载到第一个候选目录"""
+        candidates = [str(path) for path in candidates]
+        with self._lock:
+            path = self._resolved.get(name)
+            if path and not update and os.path.isdir(path):
+                return path
+
+            path = None if update else self._find_local(name, candidates, repo_id)
+            if path is None:
+                path = self._download(name, candidates[0], repo_id, update)
+            self._resolved[name] = path
+            return path
+
+    def _find_local(self, name, candidates, repo_id):
+        mode = load_setting("MODEL_RESOLVER", "verify", "size").strip().lower()
+        for path in candidates:
+            if not _non_empty_dir(path):
+                continue
+            manifest = load_manifest(path)
+            if manifest is None:
+                # 第一次使用已有的本地模型时按本地文件生成清单，之后按清单校验；有中断的下载时不使用
+                if _interrupted_download(path):
+                    print(f"[ModelResolver] {name}: {path} has an interrupted download")
+                    continue
+                build_manifest(path, repo_id)
+                return path
+            unhashed = mode == "hash" and any("sha256" not in info for info in manifest.get("files", {}).values())
+            problems = verify_manifest(path, manifest, mode)
+            if not problems:
+                if unhashed:
+                    save_manifest(path, manifest)
+                return path
+            print(f"[ModelResolver] {name}: {len(problems)} file(s) in {path} do not match the manifest: {', '.join(problems[:5])}")
+        return None
+
+    def _download(self, name, local_dir, repo_id, update):
+        if not repo_id:
+            raise RuntimeError(f"Could not find the {name} model. Please ensure it's placed in one of the expected directories "
+                               f"(delete {MANIFEST_NAME} there after replacing model files).")
+        if not update and not _downloads_allowed():
+            raise RuntimeError(f"{name} is missing or incomplete in {local_dir} and downloads are disabled. "
+                               f"Copy the model there or run the node once with update_model enabled.")
+        from huggingface_hub import snapshot_download
+        print(f"[ModelResolver] downloading {repo_id} to {local_dir}")
+        os.makedirs(local_dir, exist_ok=True)
+        path = snapshot_download(repo_id, local_dir=local_dir, force_download=False, local_files_only=False)
+        build_manifest(path, repo_id)
+        return path
+
+    def forget(self, name=None):
+        with self._lock:
+            if name is None:
+                self._resolved.clear()
+            else:
+                self._resolved.pop(name, None)
+
+def get_model_resolver():
+    return ModelResolver()
+
+def resolve_model(name, candidates, repo_id=None, update=False):
+    return get_model_resolver().resolve(name, candidates, repo_id, update)
@@ -0,0 +1,100 @@
+import bisect
+import threading
+
+# 固定的对数分桶上界（秒），每次记录只做一次二分查找，内存占用与执行次数无关
+BUCKET_BOUNDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+QUANTILES = (0.5, 0.95, 0.99)
+METRIC_NAME = "dw_node_execution_seconds"
+
+class LatencyHistogram:
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)  # 最后一个是 +Inf 桶
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        self.counts[bisect.bisect_left(BUCKET_BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q):
+        """按分桶线性插值估算分位数，结果不超过实际最大值"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = BUCKET_BOUNDS[i - 1] if i > 0 else 0.0
+                upper = BUCKET_BOUNDS[i] if i < len(BUCKET_BOUNDS) else self.max
+                estimate = lower + (upper - lower) * (rank - seen) / bucket_count
+                return min(estimate, self.max)
+            seen += bucket_count
+        return self.max
+
+class NodeLatencyStats:
+    """按节点 class_type 聚合的执行耗时直方图"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    def record(self, class_type, seconds):
+        with self._lock:
+            histogram = self._histograms.get(class_type)
+            if histogram is None:
+                histogram = self._histograms[class_type] = LatencyHistogram()
+            histogram.record(seconds)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return {class_type: {
+                "count": h.count,
+                "sum": h.total,
+                "max": h.max,
+                **{f"p{int(q * 100)}": h.quantile(q) for q in QUANTILES},
+            } for class_type, h in self._histograms.items()}
+
+    def render_text(self):
+        """以 Prometheus 文本格式输出，便于抓取"""
+        with self._lock:
+            items = sorted(self._histograms.items())
+            lines = [
+                f"# HELP {METRIC_NAME} Node execution time by class_type.",
+                f"# TYPE {METRIC_NAME} histogram",
+            ]
+            for class_type, h in items:
+                label = _escape(class_type)
+                cumulative = 0
+                for bound, bucket_count in zip((*BUCKET_BOUNDS, "+Inf"), h.counts):
+                    cumulative += bucket_count
+                    lines.append(f'{METRIC_NAME}_bucket{{class_type="{label}",le="{bound}"}} {cumulative}')
+                lines.append(f'{METRIC_NAME}_sum{{class_type="{label}"}} {h.total:.6f}')
+                lines.append(f'{METRIC_NAME}_count{{class_type="{label}"}} {h.count}')
+
+            lines.append(f"# HELP {METRIC_NAME}_quantile Estimated node execution time quantiles by class_type.")
+            lines.append(f"# TYPE {METRIC_NAME}_quantile gauge")
+            for class_type, h in items:
+                label = _escape(class_type)
+                for q in QUANTILES:
+                    lines.append(f'{METRIC_NAME}_quantile{{class_type="{label}",quantile="{q}"}} {h.quantile(q):.6f}')
+
+            lines.append(f"# HELP {METRIC_NAME}_max Slowest node execution by class_type.")
+            lines.append(f"# TYPE {METRIC_NAME}_max gauge")
+            for class_type, h in items:
+                lines.append(f'{METRIC_NAME}_max{{class_type="{_escape(class_type)}"}} {h.max:.6f}')
+        return "\n".join(lines) + "\n"
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+NODE_LATENCY = NodeLatencyStats()
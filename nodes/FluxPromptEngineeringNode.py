@@ -1,15 +1,20 @@
 import os
+import sys
 import torch
 from transformers import pipeline, AutoTokenizer, AutoModelForSeq2SeqLM
 from typing import Dict, Any, Tuple
 import folder_paths
-import gc
+
+# 添加父目录到 Python 路径
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+from model_residency import get_residency_manager
+from model_resolver import resolve_model
 
 class FluxPromptEngineeringNode:
     def __init__(self):
-        self.model = None
-        self.tokenizer = None
-        self.enhancer = None
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
         self.model_name = "gokaygokay/Flux-Prompt-Enhance"
         self.model_path = self.get_model_path()
@@ -29,57 +34,49 @@ class FluxPromptEngineeringNode:
     CATEGORY = "🌙DW/提示词工程"
 
     def enhance_prompt(self, input_prompt: str, max_length: int = 256) -> Tuple[str]:
-        if self.enhancer is None:
-            self.load_model()
-
         enhanced_input = f"enhance prompt: {input_prompt}"
         try:
-            answer = self.enhancer(enhanced_input, max_length=max_length)
+            # 模型由常驻管理器保持加载，跨执行复用
+            with get_residency_manager().use(self.residency_key, self.load_model, "cpu") as enhancer:
+                answer = enhancer(enhanced_input, max_length=max_length)
             final_answer = answer[0]['generated_text']
             return (final_answer,)
         except Exception as e:
             print(f"提示词增强失败: {str(e)}")
             return (f"【增强失败】{input_prompt}",)
 
+    @property
+    def residency_key(self):
+        return (self.model_path, "cpu")
+
     def load_model(self):
         if self.model_path is None or not os.path.exists(self.model_path):
             raise RuntimeError(f"Model path is invalid or does not exist: {self.model_path}")
 
         try:
             print(f"Loading model from {self.model_path}")
-            self.tokenizer = AutoTokenizer.from_pretrained(self.model_path)
-            self.model = AutoModelForSeq2SeqLM.from_pretrained(self.model_path)
-            self.enhancer = pipeline('text2text-generation',
-                                     model=self.model,
-                                     tokenizer=self.tokenizer,
-                                     repetition_penalty=1.2)
+            tokenizer = AutoTokenizer.from_pretrained(self.model_path)
+            model = AutoModelForSeq2SeqLM.from_pretrained(self.model_path)
+            enhancer = pipeline('text2text-generation',
+                                model=model,
+                                tokenizer=tokenizer,
+                                repetition_penalty=1.2)
             print("Model loaded successfully")
+            return enhancer
         except Exception as e:
             print(f"Error loading model: {e}")
             raise RuntimeError(f"Failed to load the model from {self.model_path}. Error: {str(e)}")
 
     def get_model_path(self):
-        possible_paths = [
+        # 解析结果在进程内缓存，之后只按清单校验本地文件
+        return resolve_model("Flux-Prompt-Enhance", [
             os.path.join(folder_paths.models_dir, "prompt_generator", "Flux-Prompt-Enhance"),
             "models/prompt_generator/Flux-Prompt-Enhance",
             "Flux-Prompt-Enhance",
-        ]
-        
-        for path in possible_paths:
-            if os.path.exists(path) and any(os.scandir(path)):
-                return path
-        
-        raise RuntimeError("Could not find the Flux-Prompt-Enhance model. Please ensure it's placed in one of the expected directories.")
+        ])
 
     def unload_model(self):
-        del self.model
-        del self.tokenizer
-        del self.enhancer
-        self.model = None
-        self.tokenizer = None
-        self.enhancer = None
-        torch.cuda.empty_cache()
-        gc.collect()
+        get_residency_manager().unload(self.residency_key)
 
 NODE_CLASS_MAPPINGS = {
     "FluxPromptEngineeringNode": FluxPromptEngineeringNode
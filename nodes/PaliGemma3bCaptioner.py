@@ -1,14 +1,22 @@
 import os
+import sys
 from pathlib import Path
 import torch
 from PIL import Image
 from torchvision.transforms import ToPILImage
 from transformers import AutoProcessor, PaliGemmaForConditionalGeneration, BitsAndBytesConfig
 import folder_paths
-from huggingface_hub import snapshot_download
-import gc
 import random
 
+# 添加父目录到 Python 路径
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+from model_residency import get_residency_manager
+from caption_cache import get_caption_cache
+from model_resolver import resolve_model
+
 # 定义模型文件存储目录
 files_for_paligemma_3b_pt_224 = Path(os.path.join(folder_paths.models_dir, "PaliGemmaCheckpoints", "files_for_paligemma_3b_pt_224"))
 files_for_paligemma_3b_pt_224.mkdir(parents=True, exist_ok=True)
@@ -17,41 +25,32 @@ class PaliGemma3bCaptioner:
     def __init__(self):
         self.model_id = "google/paligemma-3b-pt-224"
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        self.model = None
-        self.processor = None
+
+    def residency_key(self, quantization):
+        return (self.model_id, self.device, quantization)
 
     def load_model(self, quantization):
-        if self.model is None or self.processor is None:
-            self.model_path = snapshot_download(self.model_id, 
-                                                local_dir=files_for_paligemma_3b_pt_224,
-                                                force_download=False,
-                                                local_files_only=False,
-                                                local_dir_use_symlinks="auto")
-            
-            if quantization == "8-bit":
-                quantization_config = BitsAndBytesConfig(load_in_8bit=True)
-            elif quantization == "4-bit":
-                quantization_config = BitsAndBytesConfig(load_in_4bit=True)
-            else:
-                quantization_config = None
-            
-            self.model = PaliGemmaForConditionalGeneration.from_pretrained(
-                self.model_path,
-                quantization_config=quantization_config,
-                device_map=self.device
-            ).eval()
-            self.processor = AutoProcessor.from_pretrained(self.model_path)
-
-    def clear_memory(self):
-        if self.model is not None:
-            del self.model
-            self.model = None
-        if self.processor is not None:
-            del self.processor
-            self.processor = None
-        gc.collect()
-        if torch.cuda.is_available():
-            torch.cuda.empty_cache()
+        # 离线优先：本地文件与清单一致时不访问网络
+        self.model_path = resolve_model(self.model_id, [files_for_paligemma_3b_pt_224], repo_id=self.model_id)
+        
+        if quantization == "8-bit":
+            quantization_config = BitsAndBytesConfig(load_in_8bit=True)
+        elif quantization == "4-bit":
+            quantization_config = BitsAndBytesConfig(load_in_4bit=True)
+        else:
+            quantization_config = None
+        
+        model = PaliGemmaForConditionalGeneration.from_pretrained(
+            self.model_path,
+            quantization_config=quantization_config,
+            device_map=self.device
+        ).eval()
+        processor = AutoProcessor.from_pretrained(self.model_path)
+        processor.tokenizer.padding_side = "left"
+        return model, processor
+
+    def clear_memory(self, quantization):
+        get_residency_manager().unload(self.residency_key(quantization))
 
     @classmethod
     def INPUT_TYPES(cls):
@@ -68,36 +67,39 @@ class PaliGemma3bCaptioner:
                 "control_after_generate": (["fixed", "increment", "decrement", "randomize"], {"default": "fixed"}),
             },
             "optional": {
-                "keep_alive": ("BOOLEAN", {"default": False}),
+                "keep_alive": ("BOOLEAN", {"default": True, "tooltip": "保持模型常驻，由常驻管理器按内存预算和空闲超时卸载；关闭后每次执行完立即卸载"}),
+                "batch_size": ("INT", {"default": 4, "min": 1, "max": 64}),
+                "use_cache": ("BOOLEAN", {"default": False, "tooltip": "采样生成，开启后相同图片、参数和 seed 直接复用缓存的描述"}),
+                "update_model": ("BOOLEAN", {"default": False}),
             }
         }
 
     RETURN_TYPES = ("STRING", "INT")
     RETURN_NAMES = ("caption", "seed")
+    OUTPUT_IS_LIST = (True, False)
     FUNCTION = "generate_caption"
     CATEGORY = "🌙DW/ImageToText"
 
-    def generate_caption(self, image, prompt, task_prefix, language, max_tokens, seed, top_k, quantization, control_after_generate, keep_alive=False):
-        self.load_model(quantization)  # 确保模型已加载
-        
+    def generate_caption(self, image, prompt, task_prefix, language, max_tokens, seed, top_k, quantization, control_after_generate, keep_alive=True, batch_size=4, use_cache=False, update_model=False):
+        if update_model:
+            # 显式更新：重新从 Hugging Face 同步模型，并卸载旧模型以便下次加载新文件
+            resolve_model(self.model_id, [files_for_paligemma_3b_pt_224], repo_id=self.model_id, update=True)
+            self.clear_memory(quantization)
+
         torch.manual_seed(seed)
         
-        pil_image = ToPILImage()(image[0].permute(2, 0, 1))
-        
         full_prompt = f"{task_prefix} {language}: {prompt}"
-        model_inputs = self.processor(text=full_prompt, images=pil_image, return_tensors="pt").to(self.device)
-        
-        with torch.inference_mode():
-            generation = self.model.generate(
-                **model_inputs,
-                max_new_tokens=max_tokens,
-                do_sample=True,
-                top_k=top_k,
-                num_return_sequences=1
+
+        # 逐帧查描述缓存，只对未命中的帧运行模型；采样参数和 seed 都计入缓存键
+        cache = get_caption_cache() if use_cache else None
+        if cache:
+            captions = cache.cached_frames(
+                image, self.model_id, full_prompt,
+                lambda indices: self.caption_frames(image[indices], full_prompt, max_tokens, top_k, quantization, batch_size),
+                max_new_tokens=max_tokens, top_k=top_k, seed=seed, quantization=quantization,
             )
-        
-        decoded = self.processor.decode(generation[0], skip_special_tokens=True)
-        decoded = decoded.replace(full_prompt, "", 1).strip()
+        else:
+            captions = self.caption_frames(image, full_prompt, max_tokens, top_k, quantization, batch_size)
         
         # 根据control_after_generate参数调整seed值
         if control_after_generate == "increment":
@@ -109,9 +111,41 @@ class PaliGemma3bCaptioner:
         # "fixed"选项不需要改变seed值
         
         if not keep_alive:
-            self.clear_memory()
+            self.clear_memory(quantization)
         
-        return (decoded, seed)
+        return (captions, seed)
+
+    def caption_frames(self, image, full_prompt, max_tokens, top_k, quantization, batch_size):
+        pil_images = [ToPILImage()(frame.permute(2, 0, 1)) for frame in image]
+        captions = []
+
+        # 模型由常驻管理器保持加载，跨执行复用
+        loader = lambda: self.load_model(quantization)
+        with get_residency_manager().use(self.residency_key(quantization), loader, self.device) as (model, processor):
+            # 按 batch_size 分批生成，每批一次 generate 调用
+            for start in range(0, len(pil_images), batch_size):
+                batch_images = pil_images[start:start + batch_size]
+                model_inputs = processor(
+                    text=[full_prompt] * len(batch_images),
+                    images=batch_images,
+                    return_tensors="pt",
+                    padding=True,
+                ).to(self.device)
+                input_len = model_inputs["input_ids"].shape[-1]
+
+                with torch.inference_mode():
+                    generation = model.generate(
+                        **model_inputs,
+                        max_new_tokens=max_tokens,
+                        do_sample=True,
+                        top_k=top_k,
+                        num_return_sequences=1
+                    )
+
+                # 只解码新生成的部分，去掉开头的提示词
+                decoded = processor.batch_decode(generation[:, input_len:], skip_special_tokens=True)
+                captions.extend(text.strip() for text in decoded)
+        return captions
 
 NODE_CLASS_MAPPINGS = {
     "PaliGemma3bCaptioner": PaliGemma3bCaptioner
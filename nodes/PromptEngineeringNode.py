@@ -1,19 +1,26 @@
 import requests
 import json
 import os
-import asyncio
-import aiohttp
+import sys
 import logging
 import re
 from typing import Tuple, Dict, Any
 
+# 添加父目录到 Python 路径
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+from api_clients import default_ollama_host
+from async_runtime import get_async_runtime
+
 class PromptEngineeringNode:
     def __init__(self):
         self.model_name = None
         self.base_url = None
         self.api_key = None
         self.is_local = False
-        self.ollama_url = os.getenv("OLLAMA_HOST", "http://localhost:11434/api/generate")
+        self.ollama_url = f"{default_ollama_host()}/api/generate"
         logging.basicConfig(level=logging.INFO)
         self.logger = logging.getLogger(__name__)
 
@@ -45,8 +52,9 @@ class PromptEngineeringNode:
     def generate_prompt_sync(self, input_text: str, prompt_type: str, model_name: str, base_url: str, api_key: str, 
                              language: str, output_format: str, is_local: bool = True, temperature: float = 0.7, 
                              max_tokens: int = 2000) -> Tuple[str, str, str]:
-        return asyncio.run(self.generate_prompt(input_text, prompt_type, model_name, base_url, api_key, 
-                                                language, output_format, is_local, temperature, max_tokens))
+        # 提交到常驻事件循环，避免每次执行都创建、销毁事件循环和会话
+        return get_async_runtime().run(self.generate_prompt(input_text, prompt_type, model_name, base_url, api_key, 
+                                                            language, output_format, is_local, temperature, max_tokens))
 
     async def generate_prompt(self, input_text: str, prompt_type: str, model_name: str, base_url: str, api_key: str, 
                               language: str, output_format: str, is_local: bool = True, temperature: float = 0.7, 
@@ -172,13 +180,13 @@ class PromptEngineeringNode:
             "max_tokens": max_tokens
         }
         
-        async with aiohttp.ClientSession() as session:
-            async with session.post(self.ollama_url, json=data) as response:
-                if response.status == 200:
-                    result = await response.json()
-                    return result['response']
-                else:
-                    raise Exception(f"Ollama 调用失败,状态码 {response.status}")
+        session = await get_async_runtime().session(default_ollama_host())
+        async with session.post(self.ollama_url, json=data) as response:
+            if response.status == 200:
+                result = await response.json()
+                return result['response']
+            else:
+                raise Exception(f"Ollama 调用失败,状态码 {response.status}")
 
     async def api_inference(self, system_prompt: str, user_prompt: str, temperature: float, max_tokens: int) -> str:
         headers = {
@@ -196,13 +204,13 @@ class PromptEngineeringNode:
             "max_tokens": max_tokens
         }
         
-        async with aiohttp.ClientSession() as session:
-            async with session.post(f"{self.base_url}/chat/completions", headers=headers, json=data) as response:
-                if response.status == 200:
-                    result = await response.json()
-                    return result['choices'][0]['message']['content']
-                else:
-                    raise Exception(f"API 调用失败,状态码 {response.status}")
+        session = await get_async_runtime().session(self.base_url)
+        async with session.post(f"{self.base_url}/chat/completions", headers=headers, json=data) as response:
+            if response.status == 200:
+                result = await response.json()
+                return result['choices'][0]['message']['content']
+            else:
+                raise Exception(f"API 调用失败,状态码 {response.status}")
 
     def format_output(self, text: str, output_format: str) -> str:
         if output_format == "纯文本":
@@ -1,76 +1,63 @@
 import os
 import sys
 import torch
-from PIL import Image
-from io import BytesIO
-import base64
-from contextlib import contextmanager
-from tenacity import retry, stop_after_attempt, wait_exponential
-from http import HTTPStatus
-import dashscope
+import httpx
 
 # 添加父目录到 Python 路径
 parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if parent_dir not in sys.path:
     sys.path.append(parent_dir)
 
-from ..api_utils import load_api_key
-
-@contextmanager
-def temporary_env_var(key: str, new_value):
-    old_value = os.environ.get(key)
-    os.environ[key] = new_value if new_value is not None else os.environ.pop(key, None)
-    try:
-        yield
-    finally:
-        if old_value is not None:
-            os.environ[key] = old_value
-        elif key in os.environ:
-            del os.environ[key]
+from api_clients import get_registry
+from rate_limit import estimate_request_tokens, rate_limited
+from image_payload import encode_images, upload_settings
+from caption_cache import get_caption_cache
 
 class QwenVLBase:
     def __init__(self):
-        self.api_key = load_api_key('DASHSCOPE_API_KEY')
-        if self.api_key:
-            dashscope.api_key = self.api_key
-        else:
+        # 直接调用 DashScope REST 接口，代理设置由注册表按客户端配置（默认直连）
+        self.client = get_registry().http_client('dashscope')
+        if not self.client:
             print("错误：在 api_key.ini 中未找到 DASHSCOPE_API_KEY")
 
-    @staticmethod
-    def tensor_to_image(tensor):
-        return Image.fromarray(tensor.squeeze().mul(255).clamp(0, 255).byte().cpu().numpy(), mode='RGB')
-
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
+    @rate_limited("dashscope", tokens=lambda self, prompt, image, model, task, temperature=0.7, max_tokens=1024: estimate_request_tokens(prompt=prompt, max_tokens=max_tokens))
     def call_api(self, prompt, image, model, task, temperature=0.7, max_tokens=1024):
-        buffered = BytesIO()
-        image.save(buffered, format="PNG")
-        img_str = base64.b64encode(buffered.getvalue()).decode()
-
         messages = [
             {
                 "role": "system",
-                "content": f"You are an AI assistant specialized in {task}. Analyze the image and respond accordingly."
+                "content": [{"text": f"You are an AI assistant specialized in {task}. Analyze the image and respond accordingly."}]
             },
             {
                 "role": "user",
                 "content": [
-                    {"image": img_str},
+                    {"image": image.data_uri},
                     {"text": prompt}
                 ]
             }
         ]
 
-        response = dashscope.MultiModalConversation.call(
-            model=model,
-            messages=messages,
-            temperature=temperature,
-            max_tokens=max_tokens
-        )
+        data = {
+            "model": model,
+            "input": {"messages": messages},
+            "parameters": {"temperature": temperature, "max_tokens": max_tokens},
+        }
+        response = self.client.post("/api/v1/services/aigc/multimodal-generation/generation", json=data)
+        if response.is_error:
+            # 错误响应的 code/message 更有参考价值，状态码仍由 HTTPStatusError 携带以便判断是否重试
+            try:
+                error = response.json()
+            except ValueError:
+                error = {}
+            message = f"API调用失败: {error.get('code', response.status_code)} - {error.get('message', response.text)}"
+            raise httpx.HTTPStatusError(message, request=response.request, response=response)
 
-        if response.status_code == HTTPStatus.OK:
-            return response.output.text
-        else:
-            raise Exception(f"API调用失败: {response.code} - {response.message}")
+        output = response.json()["output"]
+        if "choices" in output:
+            content = output["choices"][0]["message"]["content"]
+            if isinstance(content, list):
+                return "".join(part.get("text", "") for part in content)
+            return content
+        return output.get("text", "")
 
 class Qwen2VLCaption(QwenVLBase):
     @classmethod
@@ -83,6 +70,9 @@ class Qwen2VLCaption(QwenVLBase):
                 "task": (["general", "ocr", "visual_reasoning", "chinese_understanding", "prompt_generation"], {"default": "general"}),
                 "temperature": ("FLOAT", {"default": 0.7, "min": 0.0, "max": 1.0, "step": 0.1}),
                 "max_tokens": ("INT", {"default": 1024, "min": 1, "max": 2048}),
+            },
+            "optional": {
+                "use_cache": ("BOOLEAN", {"default": False}),
             }
         }
 
@@ -91,13 +81,11 @@ class Qwen2VLCaption(QwenVLBase):
     FUNCTION = "process_image"
     CATEGORY = "🌙DW/Qwen2VL"
 
-    def process_image(self, image, prompt, model, task, temperature, max_tokens):
-        if not self.api_key:
+    def process_image(self, image, prompt, model, task, temperature, max_tokens, use_cache=False):
+        if not self.client:
             return ("错误：DASHSCOPE_API_KEY 未设置或无效。请检查您的 api_key.ini 文件。",)
 
         try:
-            pil_image = self.tensor_to_image(image)
-            
             task_prompts = {
                 "general": "分析这张图片并提供详细描述。",
                 "ocr": "识别并提取图片中的所有文字。",
@@ -108,8 +96,16 @@ class Qwen2VLCaption(QwenVLBase):
             
             full_prompt = f"{task_prompts[task]} {prompt}"
             
-            with temporary_env_var('HTTP_PROXY', None), temporary_env_var('HTTPS_PROXY', None):
-                result = self.call_api(full_prompt, pil_image, model, task, temperature=temperature, max_tokens=max_tokens)
+            def request():
+                return self.call_api(full_prompt, encode_images(image)[0], model, task, temperature=temperature, max_tokens=max_tokens)
+
+            # 按原始图片内容缓存，命中时不再编码和上传图片
+            cache = get_caption_cache() if use_cache else None
+            if cache:
+                result = cache.cached(image, f"dashscope:{model}", full_prompt, request, task=task, temperature=temperature,
+                                      max_tokens=max_tokens, upload=upload_settings())
+            else:
+                result = request()
             
             return (result,)
         except Exception as e:
@@ -1,4 +1,5 @@
 import os
+import sys
 import torch
 import numpy as np
 from PIL import Image
@@ -8,10 +9,17 @@ import gc
 from qwen_vl_utils import process_vision_info
 import cv2
 
+# 添加父目录到 Python 路径
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+from model_residency import get_residency_manager
+from caption_cache import get_caption_cache
+from model_resolver import resolve_model
+
 class Qwen2VLLocalCaption:
     def __init__(self):
-        self.model = None
-        self.processor = None
         self.device = None
         self.precision = None
         print(f"ComfyUI models directory: {folder_paths.models_dir}")
@@ -29,6 +37,9 @@ class Qwen2VLLocalCaption:
                 "max_tokens": ("INT", {"default": 1024, "min": 1, "max": 2048}),
                 "device": (["cuda", "cpu"], {"default": "cuda"}),
                 "precision": (["float32", "float16"], {"default": "float16"}),
+            },
+            "optional": {
+                "use_cache": ("BOOLEAN", {"default": False}),
             }
         }
 
@@ -37,12 +48,12 @@ class Qwen2VLLocalCaption:
     FUNCTION = "process_image"
     CATEGORY = "🌙DW/Qwen2VL"
 
-    def process_image(self, image, prompt, task, temperature, max_tokens, device, precision):
+    def process_image(self, image, prompt, task, temperature, max_tokens, device, precision, use_cache=False):
         try:
-            if self.model is None or self.device != device or self.precision != precision:
-                self.device = device
-                self.precision = precision
-                self.load_model()
+            self.device = device
+            self.precision = precision
+            # 缓存键使用原始输入张量，设备和精度不影响描述内容，不计入键
+            source_image = image
 
             print(f"Input image type: {type(image)}")
             if isinstance(image, torch.Tensor):
@@ -93,20 +104,30 @@ class Qwen2VLLocalCaption:
                 }
             ]
 
-            text = self.processor.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
-            image_inputs, _ = process_vision_info(messages)
-            inputs = self.processor(text=[text], images=image_inputs, return_tensors="pt").to(self.device)
+            def generate():
+                # 模型由常驻管理器保持加载，跨执行复用
+                with get_residency_manager().use(self.residency_key, self.load_model, self.device) as (model, processor):
+                    text = processor.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+                    image_inputs, _ = process_vision_info(messages)
+                    inputs = processor(text=[text], images=image_inputs, return_tensors="pt").to(self.device)
 
-            with torch.no_grad():
-                generated_ids = self.model.generate(**inputs, max_new_tokens=max_tokens, temperature=temperature, do_sample=True)
-            generated_text = self.processor.batch_decode(generated_ids, skip_special_tokens=True)[0]
-            
-            # 提取助手的回答
-            assistant_response = generated_text.split('assistant\n')[-1].strip()
-            
-            del inputs, generated_ids
-            torch.cuda.empty_cache() if self.device == "cuda" else None
-            gc.collect()
+                    with torch.no_grad():
+                        generated_ids = model.generate(**inputs, max_new_tokens=max_tokens, temperature=temperature, do_sample=True)
+                    generated_text = processor.batch_decode(generated_ids, skip_special_tokens=True)[0]
+
+                del inputs, generated_ids
+                torch.cuda.empty_cache() if self.device == "cuda" else None
+                gc.collect()
+
+                # 提取助手的回答
+                return generated_text.split('assistant\n')[-1].strip()
+
+            cache = get_caption_cache() if use_cache and isinstance(source_image, torch.Tensor) else None
+            if cache:
+                assistant_response = cache.cached(source_image, os.path.basename(self.model_path), full_prompt, generate,
+                                                  temperature=temperature, max_tokens=max_tokens)
+            else:
+                assistant_response = generate()
             
             return (assistant_response,)
         except Exception as e:
@@ -115,14 +136,18 @@ class Qwen2VLLocalCaption:
             print(error_msg)
             return (error_msg,)
 
+    @property
+    def residency_key(self):
+        return (self.model_path, self.device, self.precision)
+
     def load_model(self):
         if self.model_path is None or not os.path.exists(self.model_path):
             raise RuntimeError(f"Model path is invalid or does not exist: {self.model_path}")
 
         try:
             print(f"Loading model from {self.model_path}")
-            self.processor = AutoProcessor.from_pretrained(self.model_path, trust_remote_code=True)
-            self.model = Qwen2VLForConditionalGeneration.from_pretrained(
+            processor = AutoProcessor.from_pretrained(self.model_path, trust_remote_code=True)
+            model = Qwen2VLForConditionalGeneration.from_pretrained(
                 self.model_path,
                 trust_remote_code=True,
                 device_map=self.device,
@@ -130,32 +155,23 @@ class Qwen2VLLocalCaption:
             )
             print("Model loaded successfully")
             
-            self.model.to(self.device)
+            model.to(self.device)
+            return model, processor
             
         except Exception as e:
             print(f"Error loading model: {e}")
             raise RuntimeError(f"Failed to load the model from {self.model_path}. Error: {str(e)}")
 
     def get_model_path(self):
-        possible_paths = [
+        # 解析结果在进程内缓存，之后只按清单校验本地文件
+        return resolve_model("Qwen2-VL-2B-Instruct", [
             os.path.join(folder_paths.models_dir, "prompt_generator", "Qwen2-VL-2B-Instruct"),
             "models/prompt_generator/Qwen2-VL-2B-Instruct",
             "Qwen2-VL-2B-Instruct",
-        ]
-        
-        for path in possible_paths:
-            if os.path.exists(path) and any(os.scandir(path)):
-                return path
-        
-        raise RuntimeError("Could not find the Qwen2-VL model. Please ensure it's placed in one of the expected directories.")
+        ])
 
     def unload_model(self):
-        del self.model
-        del self.processor
-        self.model = None
-        self.processor = None
-        torch.cuda.empty_cache() if self.device == "cuda" else None
-        gc.collect()
+        get_residency_manager().unload(self.residency_key)
 
 NODE_CLASS_MAPPINGS = {
     "Qwen2VLLocalCaption": Qwen2VLLocalCaption
@@ -1,12 +1,20 @@
 import os
+import sys
 from pathlib import Path
 import torch
 from PIL import Image
 from torchvision.transforms import ToPILImage
 from transformers import AutoProcessor, AutoModelForVision2Seq
 import folder_paths
-from huggingface_hub import snapshot_download
-import gc
+
+# 添加父目录到 Python 路径
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+from model_residency import get_residency_manager
+from caption_cache import get_caption_cache
+from model_resolver import resolve_model
 
 # 定义模型文件存储目录
 files_for_sd3_long_captioner_v2 = Path(os.path.join(folder_paths.models_dir, "LLavacheckpoints", "files_for_sd3_long_captioner_v2"))
@@ -16,30 +24,22 @@ class SD3LongCaptionerV2:
     def __init__(self):
         self.model_id = "gokaygokay/sd3-long-captioner-v2"
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        self.model = None
-        self.processor = None
+
+    @property
+    def residency_key(self):
+        return (self.model_id, self.device)
 
     def load_model(self):
-        if self.model is None or self.processor is None:
-            self.model_path = snapshot_download(self.model_id, 
-                                                local_dir=files_for_sd3_long_captioner_v2,
-                                                force_download=False,
-                                                local_files_only=False,
-                                                local_dir_use_symlinks="auto")
-            self.model = AutoModelForVision2Seq.from_pretrained(self.model_path).to(self.device).eval()
-            self.processor = AutoProcessor.from_pretrained(self.model_path)
+        # 离线优先：本地文件与清单一致时不访问网络
+        self.model_path = resolve_model(self.model_id, [files_for_sd3_long_captioner_v2], repo_id=self.model_id)
+        model = AutoModelForVision2Seq.from_pretrained(self.model_path).to(self.device).eval()
+        processor = AutoProcessor.from_pretrained(self.model_path)
+        processor.tokenizer.padding_side = "left"
+        return model, processor
 
     def clear_memory(self):
         # 清理内存
-        if self.model is not None:
-            del self.model
-            self.model = None
-        if self.processor is not None:
-            del self.processor
-            self.processor = None
-        gc.collect()
-        if torch.cuda.is_available():
-            torch.cuda.empty_cache()
+        get_residency_manager().unload(self.residency_key)
 
     @classmethod
     def INPUT_TYPES(cls):
@@ -48,41 +48,64 @@ class SD3LongCaptionerV2:
                 "image": ("IMAGE",),
                 "prompt": ("STRING", {"multiline": False, "default": "Describe in detail what's in this image."}),
             },
+            "optional": {
+                "batch_size": ("INT", {"default": 4, "min": 1, "max": 64}),
+                "use_cache": ("BOOLEAN", {"default": True, "tooltip": "贪心解码，同一图片和参数的结果固定，默认复用缓存的描述"}),
+                "update_model": ("BOOLEAN", {"default": False}),
+            }
         }
 
     RETURN_TYPES = ("STRING",)
     RETURN_NAMES = ("caption",)
+    OUTPUT_IS_LIST = (True,)
     FUNCTION = "generate_caption"
     CATEGORY = "🌙DW/ImageToText"
 
-    def generate_caption(self, image, prompt):
-        self.load_model()  # 确保模型已加载
-        
-        # 将图像张量转换为PIL图像
-        pil_image = ToPILImage()(image[0].permute(2, 0, 1))
-        
-        # 处理图像和提示
-        model_inputs = self.processor(text=prompt, images=pil_image, return_tensors="pt").to(self.device)
-        
-        # 生成描述
-        with torch.inference_mode():
-            generation = self.model.generate(
-                **model_inputs,
-                repetition_penalty=1.05,
-                max_new_tokens=512,
-                do_sample=False
-            )
-        
-        # 解码生成的文本
-        decoded = self.processor.decode(generation[0], skip_special_tokens=True)
-        
-        # 移除开头的提示词（如果存在）
-        decoded = decoded.replace(prompt, "", 1).strip()
-        
-        # 清理内存
-        self.clear_memory()
-        
-        return (decoded,)
+    def generate_caption(self, image, prompt, batch_size=4, use_cache=True, update_model=False):
+        if update_model:
+            # 显式更新：重新从 Hugging Face 同步模型，并卸载旧模型以便下次加载新文件
+            resolve_model(self.model_id, [files_for_sd3_long_captioner_v2], repo_id=self.model_id, update=True)
+            self.clear_memory()
+
+        # 逐帧查描述缓存，只对未命中的帧运行模型
+        cache = get_caption_cache() if use_cache else None
+        if cache:
+            return (cache.cached_frames(image, self.model_id, prompt, lambda indices: self.caption_frames(image[indices], prompt, batch_size),
+                                        max_new_tokens=512),)
+        return (self.caption_frames(image, prompt, batch_size),)
+
+    def caption_frames(self, image, prompt, batch_size):
+        # 将整个批次的图像张量转换为PIL图像
+        pil_images = [ToPILImage()(frame.permute(2, 0, 1)) for frame in image]
+        captions = []
+
+        # 模型由常驻管理器保持加载，跨执行复用
+        with get_residency_manager().use(self.residency_key, self.load_model, self.device) as (model, processor):
+            # 按 batch_size 分批生成，每批一次 generate 调用
+            for start in range(0, len(pil_images), batch_size):
+                batch_images = pil_images[start:start + batch_size]
+                model_inputs = processor(
+                    text=[prompt] * len(batch_images),
+                    images=batch_images,
+                    return_tensors="pt",
+                    padding=True,
+                ).to(self.device)
+                input_len = model_inputs["input_ids"].shape[-1]
+
+                # 生成描述
+                with torch.inference_mode():
+                    generation = model.generate(
+                        **model_inputs,
+                        repetition_penalty=1.05,
+                        max_new_tokens=512,
+                        do_sample=False
+                    )
+
+                # 只解码新生成的部分，去掉开头的提示词
+                decoded = processor.batch_decode(generation[:, input_len:], skip_special_tokens=True)
+                captions.extend(text.strip() for text in decoded)
+
+        return captions
 
 NODE_CLASS_MAPPINGS = {
     "SD3LongCaptionerV2": SD3LongCaptionerV2
@@ -0,0 +1,28 @@
+import os
+import sys
+
+from aiohttp import web
+from server import PromptServer
+
+# 添加父目录到 Python 路径
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+from caption_cache import get_caption_cache
+
+@PromptServer.instance.routes.get("/dw/caption_cache")
+async def caption_cache_stats_route(request):
+    cache = get_caption_cache()
+    return web.json_response(cache.stats() if cache else {"enabled": False})
+
+@PromptServer.instance.routes.post("/dw/caption_cache/clear")
+async def caption_cache_clear_route(request):
+    cache = get_caption_cache()
+    if cache:
+        cache.clear()
+    return web.json_response({"status": "ok"})
+
+# 只注册图片描述缓存的查询/清空接口，不提供节点
+NODE_CLASS_MAPPINGS = {}
+NODE_DISPLAY_NAME_MAPPINGS = {}
@@ -1,30 +1,26 @@
 import os
 import sys
-import json
-import requests
-from configparser import ConfigParser
 
 # 添加父目录到 Python 路径
 parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if parent_dir not in sys.path:
     sys.path.append(parent_dir)
 
-def load_api_key(key_name):
-    config = ConfigParser()
-    ini_path = os.path.join(parent_dir, 'api_key.ini')
-    config.read(ini_path)
-    return config.get('API_KEYS', key_name, fallback=None)
+from api_clients import get_registry
+from chat_history import ConversationHistory
+from streaming import stream_sse_lines
+from hedging import HEDGE_PROVIDERS, hedged_chat
+from rate_limit import call_with_limits, estimate_request_tokens
 
 class DeepSeekChatNode:
     def __init__(self):
-        self.api_key = None
-        self.base_url = "https://api.deepseek.com/v1"
+        self.client = None
         self.load_api_key()
-        self.conversation_history = []
+        self.conversation_history = ConversationHistory()
         
     def load_api_key(self):
-        self.api_key = load_api_key('DEEPSEEK_API_KEY')
-        if not self.api_key:
+        self.client = get_registry().http_client('deepseek')
+        if not self.client:
             print("Error: DEEPSEEK_API_KEY not found in api_key.ini")
 
     @classmethod
@@ -37,50 +33,69 @@ class DeepSeekChatNode:
             },
             "optional": {
                 "reset_conversation": ("BOOLEAN", {"default": False}),
-            }
+                "history_token_budget": ("INT", {"default": 4096, "min": 0, "max": 131072}),
+                "stream": ("BOOLEAN", {"default": False}),
+                "hedge_provider": (HEDGE_PROVIDERS, {"default": "none", "tooltip": "主服务商超时未返回时同时请求的备用服务商；开启 stream 时不做对冲，只请求主服务商"}),
+            },
+            "hidden": {
+                "unique_id": "UNIQUE_ID",
+            },
         }
 
-    RETURN_TYPES = ("STRING",)
+    RETURN_TYPES = ("STRING", "STRING")
+    RETURN_NAMES = ("response", "provider")
     FUNCTION = "chat"
     CATEGORY = "🌙DW/MultiRole"
 
-    def chat(self, role, message, max_tokens, reset_conversation=False):
-        if not self.api_key:
-            return ("Error: DEEPSEEK_API_KEY not set or invalid. Please check your api_key.ini file.",)
+    def chat(self, role, message, max_tokens, reset_conversation=False, history_token_budget=4096, stream=False, hedge_provider="none", unique_id=None):
+        if not self.client:
+            return ("Error: DEEPSEEK_API_KEY not set or invalid. Please check your api_key.ini file.", "")
 
         if reset_conversation:
-            self.conversation_history = []
+            self.conversation_history.reset()
 
         system_message = self.get_system_message(role)
         if not self.conversation_history and system_message:
-            self.conversation_history.append({"role": "system", "content": system_message})
+            self.conversation_history.set_system(system_message)
 
-        self.conversation_history.append({"role": "user", "content": message})
-        
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.api_key}"
-        }
+        self.conversation_history.append("user", message)
         
         temperature = self.get_temperature(role)
 
         data = {
             "model": "deepseek-chat",
-            "messages": self.conversation_history,
+            "messages": self.conversation_history.messages(history_token_budget),
             "temperature": temperature,
-            "max_tokens": max_tokens
+            "max_tokens": max_tokens,
+            "stream": stream
         }
         
+        served_by = "deepseek"
         try:
-            response = requests.post(f"{self.base_url}/chat/completions", headers=headers, json=data)
-            response.raise_for_status()
-            
-            result = response.json()
-            assistant_message = result['choices'][0]['message']['content']
-            self.conversation_history.append({"role": "assistant", "content": assistant_message})
-            return (assistant_message,)
+            # 对冲结果无法逐字推送到界面，流式输出时只请求 DeepSeek
+            if hedge_provider not in ("none", "deepseek") and not stream:
+                # 对冲模式：DeepSeek 超过等待时间未返回时同时请求备用服务商，先返回者胜出
+                assistant_message, served_by = hedged_chat("deepseek", data["model"], data["messages"], temperature, max_tokens, hedge_provider)
+            else:
+                assistant_message = call_with_limits("deepseek", lambda: self.request(data, unique_id),
+                                                     estimate_request_tokens(data["messages"], max_tokens=max_tokens))
+            self.conversation_history.append("assistant", assistant_message)
+            return (assistant_message, served_by)
         except Exception as e:
-            return (f"Error: {str(e)}",)
+            # 请求失败时撤回本轮提问，保持历史一问一答；助手回复已写入时保留完整的一轮
+            self.conversation_history.pop_if_last("user", message)
+            return (f"Error: {str(e)}", "")
+
+    def request(self, data, unique_id=None):
+        if data["stream"]:
+            with self.client.stream("POST", "/chat/completions", json=data) as response:
+                response.raise_for_status()
+                return stream_sse_lines(response.iter_lines(), unique_id)
+        response = self.client.post("/chat/completions", json=data)
+        response.raise_for_status()
+        
+        result = response.json()
+        return result['choices'][0]['message']['content']
 
     def get_system_message(self, role):
         if role == "报错助手":
@@ -1,18 +1,24 @@
 import os
+import re
 import sys
-import requests
-import json
-import configparser
+import httpx
 import comfy.utils
 import folder_paths
-import langdetect
 
 # 添加父目录到 Python 路径
 parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if parent_dir not in sys.path:
     sys.path.append(parent_dir)
 
-from api_utils import load_api_key
+from api_clients import get_registry
+from response_cache import ResponseCache, get_response_cache
+from language_id import get_language_detector
+from rate_limit import call_with_limits, estimate_request_tokens
+from translation_memory import get_translation_memory, join_segments, normalize_segment, split_segments
+
+# 打包翻译时的分段编号，例如 [[1]]
+SEGMENT_MARKER = re.compile(r'^[ \t]*\[\[(\d+)\]\][ \t]*$', re.MULTILINE)
+API_ERROR_PREFIXES = ("API call error", "Error parsing API response")
 
 class DeepSeekTranslator:
     @classmethod
@@ -24,6 +30,10 @@ class DeepSeekTranslator:
                 "target_lang": (["zh", "en"], {"default": "en"}),
                 "country": ("STRING", {"default": ""}),
                 "clean_after_execution": ("BOOLEAN", {"default": True})
+            },
+            "optional": {
+                "skip_if_target_lang": ("BOOLEAN", {"default": False}),
+                "use_cache": ("BOOLEAN", {"default": False}),
             }
         }
 
@@ -32,42 +42,135 @@ class DeepSeekTranslator:
     CATEGORY = "🌙DW/deepseek_translater"
 
     def __init__(self):
-        self.api_url = "https://api.deepseek.com/v1/chat/completions"
         self.temperature = 0.3  # 设置特殊的temperature值用于翻译
+        self.use_cache = False  # 采样结果默认不缓存，重新运行可以得到不同的译文
         self.api_key = self.load_api_key()
 
     def load_api_key(self):
-        config = configparser.ConfigParser()
-        config_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'api_key.ini')
-        config.read(config_path)
-        return config.get('DEFAULT', 'DEEPSEEK_API_KEY', fallback='')
+        return get_registry().api_key('deepseek') or ''
 
     def call_api(self, messages):
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
+        client = get_registry().http_client('deepseek')
+        if client is None:
+            return "API call error: DEEPSEEK_API_KEY not found in api_key.ini"
         data = {
             "model": "deepseek-chat",
             "messages": messages,
             "temperature": self.temperature
         }
-        try:
-            response = requests.post(self.api_url, headers=headers, data=json.dumps(data))
+
+        def post():
+            response = client.post("/chat/completions", json=data)
             response.raise_for_status()
             return response.json()['choices'][0]['message']['content']
-        except requests.exceptions.RequestException as e:
+
+        def request():
+            return call_with_limits("deepseek", post, estimate_request_tokens(messages))
+
+        try:
+            cache = get_response_cache() if self.use_cache else None
+            if cache:
+                cache_key = ResponseCache.make_key("deepseek", data["model"], messages, temperature=self.temperature)
+                return cache.cached(cache_key, request)
+            return request()
+        except httpx.HTTPError as e:
             return f"API call error: {str(e)}"
         except (KeyError, IndexError) as e:
             return f"Error parsing API response: {str(e)}"
 
     def translate(self, text, source_lang, target_lang):
+        """翻译记忆命中部分片段时只把未命中的片段发给 API；记忆关闭或全部未命中时整段翻译，保留上下文"""
+        memory = get_translation_memory()
+        if memory is None:
+            return self.translate_text(text, source_lang, target_lang)
+        # 整段翻译的结果以整段文本为键记入翻译记忆，同一文本再次翻译时直接命中
+        remembered = memory.lookup([text], source_lang, target_lang).get(normalize_segment(text))
+        if remembered is not None:
+            return remembered
+        parts = split_segments(text)
+        segments = parts[::2]
+        if not memory.lookup([segment for segment in segments if segment.strip()], source_lang, target_lang):
+            result = self.translate_text(text, source_lang, target_lang)
+            if not result.startswith(API_ERROR_PREFIXES):
+                memory.remember({text: result}, source_lang, target_lang)
+            return result
+        results = self.translate_batch(segments, source_lang, target_lang)
+        for result in results:
+            if result.startswith(API_ERROR_PREFIXES):
+                return result
+        return join_segments(parts, {normalize_segment(segment): result for segment, result in zip(segments, results)}, target_lang)
+
+    def translate_text(self, text, source_lang, target_lang):
         messages = [
             {"role": "system", "content": f"You are a professional translator. Translate the following text from {source_lang} to {target_lang}. Only return the translation, without any explanations or additional comments."},
             {"role": "user", "content": text}
         ]
         return self.call_api(messages)
 
+    def translate_batch(self, texts, source_lang, target_lang, max_items=40, max_chars=4000):
+        """把多段短文本按编号打包进一次请求翻译，已在翻译记忆中的文本不再请求"""
+        unique_texts = {}
+        for text in texts:
+            if text.strip():
+                unique_texts.setdefault(normalize_segment(text), text.strip())
+
+        memory = get_translation_memory()
+        translations = memory.lookup(unique_texts.values(), source_lang, target_lang) if memory else {}
+        missing = [text for key, text in unique_texts.items() if key not in translations]
+        for chunk in self.pack_segments(missing, max_items, max_chars):
+            results = dict(zip(chunk, self.translate_packed(chunk, source_lang, target_lang)))
+            translated = {text: result for text, result in results.items() if not result.startswith(API_ERROR_PREFIXES)}
+            if memory:
+                memory.remember(translated, source_lang, target_lang)
+            translations.update((normalize_segment(text), result) for text, result in results.items())
+        return [translations.get(normalize_segment(text), text) if text.strip() else text for text in texts]
+
+    @staticmethod
+    def pack_segments(texts, max_items, max_chars):
+        chunk, chunk_chars = [], 0
+        for text in texts:
+            if chunk and (len(chunk) >= max_items or chunk_chars + len(text) > max_chars):
+                yield chunk
+                chunk, chunk_chars = [], 0
+            chunk.append(text)
+            chunk_chars += len(text)
+        if chunk:
+            yield chunk
+
+    def translate_packed(self, texts, source_lang, target_lang):
+        if len(texts) == 1:
+            return [self.translate_text(texts[0], source_lang, target_lang)]
+        packed = "\n".join(f"[[{i}]]\n{text}" for i, text in enumerate(texts, 1))
+        messages = [
+            {"role": "system", "content": f"You are a professional translator. Translate each numbered segment from {source_lang} to {target_lang}. Keep every [[n]] marker on its own line exactly as given, translate the text under it, and return only the markers and translations, without any explanations or additional comments."},
+            {"role": "user", "content": packed}
+        ]
+        result = self.call_api(messages)
+        if result.startswith(API_ERROR_PREFIXES):
+            return [result] * len(texts)
+
+        segments = self.unpack_segments(result, len(texts))
+        if segments is None:
+            print(f"DeepSeekTranslator: packed response did not match {len(texts)} segments, falling back to per-item requests")
+            return [self.translate_text(text, source_lang, target_lang) for text in texts]
+        return segments
+
+    @staticmethod
+    def unpack_segments(result, count):
+        parts = SEGMENT_MARKER.split(result)
+        if count == 1 and len(parts) == 1 and result.strip():
+            return [result.strip()]
+        # split 结果为 [前缀, 编号, 内容, 编号, 内容, ...]
+        segments = {}
+        for number, content in zip(parts[1::2], parts[2::2]):
+            number = int(number)
+            if number in segments or not 1 <= number <= count:
+                return None
+            segments[number] = content.strip()
+        if len(segments) != count or not all(segments.values()):
+            return None
+        return [segments[i] for i in range(1, count + 1)]
+
     def get_suggestions(self, translation, country):
         if not country.strip():
             return ""
@@ -81,7 +184,7 @@ class DeepSeekTranslator:
         if not suggestions.strip():
             return translation
         messages = [
-            {"role": "system", "content": f"You are an expert translator. Translate to {target_lang} and improve the text based on the suggestions. Only return the improved translation, without any explanations or additional comments."},
+            {"role": "system", "content": f"You are an expert translator. Translate to {target_lang} and improve the text based on the suggestions. Keep any [[n]] markers on their own lines exactly as given. Only return the improved translation, without any explanations or additional comments."},
             {"role": "user", "content": f"Original translation:\n{translation}\n\nSuggestions:\n{suggestions}\n\nImprove the translation, considering these suggestions:"}
         ]
         improved = self.call_api(messages)
@@ -97,46 +200,134 @@ class DeepSeekTranslator:
         return improved
 
     def is_correct_language(self, text, target_lang):
-        try:
-            detected = langdetect.detect(text)
-            return (detected == 'zh-cn' and target_lang == 'zh') or (detected == 'en' and target_lang == 'en')
-        except:
-            return False
+        return get_language_detector().detect(text) == target_lang
 
     def cleanup(self):
         # 重置API key
         self.api_key = self.load_api_key()
         # 可以在这里添加其他清理逻辑，如果有的话
 
-    def translate_and_improve(self, text, source_lang, target_lang, country, clean_after_execution):
+    def translate_and_improve(self, text, source_lang, target_lang, country, clean_after_execution, skip_if_target_lang=False, use_cache=False):
+        self.use_cache = use_cache
         try:
-            initial_translation = self.translate(text, source_lang, target_lang)
-            
             if not country.strip():
-                return (initial_translation,)
-            
+                # 输入已经是目标语言时无需翻译
+                if skip_if_target_lang and self.is_correct_language(text, target_lang):
+                    return (text,)
+                return (self.translate(text, source_lang, target_lang),)
+
+            improved = self.improve_with_memory(text, source_lang, target_lang, country)
+            if improved is not None:
+                return (improved,)
+
+            initial_translation = self.translate(text, source_lang, target_lang)
             suggestions = self.get_suggestions(initial_translation, country)
             improved_translation = self.improve_translation(initial_translation, suggestions, target_lang)
             
             # 移除可能的额外注释或解释
             improved_translation = self.remove_extra_content(improved_translation)
-            
+
+            memory = get_translation_memory()
+            if memory and not improved_translation.startswith(API_ERROR_PREFIXES):
+                memory.remember({text: improved_translation}, source_lang, target_lang, country)
             return (improved_translation,)
         finally:
             if clean_after_execution:
                 self.cleanup()
 
+    def improve_with_memory(self, text, source_lang, target_lang, country):
+        """按片段复用本地化润色结果，只对未命中的片段走建议+润色流程；没有命中或编号对不上时返回 None"""
+        memory = get_translation_memory()
+        if memory is None:
+            return None
+        remembered = memory.lookup([text], source_lang, target_lang, country).get(normalize_segment(text))
+        if remembered is not None:
+            return remembered
+        parts = split_segments(text)
+        unique_segments = {}
+        for segment in parts[::2]:
+            if segment.strip():
+                unique_segments.setdefault(normalize_segment(segment), segment.strip())
+
+        translations = memory.lookup(unique_segments.values(), source_lang, target_lang, country)
+        if not translations:
+            # 没有命中的片段时走整段润色流程，保留上下文
+            return None
+        missing = [segment for key, segment in unique_segments.items() if key not in translations]
+        if missing:
+            initial = self.translate_batch(missing, source_lang, target_lang)
+            if any(result.startswith(API_ERROR_PREFIXES) for result in initial):
+                return None
+            packed = "\n".join(f"[[{i}]]\n{result}" for i, result in enumerate(initial, 1))
+            suggestions = self.get_suggestions(packed, country)
+            improved = self.remove_extra_content(self.improve_translation(packed, suggestions, target_lang))
+            segments = self.unpack_segments(improved, len(missing))
+            if segments is None:
+                return None
+            improved_segments = dict(zip(missing, segments))
+            memory.remember(improved_segments, source_lang, target_lang, country)
+            translations.update((normalize_segment(segment), result) for segment, result in improved_segments.items())
+        return join_segments(parts, translations, target_lang)
+
     def remove_extra_content(self, text):
         # 尝试找到并移除额外的注释或解释
         lines = text.split('\n')
         cleaned_lines = [line for line in lines if not line.startswith('这个') and not line.startswith('This')]
         return '\n'.join(cleaned_lines)
 
+class DeepSeekBatchTranslator(DeepSeekTranslator):
+    """批量翻译：接收文本列表（或按行拆分的多行文本），打包成少量请求"""
+
+    @classmethod
+    def INPUT_TYPES(s):
+        return {
+            "required": {
+                "text": ("STRING", {"multiline": True}),
+                "source_lang": ("STRING", {"default": "auto"}),
+                "target_lang": (["zh", "en"], {"default": "en"}),
+                "split_lines": ("BOOLEAN", {"default": True}),
+                "max_batch_items": ("INT", {"default": 40, "min": 1, "max": 200}),
+                "max_batch_chars": ("INT", {"default": 4000, "min": 200, "max": 20000}),
+                "clean_after_execution": ("BOOLEAN", {"default": True})
+            },
+            "optional": {
+                "skip_if_target_lang": ("BOOLEAN", {"default": False}),
+                "use_cache": ("BOOLEAN", {"default": False}),
+            }
+        }
+
+    INPUT_IS_LIST = True
+    RETURN_TYPES = ("STRING",)
+    OUTPUT_IS_LIST = (True,)
+    FUNCTION = "translate_list"
+
+    def translate_list(self, text, source_lang, target_lang, split_lines, max_batch_items, max_batch_chars, clean_after_execution, skip_if_target_lang=(False,), use_cache=(False,)):
+        # INPUT_IS_LIST 下所有参数都是列表，非文本参数取第一个值
+        self.use_cache = use_cache[0]
+        texts = []
+        for item in text:
+            texts.extend(item.splitlines() if split_lines[0] else [item])
+        try:
+            if not skip_if_target_lang[0]:
+                return (self.translate_batch(texts, source_lang[0], target_lang[0], max_batch_items[0], max_batch_chars[0]),)
+            # 已经是目标语言的条目原样返回，其余打包翻译
+            pending = [i for i, item in enumerate(texts) if not self.is_correct_language(item, target_lang[0])]
+            results = list(texts)
+            translated = self.translate_batch([texts[i] for i in pending], source_lang[0], target_lang[0], max_batch_items[0], max_batch_chars[0])
+            for i, result in zip(pending, translated):
+                results[i] = result
+            return (results,)
+        finally:
+            if clean_after_execution[0]:
+                self.cleanup()
+
 # ComfyUI 节点映射
 NODE_CLASS_MAPPINGS = {
-    "DeepSeekTranslator": DeepSeekTranslator
+    "DeepSeekTranslator": DeepSeekTranslator,
+    "DeepSeekBatchTranslator": DeepSeekBatchTranslator
 }
 
 NODE_DISPLAY_NAME_MAPPINGS = {
-    "DeepSeekTranslator": "DeepSeek Translator"
+    "DeepSeekTranslator": "DeepSeek Translator",
+    "DeepSeekBatchTranslator": "DeepSeek Batch Translator"
 }
\ No newline at end of file
@@ -4,9 +4,21 @@ from PIL import Image
 from pathlib import Path
 import folder_paths
 import os
-import shutil
+import sys
 import re
-from torchvision.transforms import ToPILImage
+import json
+import threading
+from collections import OrderedDict
+
+# 添加父目录到 Python 路径
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+from model_residency import get_residency_manager
+from caption_cache import get_caption_cache, image_hash
+from image_payload import to_uint8
+from api_utils import load_setting
 
 # 定义模型存储目录
 models_dir = Path(folder_paths.base_path) / "models"
@@ -14,45 +26,100 @@ llava_checkpoints_dir = models_dir / "LLavacheckpoints"
 files_for_moondream2 = llava_checkpoints_dir / "files_for_moondream2"
 files_for_moondream2.mkdir(parents=True, exist_ok=True)
 
+class ImageEmbeddingCache:
+    """按图片哈希缓存 model.encode_image 的输出，与模型一起常驻，模型被卸载时一并释放"""
+
+    def __init__(self, max_items):
+        self.max_items = max_items
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get_or_encode(self, key, encode):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        embedding = encode()
+        if self.max_items > 0:
+            with self._lock:
+                self._entries[key] = embedding
+                while len(self._entries) > self.max_items:
+                    self._entries.popitem(last=False)
+        return embedding
+
 class Moondream2Predictor:
     _instance = None
 
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(Moondream2Predictor, cls).__new__(cls)
-            cls._instance.model = None
-            cls._instance.tokenizer = None
+            cls._instance.device = "cuda" if torch.cuda.is_available() else "cpu"
         return cls._instance
 
+    @property
+    def residency_key(self):
+        return ("moondream2", self.device)
+
     def load_model(self):
-        if self.model is None:
-            self.device = "cuda" if torch.cuda.is_available() else "cpu"
-            print(f"使用设备: {self.device}")
-            print("加载模型中...")
-            self.model = AutoModelForCausalLM.from_pretrained(files_for_moondream2, trust_remote_code=True).to(self.device)
-            self.tokenizer = AutoTokenizer.from_pretrained(files_for_moondream2)
-            print("模型加载成功")
-
-    def generate_predictions(self, image_path, question):
-        self.load_model()  # 确保模型已加载
-        try:
-            image_input = Image.open(image_path).convert("RGB")
-            enc_image = self.model.encode_image(image_input)
-            generated_text = self.model.answer_question(enc_image, question, self.tokenizer)
-            return generated_text
-        finally:
-            if os.path.exists(image_path):
-                os.remove(image_path)
+        print(f"使用设备: {self.device}")
+        print("加载模型中...")
+        model = AutoModelForCausalLM.from_pretrained(files_for_moondream2, trust_remote_code=True).to(self.device)
+        tokenizer = AutoTokenizer.from_pretrained(files_for_moondream2)
+        print("模型加载成功")
+        return model, tokenizer, ImageEmbeddingCache(load_setting("MODELS", "image_embedding_cache", 16, int))
+
+    @staticmethod
+    def to_pil(image):
+        return Image.fromarray(to_uint8(image)[0]).convert("RGB")
+
+    def generate_predictions(self, image, question):
+        """image 为单帧 IMAGE 张量 [H,W,C]，直接在内存中转换，不再写临时文件"""
+        # 模型由常驻管理器保持加载，跨执行复用
+        with get_residency_manager().use(self.residency_key, self.load_model, self.device) as (model, tokenizer, embeddings):
+            # 同一图片的追问直接复用视觉编码结果
+            enc_image = embeddings.get_or_encode(image_hash(image), lambda: model.encode_image(self.to_pil(image)))
+            return model.answer_question(enc_image, question, tokenizer)
+
+    def answer_questions(self, image, questions, max_new_tokens=256):
+        """对同一帧只做一次视觉编码，所有问题在一次批量生成中回答"""
+        with get_residency_manager().use(self.residency_key, self.load_model, self.device) as (model, tokenizer, embeddings):
+            enc_image = embeddings.get_or_encode(image_hash(image), lambda: model.encode_image(self.to_pil(image)))
+            if len(questions) == 1 or not (hasattr(model, "input_embeds") and hasattr(model, "text_model")):
+                # 模型版本不提供批量生成所需的接口时逐个回答，视觉编码仍只做一次
+                return [model.answer_question(enc_image, question, tokenizer) for question in questions]
+            return self.batch_generate(model, tokenizer, enc_image, questions, max_new_tokens)
+
+    @staticmethod
+    def batch_generate(model, tokenizer, enc_image, questions, max_new_tokens):
+        # 与 moondream2 的 batch_answer 相同：左侧用 BOS 嵌入补齐，区别是所有问题共享同一份图片嵌入
+        prompts = [f"<image>\n\nQuestion: {question}\n\nAnswer:" for question in questions]
+        with torch.no_grad():
+            prompt_embs = [model.input_embeds(prompt, enc_image, tokenizer)[0] for prompt in prompts]
+            bos_emb = prompt_embs[0][0]
+            max_len = max(emb.shape[0] for emb in prompt_embs)
+            inputs_embeds = torch.stack([torch.cat([bos_emb.repeat(max_len - emb.shape[0], 1), emb]) for emb in prompt_embs])
+            attention_mask = torch.zeros(inputs_embeds.shape[:2], dtype=torch.long, device=inputs_embeds.device)
+            for i, emb in enumerate(prompt_embs):
+                attention_mask[i, max_len - emb.shape[0]:] = 1
+            output_ids = model.text_model.generate(
+                inputs_embeds=inputs_embeds,
+                attention_mask=attention_mask,
+                max_new_tokens=max_new_tokens,
+                bos_token_id=tokenizer.bos_token_id,
+                eos_token_id=tokenizer.eos_token_id,
+                pad_token_id=tokenizer.eos_token_id,
+            )
+        return [text.strip() for text in tokenizer.batch_decode(output_ids, skip_special_tokens=True)]
 
     def clear_memory(self):
-        if self.model:
-            del self.model
-            del self.tokenizer
-            self.model = None
-            self.tokenizer = None
-            torch.cuda.empty_cache()
+        get_residency_manager().unload(self.residency_key)
         print("模型已卸载，内存已清理")
 
+def clean_response(response):
+    response = ' '.join(response.strip().split())
+    # 使用正则表达式移除开头的特定短语
+    return re.sub(r'^(The image contains|This picture contains|This image contains)\s*', '', response, flags=re.IGNORECASE)
+
 class Moondream2model:
     def __init__(self):
         self.predictor = Moondream2Predictor()
@@ -64,33 +131,75 @@ class Moondream2model:
                 "image": ("IMAGE",),
                 "text_input": ("STRING", {"multiline": True, "default": ""}),
             },
+            "optional": {
+                "use_cache": ("BOOLEAN", {"default": True, "tooltip": "贪心解码，同一图片和参数的结果固定，默认复用缓存的描述"}),
+            },
         }
 
     RETURN_TYPES = ("STRING",)
     FUNCTION = "moondream2_generate_predictions"
     CATEGORY = "🌙DW/ImageToText"
 
-    def moondream2_generate_predictions(self, image, text_input):
-        try:
-            pil_image = ToPILImage()(image[0].permute(2, 0, 1))
-            temp_path = files_for_moondream2 / "temp_image.png"
-            pil_image.save(temp_path)
-            
-            response = self.predictor.generate_predictions(temp_path, text_input)
-            response = ' '.join(response.strip().split())
-           
-            # 使用正则表达式移除开头的特定短语
-            response = re.sub(r'^(The image contains|The image contains|This picture contains|This picture contains|The image contains|The image contains|This image contains|This image contains)\s*', '', response, flags=re.IGNORECASE)
-            
-            return (response,)
-        finally:
-            # 确保在函数结束时卸载模型
-            self.predictor.clear_memory()
+    def moondream2_generate_predictions(self, image, text_input, use_cache=True):
+        def predict():
+            return self.predictor.generate_predictions(image[0], text_input)
+
+        # 相同图片和问题直接复用之前的回答，跳过模型推理
+        cache = get_caption_cache() if use_cache else None
+        response = cache.cached(image[0], "moondream2", text_input, predict) if cache else predict()
+        return (clean_response(response),)
+
+class Moondream2MultiQuestion:
+    """一次执行回答多个问题：每帧只做一次视觉编码，问题批量生成"""
+    def __init__(self):
+        self.predictor = Moondream2Predictor()
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "image": ("IMAGE",),
+                "questions": ("STRING", {"multiline": True, "default": "What is the main subject?\nWhat is the art style?\nDescribe the lighting.\nIs there any text in the image?\nWhat is the colour palette?"}),
+            },
+            "optional": {
+                "max_new_tokens": ("INT", {"default": 256, "min": 1, "max": 1024}),
+                "use_cache": ("BOOLEAN", {"default": True, "tooltip": "贪心解码，同一图片和参数的结果固定，默认复用缓存的描述"}),
+            },
+        }
+
+    RETURN_TYPES = ("STRING", "STRING")
+    RETURN_NAMES = ("answers", "json")
+    OUTPUT_IS_LIST = (True, False)
+    FUNCTION = "answer_questions"
+    CATEGORY = "🌙DW/ImageToText"
+
+    def answer_questions(self, image, questions, max_new_tokens=256, use_cache=True):
+        # 每行一个问题，忽略空行
+        question_list = [line.strip() for line in questions.splitlines() if line.strip()]
+        if not question_list:
+            return ([], "[]")
+
+        cache = get_caption_cache() if use_cache else None
+        answers, results = [], []
+        for index, frame in enumerate(image):
+            ask = lambda indices: self.predictor.answer_questions(frame, [question_list[i] for i in indices], max_new_tokens)
+            if cache:
+                # 批量生成与单问题节点的生成参数不同，缓存键单独区分并包含 max_new_tokens
+                frame_answers = cache.cached_prompts(frame, "moondream2:batch", question_list, ask, max_new_tokens=max_new_tokens)
+            else:
+                frame_answers = ask(range(len(question_list)))
+            frame_answers = [clean_response(answer) for answer in frame_answers]
+            answers.extend(frame_answers)
+            results.append({"frame": index, "answers": dict(zip(question_list, frame_answers))})
+
+        return (answers, json.dumps(results, ensure_ascii=False, indent=2))
 
 NODE_CLASS_MAPPINGS = {
-    "dwimage2": Moondream2model
+    "dwimage2": Moondream2model,
+    "Moondream2MultiQuestion": Moondream2MultiQuestion,
 }
 
 NODE_DISPLAY_NAME_MAPPINGS = {
-    "dwimage2": "DW Image2 Chat"
+    "dwimage2": "DW Image2 Chat",
+    "Moondream2MultiQuestion": "DW Image2 Multi Question",
 }
\ No newline at end of file
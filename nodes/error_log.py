@@ -1,40 +1,114 @@
 import os
 import re
+import json
+import mmap
+import time
+from collections import deque
+from datetime import datetime
+
+# 增量扫描状态（每个日志文件的 inode、已扫描偏移和最近的错误）保存在插件的 cache 目录
+STATE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cache", "error_log_state.json")
+MAX_RECENT_ERRORS = 500
+
+LOG_FILE_PATTERN = re.compile(r'comfyui.*\.log')
+# 只匹配关键字，再向两侧扩展到整行，避免对每一行做贪婪匹配
+ERROR_PATTERN = re.compile(rb'ERROR|Exception|Traceback|Failed', re.IGNORECASE)
+TIMESTAMP_PATTERN = re.compile(r'^\[?(\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2})')
+
+def _line_time(line, observed_at):
+    # 日志行自带时间戳时以其为准，否则使用本次扫描到它的时间
+    match = TIMESTAMP_PATTERN.match(line)
+    if match:
+        try:
+            return datetime.fromisoformat(match.group(1).replace("T", " ")).timestamp()
+        except ValueError:
+            pass
+    return observed_at
+
+def scan_error_lines(log_path, offset):
+    """从 offset 开始扫描新追加的完整行，返回 (错误行列表, 新的偏移)"""
+    with open(log_path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size <= offset:
+            return [], offset
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # 只处理到最后一个换行符，未写完的行留到下次
+            end = mm.rfind(b"\n", offset, size) + 1
+            if end <= offset:
+                return [], offset
+            lines = []
+            pos = offset
+            while True:
+                match = ERROR_PATTERN.search(mm, pos, end)
+                if match is None:
+                    break
+                line_start = mm.rfind(b"\n", offset, match.start()) + 1 or offset
+                line_end = mm.find(b"\n", match.end(), end)
+                lines.append(mm[line_start:line_end].decode("utf-8", errors="replace").rstrip("\r"))
+                pos = line_end + 1
+            return lines, end
 
 class ErrorLogNode:
     @classmethod
     def INPUT_TYPES(s):
-        return {"required": {}}
-    
+        return {
+            "required": {},
+            "optional": {
+                "mode": (["since_last_run", "time_window", "recent"], {"default": "since_last_run"}),
+                "window_minutes": ("INT", {"default": 60, "min": 1, "max": 10080}),
+            },
+        }
+
     RETURN_TYPES = ("STRING",)
     FUNCTION = "get_error_log"
     CATEGORY = "🌙DW"
 
-    def get_error_log(self):
+    @classmethod
+    def IS_CHANGED(s, **kwargs):
+        # 日志随时在增长，每次都重新执行
+        return float("nan")
+
+    def get_error_log(self, mode="since_last_run", window_minutes=60):
         # 获取当前文件的目录
         current_dir = os.path.dirname(os.path.abspath(__file__))
         # 向上导航三级目录到ComfyUI根目录
         comfyui_root = os.path.dirname(os.path.dirname(os.path.dirname(current_dir)))
-        
+
         # 使用正则表达式匹配日志文件
-        log_pattern = re.compile(r'comfyui.*\.log')
-        log_files = [f for f in os.listdir(comfyui_root) if log_pattern.match(f)]
-        
+        log_files = [entry for entry in os.scandir(comfyui_root) if entry.is_file() and LOG_FILE_PATTERN.match(entry.name)]
+
         if not log_files:
             return ("未找到日志文件。",)
-        
+
         # 使用最新的日志文件
-        latest_log = max(log_files, key=lambda f: os.path.getmtime(os.path.join(comfyui_root, f)))
-        log_path = os.path.join(comfyui_root, latest_log)
+        latest_log = max(log_files, key=lambda entry: entry.stat().st_mtime)
+        log_path = latest_log.path
 
         try:
-            with open(log_path, "r", encoding="utf-8") as f:
-                file_content = f.read()
-            
-            # 使用正则表达式匹配包含 "ERROR"、"Exception"、"Traceback"、"Failed"、"Error" 的行
-            error_pattern = re.compile(r'.*(ERROR|Exception|Traceback|Failed|Error).*', re.IGNORECASE)
-            error_lines = [line for line in file_content.splitlines() if error_pattern.match(line)]
-            
+            state = self._load_state()
+            file_state = state.get(log_path, {})
+            inode = latest_log.stat().st_ino
+            offset = file_state.get("offset", 0)
+            # 日志被轮转或截断时从头开始
+            if file_state.get("inode") != inode or latest_log.stat().st_size < offset:
+                offset = 0
+                file_state = {}
+
+            lines, offset = scan_error_lines(log_path, offset)
+            now = time.time()
+            recent = deque(file_state.get("recent", []), maxlen=MAX_RECENT_ERRORS)
+            recent.extend([_line_time(line, now), line] for line in lines)
+            state[log_path] = {"inode": inode, "offset": offset, "recent": list(recent)}
+            self._save_state(state)
+
+            if mode == "since_last_run":
+                error_lines = lines
+            elif mode == "time_window":
+                since = now - window_minutes * 60
+                error_lines = [line for logged_at, line in recent if logged_at >= since]
+            else:
+                error_lines = [line for _, line in recent]
+
             if error_lines:
                 return ("\n".join(error_lines),)
             else:
@@ -42,10 +116,25 @@ class ErrorLogNode:
         except Exception as e:
             return (f"读取日志文件 '{log_path}' 时发生错误：{str(e)}",)
 
+    @staticmethod
+    def _load_state():
+        try:
+            with open(STATE_PATH, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def _save_state(state):
+        os.makedirs(os.path.dirname(STATE_PATH), exist_ok=True)
+        text = json.dumps(state, ensure_ascii=False)
+        with open(STATE_PATH, "w", encoding="utf-8") as f:
+            f.write(text)
+
 NODE_CLASS_MAPPINGS = {
     "ErrorLogNode": ErrorLogNode
 }
 
 NODE_DISPLAY_NAME_MAPPINGS = {
     "ErrorLogNode": "Get error log"
-}
\ No newline at end of file
+}
@@ -1,9 +1,19 @@
+import os
+import sys
 import time
 from functools import wraps
 
+from aiohttp import web
 import execution
 import server
 
+# 添加父目录到 Python 路径
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+from node_latency import NODE_LATENCY
+
 def time_execution(func):
     @wraps(func)
     def wrapper(*args, **kwargs):
@@ -44,13 +54,12 @@ def timed_execute(*args, **kwargs):
 def swizzle_origin_execute(server, prompt, outputs, current_item, extra_data, executed, prompt_id, outputs_ui, object_storage, *args):
     unique_id = current_item
 
-    # 尝试访问 class_type（需要根据实际情况调整）
+    # 新版 ComfyUI 传入 DynamicPrompt，旧版传入 dict
     try:
-        class_type = "Unknown"  # 默认值
-       
-    except AttributeError as e:
-        print(f"Error: Failed to access class_type for unique_id {unique_id}: {e}")
-        return None
+        node = prompt.get_node(unique_id) if hasattr(prompt, "get_node") else prompt[unique_id]
+        class_type = node["class_type"]
+    except (KeyError, TypeError, AttributeError):
+        class_type = "Unknown"
 
     last_node_id = server.last_node_id
     
@@ -62,6 +71,7 @@ def swizzle_origin_execute(server, prompt, outputs, current_item, extra_data, ex
             {"node": unique_id, "prompt_id": prompt_id, "execution_time": int(execution_time * 1000)},
             server.client_id
         )
+    NODE_LATENCY.record(class_type, execution_time)
     print(f"#{unique_id} [{class_type}]: {execution_time:.2f}s")
     
     return result
@@ -95,6 +105,19 @@ def swizzle_send_sync(self, event, data, sid=None):
 
 server.PromptServer.send_sync = swizzle_send_sync
 
+@server.PromptServer.instance.routes.get("/dw/metrics")
+async def node_latency_metrics_route(request):
+    return web.Response(text=NODE_LATENCY.render_text(), content_type="text/plain", charset="utf-8")
+
+@server.PromptServer.instance.routes.get("/dw/metrics/json")
+async def node_latency_json_route(request):
+    return web.json_response(NODE_LATENCY.snapshot())
+
+@server.PromptServer.instance.routes.post("/dw/metrics/reset")
+async def node_latency_reset_route(request):
+    NODE_LATENCY.reset()
+    return web.json_response({"status": "ok"})
+
 NODE_CLASS_MAPPINGS = {
     "ExecutionTime": ExecutionTime
 }
@@ -3,25 +3,21 @@ import json
 import sys
 from typing import List, Dict, Any, Optional
 from pathlib import Path
-import httpx
-from openai import OpenAI
 
 # 添加父目录到 Python 路径
 parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if parent_dir not in sys.path:
     sys.path.append(parent_dir)
 
-from api_utils import load_api_key
+from api_clients import get_registry
 
 class FileBasedChatNode:
     def __init__(self):
-        self.api_key = load_api_key('MOONSHOT_API_KEY')
-        if not self.api_key:
+        registry = get_registry()
+        self.client = registry.moonshot()
+        if not self.client:
             raise ValueError("MOONSHOT_API_KEY not found in api_key.ini")
-        self.client = OpenAI(
-            base_url="https://api.moonshot.cn/v1",
-            api_key=self.api_key,
-        )
+        self.http = registry.http_client('moonshot')
         self.file_messages = []
         self.conversation_history = []
         self.cache_tag = None
@@ -49,9 +45,8 @@ class FileBasedChatNode:
         for file in files:
             try:
                 with open(file, 'rb') as f:
-                    response = httpx.post(
-                        f"{self.client.base_url}/files",
-                        headers={"Authorization": f"Bearer {self.client.api_key}"},
+                    response = self.http.post(
+                        "/files",
                         files={"file": f},
                         data={"purpose": "assistants"}
                     )
@@ -59,10 +54,7 @@ class FileBasedChatNode:
                 file_id = response.json()['id']
                 
                 # 获取文件内容
-                content_response = httpx.get(
-                    f"{self.client.base_url}/files/{file_id}/content",
-                    headers={"Authorization": f"Bearer {self.client.api_key}"}
-                )
+                content_response = self.http.get(f"/files/{file_id}/content")
                 content_response.raise_for_status()
                 file_content = content_response.text
                 
@@ -124,9 +116,8 @@ class FileBasedChatNode:
 
     def get_cache(self, cache_tag):
         try:
-            response = httpx.get(
-                f"{self.client.base_url}/caching",
-                headers={"Authorization": f"Bearer {self.client.api_key}"},
+            response = self.http.get(
+                "/caching",
                 params={"tags": cache_tag}
             )
             response.raise_for_status()
@@ -139,9 +130,8 @@ class FileBasedChatNode:
 
     def set_cache(self, cache_tag, content, ttl):
         try:
-            response = httpx.post(
-                f"{self.client.base_url}/caching",
-                headers={"Authorization": f"Bearer {self.client.api_key}"},
+            response = self.http.post(
+                "/caching",
                 json={
                     "tags": [cache_tag],
                     "content": content,
@@ -1,10 +1,6 @@
 import os
 import sys
-import google.generativeai as genai
-from PIL import Image
 import torch
-from contextlib import contextmanager
-from tenacity import retry, stop_after_attempt, wait_exponential
 import random
 
 # 添加父目录到 Python 路径
@@ -12,22 +8,11 @@ parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if parent_dir not in sys.path:
     sys.path.append(parent_dir)
 
-from api_utils import load_api_key
-
-@contextmanager
-def temporary_env_var(key: str, new_value):
-    old_value = os.environ.get(key)
-    if new_value is not None:
-        os.environ[key] = new_value
-    elif key in os.environ:
-        del os.environ[key]
-    try:
-        yield
-    finally:
-        if old_value is not None:
-            os.environ[key] = old_value
-        elif key in os.environ:
-            del os.environ[key]
+from api_clients import get_registry
+from hedging import HEDGE_PROVIDERS, hedged_chat
+from rate_limit import estimate_request_tokens, rate_limited
+from image_payload import encode_images, upload_settings
+from caption_cache import get_caption_cache
 
 class Gemini1_5Base:
     def __init__(self):
@@ -35,28 +20,28 @@ class Gemini1_5Base:
         self.load_api_key()
 
     def load_api_key(self):
-        api_key = load_api_key('GEMINI_API_KEY')
-        if api_key:
-            genai.configure(api_key=api_key, transport='rest')
-            self.client = genai
-        else:
+        # 代理设置由注册表按客户端配置（默认直连），不再临时修改 HTTP(S)_PROXY 环境变量
+        self.client = get_registry().http_client('gemini')
+        if not self.client:
             print("错误：在 api_key.ini 中未找到 GEMINI_API_KEY")
 
     @staticmethod
-    def tensor_to_image(tensor):
-        tensor = tensor.cpu()
-        image_np = tensor.squeeze().mul(255).clamp(0, 255).byte().numpy()
-        return Image.fromarray(image_np, mode='RGB')
+    def image_part(image):
+        return {"inline_data": {"mime_type": image.mime_type, "data": image.b64}}
 
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
+    @rate_limited("gemini", tokens=lambda self, model, prompt, image=None, temperature=0.7, max_tokens=1024: estimate_request_tokens(prompt=prompt, max_tokens=max_tokens))
     def call_api(self, model, prompt, image=None, temperature=0.7, max_tokens=1024):
-        generation_config = genai.types.GenerationConfig(
-            temperature=temperature,
-            max_output_tokens=max_tokens
-        )
-        content = [prompt, image] if image else prompt
-        response = model.generate_content(content, generation_config=generation_config)
-        return response.text
+        parts = [{"text": prompt}]
+        if image is not None:
+            parts.append(self.image_part(image))
+        data = {
+            "contents": [{"role": "user", "parts": parts}],
+            "generationConfig": {"temperature": temperature, "maxOutputTokens": max_tokens},
+        }
+        response = self.client.post(f"/v1beta/models/{model}:generateContent", json=data)
+        response.raise_for_status()
+        result = response.json()
+        return "".join(part.get("text", "") for part in result['candidates'][0]['content']['parts'])
 
 class Gemini1_5Text(Gemini1_5Base):
     @classmethod
@@ -66,26 +51,34 @@ class Gemini1_5Text(Gemini1_5Base):
                 "prompt": ("STRING", {"default": "你好，请问有什么可以帮助你的吗？", "multiline": True}),
                 "temperature": ("FLOAT", {"default": 0.7, "min": 0.0, "max": 1.0, "step": 0.1}),
                 "max_tokens": ("INT", {"default": 1024, "min": 1, "max": 2048})
+            },
+            "optional": {
+                "hedge_provider": (HEDGE_PROVIDERS, {"default": "none"}),
             }
         }
 
-    RETURN_TYPES = ("STRING",)
-    RETURN_NAMES = ("response",)
+    RETURN_TYPES = ("STRING", "STRING")
+    RETURN_NAMES = ("response", "provider")
     FUNCTION = "generate_text"
     CATEGORY = "🌙DW/Gemini1.5"
 
-    def generate_text(self, prompt, temperature, max_tokens):
+    def generate_text(self, prompt, temperature, max_tokens, hedge_provider="none"):
         if not self.client:
-            return ("错误：GEMINI_API_KEY 未设置或无效。请检查您的 api_key.ini 文件。",)
+            return ("错误：GEMINI_API_KEY 未设置或无效。请检查您的 api_key.ini 文件。", "")
 
-        model = self.client.GenerativeModel('gemini-1.5-flash')
+        if hedge_provider not in ("none", "gemini"):
+            # 对冲模式：Gemini 超过等待时间未返回时同时请求备用服务商，先返回者胜出
+            try:
+                messages = [{"role": "user", "content": prompt}]
+                return hedged_chat("gemini", "gemini-1.5-flash", messages, temperature, max_tokens, hedge_provider)
+            except Exception as e:
+                return (f"错误: {str(e)}", "")
 
         try:
-            with temporary_env_var('HTTP_PROXY', None), temporary_env_var('HTTPS_PROXY', None):
-                textoutput = self.call_api(model, prompt, temperature=temperature, max_tokens=max_tokens)
-            return (textoutput,)
+            textoutput = self.call_api('gemini-1.5-flash', prompt, temperature=temperature, max_tokens=max_tokens)
+            return (textoutput, "gemini")
         except Exception as e:
-            return (f"错误: {str(e)}",)
+            return (f"错误: {str(e)}", "")
 
 class Gemini1_5Vision(Gemini1_5Base):
     @classmethod
@@ -98,7 +91,8 @@ class Gemini1_5Vision(Gemini1_5Base):
                 "max_tokens": ("INT", {"default": 1024, "min": 1, "max": 2048}),
             },
             "optional": {
-                "seed": ("INT", {"default": -1, "min": -1, "max": 0xffffffffffffffff})
+                "seed": ("INT", {"default": -1, "min": -1, "max": 0xffffffffffffffff}),
+                "use_cache": ("BOOLEAN", {"default": False}),
             }
         }
 
@@ -107,21 +101,26 @@ class Gemini1_5Vision(Gemini1_5Base):
     FUNCTION = "analyze_image"
     CATEGORY = "🌙DW/Gemini1.5"
 
-    def analyze_image(self, prompt, image, temperature, max_tokens, seed=-1):
+    def analyze_image(self, prompt, image, temperature, max_tokens, seed=-1, use_cache=False):
         if not self.client:
             return ("错误：GEMINI_API_KEY 未设置或无效。请检查您的 api_key.ini 文件。",)
 
-        model = self.client.GenerativeModel('gemini-1.5-flash')
-
         try:
-            pil_image = self.tensor_to_image(image)
-            
             if seed != -1:
                 random.seed(seed)
                 torch.manual_seed(seed)
             
-            with temporary_env_var('HTTP_PROXY', None), temporary_env_var('HTTPS_PROXY', None):
-                textoutput = self.call_api(model, prompt, image=pil_image, temperature=temperature, max_tokens=max_tokens)
+            def request():
+                payload = encode_images(image)[0]
+                return self.call_api('gemini-1.5-flash', prompt, image=payload, temperature=temperature, max_tokens=max_tokens)
+
+            # 按原始图片内容缓存，命中时不再编码和上传图片；随机种子每次都应得到新的描述，不走缓存
+            cache = get_caption_cache() if use_cache and seed != -1 else None
+            if cache:
+                textoutput = cache.cached(image, "gemini:gemini-1.5-flash", prompt, request, temperature=temperature,
+                                          max_tokens=max_tokens, seed=seed, upload=upload_settings())
+            else:
+                textoutput = request()
             
             return (textoutput,)
         except Exception as e:
@@ -1,32 +1,17 @@
 import os
 import sys
-import google.generativeai as genai
-from PIL import Image
+import hashlib
 import torch
-from contextlib import contextmanager
-from tenacity import retry, stop_after_attempt, wait_exponential
 
 # 添加父目录到 Python 路径
 parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if parent_dir not in sys.path:
     sys.path.append(parent_dir)
 
-from api_utils import load_api_key
-
-@contextmanager
-def temporary_env_var(key: str, new_value):
-    old_value = os.environ.get(key)
-    if new_value is not None:
-        os.environ[key] = new_value
-    elif key in os.environ:
-        del os.environ[key]
-    try:
-        yield
-    finally:
-        if old_value is not None:
-            os.environ[key] = old_value
-        elif key in os.environ:
-            del os.environ[key]
+from api_clients import get_registry
+from response_cache import ResponseCache, get_response_cache
+from rate_limit import estimate_request_tokens, rate_limited
+from image_payload import encode_images
 
 class GeminiFluxPrompt:
     def __init__(self):
@@ -34,31 +19,25 @@ class GeminiFluxPrompt:
         self.load_api_key()
 
     def load_api_key(self):
-        api_key = load_api_key('GEMINI_API_KEY')
-        if api_key:
-            genai.configure(api_key=api_key, transport='rest')
-            self.client = genai
-        else:
+        # 代理设置由注册表按客户端配置（默认直连），不再临时修改 HTTP(S)_PROXY 环境变量
+        self.client = get_registry().http_client('gemini')
+        if not self.client:
             print("错误：在 api_key.ini 中未找到 GEMINI_API_KEY")
 
-    @staticmethod
-    def tensor_to_image(tensor):
-        tensor = tensor.cpu()
-        image_np = tensor.squeeze().mul(255).clamp(0, 255).byte().numpy()
-        return Image.fromarray(image_np, mode='RGB')
-
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
+    @rate_limited("gemini", tokens=lambda self, model, prompt, image=None: estimate_request_tokens(prompt=prompt))
     def call_api(self, model, prompt, image=None):
-        content = [prompt, image] if image else prompt
-        response = model.generate_content(content)
-        return response.text
-
-    def generate_prompt(self, text_input, image_input=None):
+        parts = [{"text": prompt}]
+        if image is not None:
+            parts.append({"inline_data": {"mime_type": image.mime_type, "data": image.b64}})
+        response = self.client.post(f"/v1beta/models/{model}:generateContent", json={"contents": [{"role": "user", "parts": parts}]})
+        response.raise_for_status()
+        result = response.json()
+        return "".join(part.get("text", "") for part in result['candidates'][0]['content']['parts'])
+
+    def generate_prompt(self, text_input, image_input=None, use_cache=False):
         if not self.client:
             return "错误：GEMINI_API_KEY 未设置或无效。请检查您的 api_key.ini 文件。", ""
 
-        model = self.client.GenerativeModel('gemini-1.5-flash')
-
         system_prompt = """你是一位有艺术气息的Stable Diffusion prompt 助理。你的任务是根据给定的主题生成一份详细的、高质量的prompt，让Stable Diffusion可以生成高质量的图像。prompt必须包含"clip-L:"和"clip-T5:"两部分。请严格按照以下格式输出：
 
 clip-L: [英文关键词，用逗号分隔]
@@ -76,19 +55,28 @@ clip-T5: [英文自然语言描述]
 """
 
         if image_input is not None:
-            pil_image = self.tensor_to_image(image_input)
+            payload = encode_images(image_input)[0]
             if text_input:
                 user_prompt = f"请分析这张图片，并结合以下文本生成Stable Diffusion prompt。文本：{text_input}"
             else:
                 user_prompt = "请分析这张图片，并生成相应的Stable Diffusion prompt。"
         else:
-            pil_image = None
+            payload = None
             user_prompt = f"请根据以下主题生成Stable Diffusion prompt：{text_input}"
 
         try:
-            with temporary_env_var('HTTP_PROXY', None), temporary_env_var('HTTPS_PROXY', None):
-                full_prompt = f"{system_prompt}\n\n{user_prompt}"
-                response = self.call_api(model, full_prompt, image=pil_image)
+            full_prompt = f"{system_prompt}\n\n{user_prompt}"
+
+            def request():
+                return self.call_api("gemini-1.5-flash", full_prompt, image=payload)
+
+            cache = get_response_cache() if use_cache else None
+            if cache:
+                image_hash = hashlib.sha256(payload.data).hexdigest() if payload is not None else None
+                cache_key = ResponseCache.make_key("gemini", "gemini-1.5-flash", full_prompt, image=image_hash)
+                response = cache.cached(cache_key, request)
+            else:
+                response = request()
             
             # 分离 clip-L 和 clip-T5
             clip_l = ""
@@ -119,6 +107,7 @@ clip-T5: [英文自然语言描述]
             },
             "optional": {
                 "image_input": ("IMAGE",),
+                "use_cache": ("BOOLEAN", {"default": False}),
             }
         }
 
@@ -127,8 +116,8 @@ clip-T5: [英文自然语言描述]
     FUNCTION = "generate"
     CATEGORY = "🌙DW/Gemini1.5"
 
-    def generate(self, text_input, image_input=None):
-        return self.generate_prompt(text_input, image_input)
+    def generate(self, text_input, image_input=None, use_cache=False):
+        return self.generate_prompt(text_input, image_input, use_cache)
 
 NODE_CLASS_MAPPINGS = {
     "GeminiFluxPrompt": GeminiFluxPrompt
@@ -3,14 +3,25 @@ from pathlib import Path
 from transformers import AutoTokenizer, AutoModelForCausalLM
 import gc
 import os
+import sys
 import random
 
+# 添加父目录到 Python 路径
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+from model_residency import get_residency_manager
+from model_resolver import resolve_model
+from cpu_inference import PRECISIONS, intra_op_threads, optimize_model, resolve_precision
+from prefix_cache import PrefixKVCache
+from api_utils import load_setting
+
 class Gemma2PromptNode:
     def __init__(self):
-        self.model = None
-        self.tokenizer = None
         self.device = None
         self.precision = None
+        self.compile_model = False
 
     @classmethod
     def INPUT_TYPES(cls):
@@ -20,10 +31,14 @@ class Gemma2PromptNode:
                 "max_tokens": ("INT", {"default": 1000, "min": 1, "max": 2000}),
                 "top_p": ("FLOAT", {"default": 0.95, "min": 0.0, "max": 1.0, "step": 0.05}),
                 "device": (["cuda", "cpu"], {"default": "cpu"}),
-                "precision": (["float32", "float16"], {"default": "float32"}),
+                "precision": (PRECISIONS, {"default": "float32"}),
                 "prompt_type": (["sdxl", "kolors", "flux"],),  # 添加 flux 选项
                 "seed": ("INT", {"default": -1, "min": -1, "max": 0xffffffffffffffff}),
             },
+            "optional": {
+                "cpu_threads": ("INT", {"default": 0, "min": 0, "max": 256}),
+                "compile_model": ("BOOLEAN", {"default": False}),
+            },
         }
 
     RETURN_TYPES = ("STRING", "STRING")
@@ -31,16 +46,49 @@ class Gemma2PromptNode:
     FUNCTION = "generate_prompt"
     CATEGORY = "🌙DW/prompt_utils"
 
-    def generate_prompt(self, theme, max_tokens, top_p, device, precision, prompt_type, seed):
-        if self.model is None or self.device != device or self.precision != precision:
-            self.device = device
-            self.precision = precision
-            self.load_model()
+    def generate_prompt(self, theme, max_tokens, top_p, device, precision, prompt_type, seed, cpu_threads=0, compile_model=False):
+        self.device = device
+        self.precision = precision
+        self.compile_model = compile_model
 
         if seed == -1:
             seed = random.randint(0, 0xffffffffffffffff)
         torch.manual_seed(seed)
 
+        prefix, suffix = self.prompt_parts(theme, prompt_type)
+
+        # 模型由常驻管理器保持加载，跨执行复用
+        with get_residency_manager().use(self.residency_key, self.load_model, self.device) as (model, tokenizer, prefix_cache):
+            pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id - 1
+        
+            # CPU 推理时按需限制 intra-op 线程数，避免与扩散采样争抢核心
+            with torch.no_grad(), intra_op_threads(cpu_threads):
+                outputs = prefix_cache.generate(
+                    model,
+                    tokenizer,
+                    prefix,
+                    suffix,
+                    max_new_tokens=max_tokens,
+                    temperature=0.7,
+                    top_p=top_p,
+                    do_sample=True,
+                    pad_token_id=pad_token_id,
+                    eos_token_id=tokenizer.eos_token_id,
+                )
+
+            generated_text = tokenizer.decode(outputs[0], skip_special_tokens=False)
+            response = generated_text.split("<start_of_turn>model\n")[-1].split("<end_of_turn>")[0].strip()
+
+        positive_prompt, negative_prompt = self.split_response(response, prompt_type)
+
+        del outputs
+        torch.cuda.empty_cache() if self.device == "cuda" else None
+        gc.collect()
+
+        return (positive_prompt, negative_prompt)
+
+    def prompt_parts(self, theme, prompt_type):
+        """返回 (固定前缀, 主题后缀)，前缀只取决于 prompt_type"""
         if prompt_type == "sdxl":
             system_message = """You are an artistic Stable Diffusion prompt assistant. Your task is to generate high-quality Stable Diffusion prompts based on the given theme. Please strictly follow these requirements:
 
@@ -94,30 +142,15 @@ Generate the prompt directly without any explanations or additional text. Do not
 
 Use fluent, descriptive English to generate the prompt directly, without additional explanations. Ensure the prompt is comprehensive and expressive to fully utilize the capabilities of the Flux.1 model."""
 
-        prompt = f"Generate a {'Stable Diffusion' if prompt_type == 'sdxl' else 'kolors' if prompt_type == 'kolors' else 'Flux.1'} prompt based on the following theme: {theme}"
-
-        full_prompt = f"<start_of_turn>user\n{system_message}\n\n{prompt}\n<end_of_turn>\n<start_of_turn>model\n"
-        
-        input_ids = self.tokenizer(full_prompt, return_tensors="pt").input_ids.to(self.device)
-        attention_mask = torch.ones_like(input_ids)
-        
-        pad_token_id = self.tokenizer.pad_token_id if self.tokenizer.pad_token_id is not None else self.tokenizer.eos_token_id - 1
-        
-        with torch.no_grad():
-            outputs = self.model.generate(
-                input_ids,
-                attention_mask=attention_mask,
-                max_new_tokens=max_tokens,
-                temperature=0.7,
-                top_p=top_p,
-                do_sample=True,
-                pad_token_id=pad_token_id,
-                eos_token_id=self.tokenizer.eos_token_id,
-            )
+        model_name = 'Stable Diffusion' if prompt_type == 'sdxl' else 'kolors' if prompt_type == 'kolors' else 'Flux.1'
 
-        generated_text = self.tokenizer.decode(outputs[0], skip_special_tokens=False)
-        response = generated_text.split("<start_of_turn>model\n")[-1].split("<end_of_turn>")[0].strip()
+        # 提示词在主题之前的部分对每种 prompt_type 固定，其 KV 缓存只计算一次
+        prefix = f"<start_of_turn>user\n{system_message}\n\nGenerate a {model_name} prompt based on the following theme:"
+        suffix = f" {theme}\n<end_of_turn>\n<start_of_turn>model\n"
+        return prefix, suffix
 
+    @staticmethod
+    def split_response(response, prompt_type):
         if prompt_type == "sdxl":
             if "Prompt:" in response and "Negative Prompt:" in response:
                 parts = response.split("Negative Prompt:")
@@ -133,11 +166,11 @@ Use fluent, descriptive English to generate the prompt directly, without additio
             positive_prompt = response.strip()
             negative_prompt = "low quality, bad hands, watermark, blurry, distorted, deformed, disfigured, mutated, unnatural, artificial, fake, inaccurate, inconsistent, out of focus, poorly rendered, amateur, amateurish"
 
-        del input_ids, outputs
-        torch.cuda.empty_cache() if self.device == "cuda" else None
-        gc.collect()
+        return positive_prompt, negative_prompt
 
-        return (positive_prompt, negative_prompt)
+    @property
+    def residency_key(self):
+        return (self.get_model_path(), self.device, self.precision, self.compile_model)
 
     def load_model(self):
         model_path = self.get_model_path()
@@ -147,49 +180,114 @@ Use fluent, descriptive English to generate the prompt directly, without additio
 
         try:
             print(f"Loading model from {model_path}")
-            self.tokenizer = AutoTokenizer.from_pretrained(str(model_path), trust_remote_code=True)
-            self.model = AutoModelForCausalLM.from_pretrained(
+            torch_dtype, quantize = resolve_precision(self.precision, self.device)
+            tokenizer = AutoTokenizer.from_pretrained(str(model_path), trust_remote_code=True)
+            model = AutoModelForCausalLM.from_pretrained(
                 str(model_path),
                 trust_remote_code=True,
                 device_map=self.device,
-                torch_dtype=torch.float16 if self.precision == "float16" else torch.float32,
+                torch_dtype=torch_dtype,
             )
             print("Model loaded successfully")
             
-            self.model.to(self.device)
+            model.to(self.device)
+            model = optimize_model(model, self.device, quantize=quantize, compile_model=self.compile_model)
             
         except Exception as e:
             print(f"Error loading model: {e}")
             raise RuntimeError(f"Failed to load the model from {model_path}. Please ensure the model files are correctly placed in the directory.")
 
-        if self.model is None or self.tokenizer is None:
+        if model is None or tokenizer is None:
             raise RuntimeError("Failed to load the model or tokenizer")
 
+        # 固定前缀的 KV 缓存随模型常驻，模型卸载时一并释放
+        return model, tokenizer, PrefixKVCache(load_setting("MODELS", "prefix_cache_items", 4, int))
+
     def get_model_path(self):
-        possible_paths = [
+        # 解析结果在进程内缓存，之后只按清单校验本地文件
+        return resolve_model("gemma-2-2b-it", [
             Path("models/LLavacheckpoints/gemma-2-2b-it"),
             Path("LLavacheckpoints/gemma-2-2b-it"),
             Path("gemma-2-2b-it"),
-        ]
-        
-        for path in possible_paths:
-            if path.exists() and any(path.iterdir()):
-                return str(path)
-        
-        raise RuntimeError("Could not find the Gemma model. Please ensure it's placed in one of the expected directories.")
+        ])
 
     def unload_model(self):
-        del self.model
-        del self.tokenizer
-        self.model = None
-        self.tokenizer = None
+        get_residency_manager().unload(self.residency_key)
+
+class Gemma2PromptBatchNode(Gemma2PromptNode):
+    """多个主题（每个主题可生成多个变体）在一次左补齐的批量 generate 中完成，共享系统提示词的 KV 缓存"""
+    @classmethod
+    def INPUT_TYPES(cls):
+        input_types = super().INPUT_TYPES()
+        input_types["required"]["theme"] = ("STRING", {"multiline": True, "placeholder": "每行一个主题"})
+        input_types["optional"]["variants_per_theme"] = ("INT", {"default": 1, "min": 1, "max": 64})
+        input_types["optional"]["batch_size"] = ("INT", {"default": 8, "min": 1, "max": 64})
+        return input_types
+
+    RETURN_TYPES = ("STRING", "STRING")
+    RETURN_NAMES = ("positive_prompts", "negative_prompts")
+    OUTPUT_IS_LIST = (True, True)
+    FUNCTION = "generate_prompts"
+
+    def generate_prompts(self, theme, max_tokens, top_p, device, precision, prompt_type, seed, cpu_threads=0, compile_model=False,
+                         variants_per_theme=1, batch_size=8):
+        self.device = device
+        self.precision = precision
+        self.compile_model = compile_model
+
+        themes = [line.strip() for line in theme.splitlines() if line.strip()]
+        if not themes:
+            return ([], [])
+
+        if seed == -1:
+            seed = random.randint(0, 0xffffffffffffffff)
+        torch.manual_seed(seed)
+
+        # 同一主题的多个变体依靠采样产生差异
+        rows = [t for t in themes for _ in range(variants_per_theme)]
+        prefix = self.prompt_parts("", prompt_type)[0]
+        suffixes = [self.prompt_parts(t, prompt_type)[1] for t in rows]
+
+        responses = []
+        # 模型由常驻管理器保持加载，跨执行复用
+        with get_residency_manager().use(self.residency_key, self.load_model, self.device) as (model, tokenizer, prefix_cache):
+            pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id - 1
+            stop_markers = ["<end_of_turn>", tokenizer.eos_token, tokenizer.pad_token]
+
+            with torch.no_grad(), intra_op_threads(cpu_threads):
+                for start in range(0, len(suffixes), batch_size):
+                    generated = prefix_cache.generate_batch(
+                        model,
+                        tokenizer,
+                        prefix,
+                        suffixes[start:start + batch_size],
+                        pad_token_id,
+                        max_new_tokens=max_tokens,
+                        temperature=0.7,
+                        top_p=top_p,
+                        do_sample=True,
+                        eos_token_id=tokenizer.eos_token_id,
+                    )
+                    for row in generated:
+                        text = tokenizer.decode(row, skip_special_tokens=False)
+                        for marker in stop_markers:
+                            if marker:
+                                text = text.split(marker)[0]
+                        responses.append(text.strip())
+                    del generated
+
         torch.cuda.empty_cache() if self.device == "cuda" else None
         gc.collect()
 
+        pairs = [self.split_response(response, prompt_type) for response in responses]
+        return ([positive for positive, _ in pairs], [negative for _, negative in pairs])
+
 NODE_CLASS_MAPPINGS = {
-    "Gemma2PromptNode": Gemma2PromptNode
+    "Gemma2PromptNode": Gemma2PromptNode,
+    "Gemma2PromptBatchNode": Gemma2PromptBatchNode,
 }
 
 NODE_DISPLAY_NAME_MAPPINGS = {
-    "Gemma2PromptNode": "Gemma 2 IT Prompt Generator"
+    "Gemma2PromptNode": "Gemma 2 IT Prompt Generator",
+    "Gemma2PromptBatchNode": "Gemma 2 IT Prompt Generator (Batch)",
 }
\ No newline at end of file
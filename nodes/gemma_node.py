@@ -3,13 +3,24 @@ from pathlib import Path
 from transformers import AutoTokenizer, AutoModelForCausalLM
 import gc
 import os
+import sys
+
+# 添加父目录到 Python 路径
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+from model_residency import get_residency_manager
+from model_resolver import resolve_model
+from cpu_inference import PRECISIONS, intra_op_threads, optimize_model, resolve_precision
+from prefix_cache import PrefixKVCache
+from api_utils import load_setting
 
 class GemmaDialogueNode:
     def __init__(self):
-        self.model = None
-        self.tokenizer = None
         self.device = None
         self.precision = None
+        self.compile_model = False
 
     @classmethod
     def INPUT_TYPES(cls):
@@ -19,7 +30,11 @@ class GemmaDialogueNode:
                 "max_new_tokens": ("INT", {"default": 100, "min": 1, "max": 2000}),
                 "top_p": ("FLOAT", {"default": 0.95, "min": 0.0, "max": 1.0, "step": 0.05}),
                 "device": (["cuda", "cpu"], {"default": "cpu"}),
-                "precision": (["float32", "float16"], {"default": "float32"}),
+                "precision": (PRECISIONS, {"default": "float32"}),
+            },
+            "optional": {
+                "cpu_threads": ("INT", {"default": 0, "min": 0, "max": 256}),
+                "compile_model": ("BOOLEAN", {"default": False}),
             },
         }
 
@@ -27,39 +42,46 @@ class GemmaDialogueNode:
     FUNCTION = "generate"
     CATEGORY = "🌙DW/Chat"
 
-    def generate(self, prompt, max_new_tokens, top_p, device, precision):
-        if self.model is None or self.device != device or self.precision != precision:
-            self.device = device
-            self.precision = precision
-            self.load_model()
+    def generate(self, prompt, max_new_tokens, top_p, device, precision, cpu_threads=0, compile_model=False):
+        self.device = device
+        self.precision = precision
+        self.compile_model = compile_model
 
-        prompt = f"<start_of_turn>user\n{prompt}\n<end_of_turn>\n<start_of_turn>model\n"
-        input_ids = self.tokenizer(prompt, return_tensors="pt").input_ids.to(self.device)
-        attention_mask = torch.ones_like(input_ids)
+        # 对话模板开头固定不变，复用其 KV 缓存，只预填充用户输入部分
+        prefix = "<start_of_turn>user\n"
+        suffix = f"{prompt}\n<end_of_turn>\n<start_of_turn>model\n"
+        # 模型由常驻管理器保持加载，跨执行复用
+        with get_residency_manager().use(self.residency_key, self.load_model, self.device) as (model, tokenizer, prefix_cache):
+            pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id - 1
         
-        pad_token_id = self.tokenizer.pad_token_id if self.tokenizer.pad_token_id is not None else self.tokenizer.eos_token_id - 1
-        
-        with torch.no_grad():
-            outputs = self.model.generate(
-                input_ids,
-                attention_mask=attention_mask,
-                max_new_tokens=max_new_tokens,
-                temperature=0.7,
-                top_p=top_p,
-                do_sample=True,
-                pad_token_id=pad_token_id,
-                eos_token_id=self.tokenizer.eos_token_id,
-            )
+            # CPU 推理时按需限制 intra-op 线程数，避免与扩散采样争抢核心
+            with torch.no_grad(), intra_op_threads(cpu_threads):
+                outputs = prefix_cache.generate(
+                    model,
+                    tokenizer,
+                    prefix,
+                    suffix,
+                    max_new_tokens=max_new_tokens,
+                    temperature=0.7,
+                    top_p=top_p,
+                    do_sample=True,
+                    pad_token_id=pad_token_id,
+                    eos_token_id=tokenizer.eos_token_id,
+                )
 
-        generated_text = self.tokenizer.decode(outputs[0], skip_special_tokens=False)
-        response = generated_text.split("<start_of_turn>model\n")[-1].split("<end_of_turn>")[0].strip()
+            generated_text = tokenizer.decode(outputs[0], skip_special_tokens=False)
+            response = generated_text.split("<start_of_turn>model\n")[-1].split("<end_of_turn>")[0].strip()
 
-        del input_ids, outputs
+        del outputs
         torch.cuda.empty_cache() if self.device == "cuda" else None
         gc.collect()
 
         return (response,)
 
+    @property
+    def residency_key(self):
+        return (self.get_model_path(), self.device, self.precision, self.compile_model)
+
     def load_model(self):
         model_path = self.get_model_path()
         
@@ -68,44 +90,39 @@ class GemmaDialogueNode:
 
         try:
             print(f"Loading model from {model_path}")
-            self.tokenizer = AutoTokenizer.from_pretrained(str(model_path), trust_remote_code=True)
-            self.model = AutoModelForCausalLM.from_pretrained(
+            torch_dtype, quantize = resolve_precision(self.precision, self.device)
+            tokenizer = AutoTokenizer.from_pretrained(str(model_path), trust_remote_code=True)
+            model = AutoModelForCausalLM.from_pretrained(
                 str(model_path),
                 trust_remote_code=True,
                 device_map=self.device,
-                torch_dtype=torch.float16 if self.precision == "float16" else torch.float32,
+                torch_dtype=torch_dtype,
             )
             print("Model loaded successfully")
             
-            self.model.to(self.device)
+            model.to(self.device)
+            model = optimize_model(model, self.device, quantize=quantize, compile_model=self.compile_model)
             
         except Exception as e:
             print(f"Error loading model: {e}")
             raise RuntimeError(f"Failed to load the model from {model_path}. Please ensure the model files are correctly placed in the directory.")
 
-        if self.model is None or self.tokenizer is None:
+        if model is None or tokenizer is None:
             raise RuntimeError("Failed to load the model or tokenizer")
 
+        # 固定前缀的 KV 缓存随模型常驻，模型卸载时一并释放
+        return model, tokenizer, PrefixKVCache(load_setting("MODELS", "prefix_cache_items", 4, int))
+
     def get_model_path(self):
-        possible_paths = [
+        # 解析结果在进程内缓存，之后只按清单校验本地文件
+        return resolve_model("gemma-2-2b-it", [
             Path("models/LLavacheckpoints/gemma-2-2b-it"),
             Path("LLavacheckpoints/gemma-2-2b-it"),
             Path("gemma-2-2b-it"),
-        ]
-        
-        for path in possible_paths:
-            if path.exists() and any(path.iterdir()):
-                return str(path)
-        
-        raise RuntimeError("Could not find the Gemma model. Please ensure it's placed in one of the expected directories.")
+        ])
 
     def unload_model(self):
-        del self.model
-        del self.tokenizer
-        self.model = None
-        self.tokenizer = None
-        torch.cuda.empty_cache() if self.device == "cuda" else None
-        gc.collect()
+        get_residency_manager().unload(self.residency_key)
 
 NODE_CLASS_MAPPINGS = {
     "GemmaDialogueNode": GemmaDialogueNode
@@ -1,26 +1,26 @@
 import os
 import sys
 import json
-from groq import Groq
 
 # 添加父目录到 Python 路径
 parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if parent_dir not in sys.path:
     sys.path.append(parent_dir)
 
-from api_utils import load_api_key
+from api_clients import get_registry
+from chat_history import ConversationHistory
+from streaming import stream_chat_completion
+from rate_limit import call_with_limits, estimate_request_tokens
 
 class GroqChatNode:
     def __init__(self):
         self.client = None
         self.load_api_key()
-        self.conversation_history = []
+        self.conversation_history = ConversationHistory()
 
     def load_api_key(self):
-        api_key = load_api_key('GROQ_API_KEY')
-        if api_key:
-            self.client = Groq(api_key=api_key)
-        else:
+        self.client = get_registry().groq()
+        if not self.client:
             print("Error: GROQ_API_KEY not found in api_key.ini")
 
     @classmethod
@@ -38,39 +38,54 @@ class GroqChatNode:
                 "presence_penalty": ("FLOAT", {"default": 0, "min": -2, "max": 2, "step": 0.1}),
                 "frequency_penalty": ("FLOAT", {"default": 0, "min": -2, "max": 2, "step": 0.1}),
                 "reset_conversation": ("BOOLEAN", {"default": False}),
-            }
+                "history_token_budget": ("INT", {"default": 4096, "min": 0, "max": 131072}),
+                "stream": ("BOOLEAN", {"default": False}),
+            },
+            "hidden": {
+                "unique_id": "UNIQUE_ID",
+            },
         }
 
     RETURN_TYPES = ("STRING",)
     FUNCTION = "generate_chat"
     CATEGORY = "🌙DW/Chat"
 
-    def generate_chat(self, model, prompt, max_tokens, temperature, top_p, system_message="", presence_penalty=0, frequency_penalty=0, reset_conversation=False):
+    def generate_chat(self, model, prompt, max_tokens, temperature, top_p, system_message="", presence_penalty=0, frequency_penalty=0, reset_conversation=False, history_token_budget=4096, stream=False, unique_id=None):
         if not self.client:
             return ("Error: GROQ_API_KEY not set or invalid. Please check your api_key.ini file.",)
 
         if reset_conversation:
-            self.conversation_history = []
+            self.conversation_history.reset()
 
         if not self.conversation_history and system_message:
-            self.conversation_history.append({"role": "system", "content": system_message})
+            self.conversation_history.set_system(system_message)
 
-        self.conversation_history.append({"role": "user", "content": prompt})
+        self.conversation_history.append("user", prompt)
 
-        try:
+        messages = self.conversation_history.messages(history_token_budget)
+
+        def request():
             chat_completion = self.client.chat.completions.create(
                 model=model,
-                messages=self.conversation_history,
+                messages=messages,
                 max_tokens=max_tokens,
                 temperature=temperature,
                 top_p=top_p,
                 presence_penalty=presence_penalty,
-                frequency_penalty=frequency_penalty
+                frequency_penalty=frequency_penalty,
+                stream=stream
             )
-            response = chat_completion.choices[0].message.content
-            self.conversation_history.append({"role": "assistant", "content": response})
+            if stream:
+                return stream_chat_completion(chat_completion, unique_id)
+            return chat_completion.choices[0].message.content
+
+        try:
+            response = call_with_limits("groq", request, estimate_request_tokens(messages, max_tokens=max_tokens))
+            self.conversation_history.append("assistant", response)
             return (response,)
         except Exception as e:
+            # 请求失败时撤回本轮提问，保持历史一问一答；助手回复已写入时保留完整的一轮
+            self.conversation_history.pop_if_last("user", prompt)
             return (f"Error: {str(e)}",)
 
 NODE_CLASS_MAPPINGS = {
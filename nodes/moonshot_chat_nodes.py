@@ -1,21 +1,22 @@
 import os
 import sys
-from openai import OpenAI
 
 # 添加父目录到 Python 路径
 parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if parent_dir not in sys.path:
     sys.path.append(parent_dir)
 
-from api_utils import load_api_key
+from api_clients import get_registry
+from response_cache import ResponseCache, get_response_cache
+from chat_history import ConversationHistory
+from streaming import stream_chat_completion
+from hedging import HEDGE_PROVIDERS, hedged_chat
+from rate_limit import call_with_limits, estimate_request_tokens
 
 class MoonshotChatBaseNode:
     def __init__(self):
-        self.client = None
-        self.api_key = load_api_key('MOONSHOT_API_KEY')
-        if self.api_key:
-            self.client = OpenAI(api_key=self.api_key, base_url="https://api.moonshot.cn/v1")
-        else:
+        self.client = get_registry().moonshot()
+        if not self.client:
             print("Error: MOONSHOT_API_KEY not found in api_key.ini")
 
     @classmethod
@@ -29,35 +30,73 @@ class MoonshotChatBaseNode:
             },
             "optional": {
                 "system_message": ("STRING", {"multiline": True}),
-            }
+                "stream": ("BOOLEAN", {"default": False}),
+            },
+            "hidden": {
+                "unique_id": "UNIQUE_ID",
+            },
         }
 
     RETURN_TYPES = ("STRING",)
 
+    def create_completion(self, model, messages, temperature, max_tokens, stream=False, unique_id=None):
+        def request():
+            completion = self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=stream,
+            )
+            if stream:
+                return stream_chat_completion(completion, unique_id)
+            return completion.choices[0].message.content
+        return call_with_limits("moonshot", request, estimate_request_tokens(messages, max_tokens=max_tokens))
+
 class MoonshotSingleChatNode(MoonshotChatBaseNode):
     FUNCTION = "generate_single_response"
-    RETURN_NAMES = ("response",)
+    RETURN_TYPES = ("STRING", "STRING")
+    RETURN_NAMES = ("response", "provider")
     CATEGORY = "🌙DW/Chat"
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        input_types = super().INPUT_TYPES()
+        input_types["optional"]["use_cache"] = ("BOOLEAN", {"default": False})
+        input_types["optional"]["hedge_provider"] = (HEDGE_PROVIDERS, {"default": "none", "tooltip": "主服务商超时未返回时同时请求的备用服务商；开启 stream 时不做对冲，只请求主服务商"})
+        return input_types
     
-    def generate_single_response(self, prompt, model, temperature, max_tokens, system_message=""):
+    def generate_single_response(self, prompt, model, temperature, max_tokens, system_message="", stream=False, use_cache=False, hedge_provider="none", unique_id=None):
         if not self.client:
-            return ("Error: MOONSHOT_API_KEY not set or invalid. Please check your api_key.ini file.",)
+            return ("Error: MOONSHOT_API_KEY not set or invalid. Please check your api_key.ini file.", "")
 
         messages = []
         if system_message:
             messages.append({"role": "system", "content": system_message})
         messages.append({"role": "user", "content": prompt})
 
+        # 命中缓存时不会调用 request，服务商记为 cache
+        served_by = ["cache"]
+        hedged = hedge_provider not in ("none", "moonshot") and not stream  # 对冲结果无法逐字推送到界面，流式输出时不对冲
+
+        def request():
+            if hedged:
+                # 对冲模式：Moonshot 超过等待时间未返回时同时请求备用服务商，先返回者胜出
+                response, served_by[0] = hedged_chat("moonshot", model, messages, temperature, max_tokens, hedge_provider)
+                return response
+            served_by[0] = "moonshot"
+            return self.create_completion(model, messages, temperature, max_tokens, stream, unique_id)
+
         try:
-            completion = self.client.chat.completions.create(
-                model=model,
-                messages=messages,
-                temperature=temperature,
-                max_tokens=max_tokens,
-            )
-            return (completion.choices[0].message.content,)
+            # 对冲结果可能来自备用服务商，不写入也不读取 Moonshot 的缓存
+            cache = get_response_cache() if use_cache and not hedged else None
+            if cache:
+                cache_key = ResponseCache.make_key("moonshot", model, messages, temperature=temperature, max_tokens=max_tokens,
+                                                   hedge_provider=hedge_provider)
+                return (cache.cached(cache_key, request), served_by[0])
+            return (request(), served_by[0])
         except Exception as e:
-            return (f"Error: {str(e)}",)
+            return (f"Error: {str(e)}", "")
 
 class MoonshotMultiChatNode(MoonshotChatBaseNode):
     FUNCTION = "generate_chat"
@@ -66,38 +105,36 @@ class MoonshotMultiChatNode(MoonshotChatBaseNode):
     
     def __init__(self):
         super().__init__()
-        self.conversation_history = []
+        self.conversation_history = ConversationHistory()
 
     @classmethod
     def INPUT_TYPES(cls):
         input_types = super().INPUT_TYPES()
         input_types["optional"]["reset_conversation"] = ("BOOLEAN", {"default": False})
+        input_types["optional"]["history_token_budget"] = ("INT", {"default": 4096, "min": 0, "max": 131072})
         return input_types
 
-    def generate_chat(self, prompt, model, temperature, max_tokens, system_message="", reset_conversation=False):
+    def generate_chat(self, prompt, model, temperature, max_tokens, system_message="", stream=False, reset_conversation=False, history_token_budget=4096, unique_id=None):
         if not self.client:
             return ("Error: MOONSHOT_API_KEY not set or invalid. Please check your api_key.ini file.",)
 
         if reset_conversation:
-            self.conversation_history = []
+            self.conversation_history.reset()
 
         if not self.conversation_history and system_message:
-            self.conversation_history.append({"role": "system", "content": system_message})
+            self.conversation_history.set_system(system_message)
 
-        self.conversation_history.append({"role": "user", "content": prompt})
+        self.conversation_history.append("user", prompt)
 
         try:
-            completion = self.client.chat.completions.create(
-                model=model,
-                messages=self.conversation_history,
-                temperature=temperature,
-                max_tokens=max_tokens,
-            )
-            response = completion.choices[0].message.content
-            self.conversation_history.append({"role": "assistant", "content": response})
+            messages = self.conversation_history.messages(history_token_budget)
+            response = self.create_completion(model, messages, temperature, max_tokens, stream, unique_id)
+            self.conversation_history.append("assistant", response)
             chat_history = self.format_chat_history()
             return (chat_history,)
         except Exception as e:
+            # 请求失败时撤回本轮提问，保持历史一问一答；助手回复已写入时保留完整的一轮
+            self.conversation_history.pop_if_last("user", prompt)
             return (f"Error: {str(e)}",)
 
     def format_chat_history(self):
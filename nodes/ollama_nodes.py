@@ -1,35 +1,22 @@
+import os
+import sys
 import random
-import requests
 import asyncio
-import numpy as np
-from ollama import Client
-from PIL import Image
-import base64
-from io import BytesIO
-
-
-base_url = "http://localhost:11434"
-
-def get_available_models(base_url):
-    try:
-        response = requests.get(f"{base_url}/api/tags")
-        if response.status_code == 200:
-            models = response.json()['models']
-            return [model['name'] for model in models]
-        else:
-            print(f"Error fetching models: {response.status_code}")
-            return []
-    except requests.RequestException as e:
-        print(f"Error connecting to Ollama: {str(e)}")
-        return []
 
-class OllamaImageToText:
-    base_url = "http://localhost:11434"
-    available_models = []
+# 添加父目录到 Python 路径
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
 
-    @classmethod
-    def initialize(cls):
-        cls.available_models = get_available_models(cls.base_url)
+from api_clients import default_ollama_host, get_registry
+from ollama_discovery import get_ollama_discovery, ollama_model_choices
+from streaming import stream_ndjson
+from image_payload import encode_images, upload_settings
+from caption_cache import get_caption_cache
+
+
+class OllamaImageToText:
+    base_url = default_ollama_host()
     
     @classmethod
     def INPUT_TYPES(s):
@@ -40,12 +27,19 @@ class OllamaImageToText:
                     "multiline": True,
                     "default": "Describe the main content of the picture under the speed，Do not generate any descriptive text."
                 }),
-                "model": (s.available_models,) if s.available_models else (["No models found"],),
+                "model": ollama_model_choices(s.base_url),
                 "seed": ("INT", {"default": 0, "min": 0, "max": 0xffffffffffffffff}),
                 "top_k": ("FLOAT", {"default": 40, "min": 0, "max": 100, "step": 1}),
                 "max_tokens": ("INT", {"default": 100, "min": 1, "max": 1024}),
                 "keep_alive": ("BOOLEAN", {"default": False}),
             },
+            "optional": {
+                "stream": ("BOOLEAN", {"default": False}),
+                "use_cache": ("BOOLEAN", {"default": False}),
+            },
+            "hidden": {
+                "unique_id": "UNIQUE_ID",
+            },
         }
 
     RETURN_TYPES = ("STRING",)
@@ -53,39 +47,37 @@ class OllamaImageToText:
     FUNCTION = "ollama_image_to_text"
     CATEGORY = "🌙DW/ImageToText"
 
-    def ollama_image_to_text(self, images, query, seed, model, top_k, max_tokens, keep_alive):
-        images_b64 = []
-
-        for image in images:
-            i = 255. * image.cpu().numpy()
-            img = Image.fromarray(np.clip(i, 0, 255).astype(np.uint8))
-            buffered = BytesIO()
-            img.save(buffered, format="PNG")
-            img_bytes = base64.b64encode(buffered.getvalue())
-            images_b64.append(str(img_bytes, 'utf-8'))
-
-        client = Client(host=self.base_url)
+    def ollama_image_to_text(self, images, query, seed, model, top_k, max_tokens, keep_alive, stream=False, use_cache=False, unique_id=None):
         options = {
             "seed": seed,
             "top_k": top_k,
             "max_tokens": max_tokens,
         }
 
-        # 将布尔值转换为字符串
-        keep_alive_str = "5m" if keep_alive else "0"
+        def request():
+            # 按 [IMAGE_UPLOAD] 设置缩放并压缩，多张图片并行编码
+            images_b64 = [payload.b64 for payload in encode_images(images)]
 
-        response = client.generate(model=model, prompt=query, keep_alive=keep_alive_str, options=options, images=images_b64)
+            client = get_registry().ollama(self.base_url)
 
-        return (response['response'],)
+            # 将布尔值转换为字符串
+            keep_alive_str = "5m" if keep_alive else "0"
 
+            response = client.generate(model=model, prompt=query, keep_alive=keep_alive_str, options=options, images=images_b64, stream=stream)
+            if stream:
+                text, _ = stream_ndjson(response, unique_id)
+                return text
+            return response['response']
 
-class OllamaTextToText:
-    base_url = "http://localhost:11434"
-    available_models = []
+        # 同一批图片、模型和参数直接复用之前的描述
+        cache = get_caption_cache() if use_cache else None
+        if cache:
+            return (cache.cached(images, f"ollama:{model}", query, request, upload=upload_settings(), **options),)
+        return (request(),)
 
-    @classmethod
-    def initialize(cls):
-        cls.available_models = get_available_models(cls.base_url)
+
+class OllamaTextToText:
+    base_url = default_ollama_host()
 
     @classmethod
     def INPUT_TYPES(s):
@@ -96,7 +88,7 @@ class OllamaTextToText:
                     "multiline": True,
                     "default": "1girl"
                 }),
-                "model": (s.available_models,) if s.available_models else (["No models found"],),
+                "model": ollama_model_choices(s.base_url),
                 "extra_model": ("STRING", {
                     "multiline": False,
                     "default": "none"
@@ -115,7 +107,11 @@ class OllamaTextToText:
                 "keep_alive": (["0", "5m", "10m", "15m", "30m", "60m"],), 
             },"optional": {
                 "context": ("STRING", {"forceInput": True}),
-            }
+                "stream": ("BOOLEAN", {"default": False}),
+            },
+            "hidden": {
+                "unique_id": "UNIQUE_ID",
+            },
         }
 
     RETURN_TYPES = ("STRING","STRING",)
@@ -123,8 +119,8 @@ class OllamaTextToText:
     FUNCTION = "ollama_text_to_text"
     CATEGORY = "🌙DW/Chat"
 
-    def ollama_text_to_text(self, prompt, model, extra_model, system, seed, top_k, top_p, temperature, max_tokens, tfs_z, keep_alive, context=None):
-        client = Client(host=self.base_url)
+    def ollama_text_to_text(self, prompt, model, extra_model, system, seed, top_k, top_p, temperature, max_tokens, tfs_z, keep_alive, context=None, stream=False, unique_id=None):
+        client = get_registry().ollama(self.base_url)
 
         options = {
             "seed": seed,
@@ -137,13 +133,16 @@ class OllamaTextToText:
             
         if extra_model != "none":
             model = extra_model
-        response = client.generate(model=model, system=system, prompt=prompt, keep_alive=keep_alive, context=context, options=options)
+        response = client.generate(model=model, system=system, prompt=prompt, keep_alive=keep_alive, context=context, options=options, stream=stream)
+        if stream:
+            # 最后一个数据块（done=True）携带 context
+            text, last = stream_ndjson(response, unique_id)
+            return (text, last.get('context'),)
 
         return (response['response'], response['context'],)
 
-# 初始化模型列表
-OllamaImageToText.initialize()
-OllamaTextToText.initialize()
+# 后台预取模型列表，不阻塞启动
+get_ollama_discovery().refresh(default_ollama_host())
 
 NODE_CLASS_MAPPINGS = {
     "OllamaImageToText": OllamaImageToText,
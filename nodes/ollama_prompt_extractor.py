@@ -1,34 +1,27 @@
 import os
+import sys
 import json
-import requests
+import httpx
 import random
 
-def get_available_models(base_url):
-    try:
-        response = requests.get(f"{base_url}/api/tags")
-        if response.status_code == 200:
-            models = response.json()['models']
-            return [model['name'] for model in models]
-        else:
-            print(f"Error fetching models: {response.status_code}")
-            return []
-    except requests.RequestException as e:
-        print(f"Error connecting to Ollama: {str(e)}")
-        return []
+# 添加父目录到 Python 路径
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
 
-class OllamaPromptExtractor:
-    base_url = "http://localhost:11434"
-    available_models = []
+from api_clients import default_ollama_host, get_registry
+from ollama_discovery import get_ollama_discovery, ollama_model_choices
+from response_cache import ResponseCache, get_response_cache
+from streaming import stream_ndjson
 
-    @classmethod
-    def initialize(cls):
-        cls.available_models = get_available_models(cls.base_url)
+class OllamaPromptExtractor:
+    base_url = default_ollama_host()
 
     @classmethod
     def INPUT_TYPES(cls):
         return {
             "required": {
-                "model": (cls.available_models,) if cls.available_models else (["No models found"],),
+                "model": ollama_model_choices(cls.base_url),
                 "extra_model": ("STRING", {
                     "multiline": False,
                     "default": "none"
@@ -39,6 +32,12 @@ class OllamaPromptExtractor:
                 "prompt_type": (["sdxl", "kolors", "flux"],),
                 "seed": ("INT", {"default": -1, "min": -1, "max": 0xffffffffffffffff}),
             },
+            "optional": {
+                "stream": ("BOOLEAN", {"default": False}),
+            },
+            "hidden": {
+                "unique_id": "UNIQUE_ID",
+            },
         }
 
     RETURN_TYPES = ("STRING", "STRING")
@@ -46,7 +45,7 @@ class OllamaPromptExtractor:
     FUNCTION = "generate_sd_prompt"
     CATEGORY = "🌙DW/prompt_utils"
 
-    def generate_sd_prompt(self, model, extra_model, theme, max_tokens, temperature, prompt_type, seed):
+    def generate_sd_prompt(self, model, extra_model, theme, max_tokens, temperature, prompt_type, seed, stream=False, unique_id=None):
         if extra_model != "none":
             model = extra_model
 
@@ -105,23 +104,40 @@ class OllamaPromptExtractor:
 
         prompt = f"根据以下主题生成{'Stable Diffusion' if prompt_type == 'sdxl' else prompt_type}提示词：{theme}"
 
+        # 固定种子的请求结果可复用，随机种子不走缓存
+        cache = get_response_cache() if seed != -1 else None
+
         # 设置随机种子
         if seed == -1:
             seed = random.randint(0, 0xffffffffffffffff)
         random.seed(seed)
 
-        try:
-            response = requests.post(f"{self.base_url}/api/generate", json={
-                "model": model,
-                "prompt": f"{system_message}\n\nHuman: {prompt}\n\nAssistant:",
-                "stream": False,
-                "max_tokens": max_tokens,
-                "temperature": temperature,
-                "seed": seed
-            })
+        payload = {
+            "model": model,
+            "prompt": f"{system_message}\n\nHuman: {prompt}\n\nAssistant:",
+            "stream": stream,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "seed": seed
+        }
+
+        def request():
+            client = get_registry().http(self.base_url)
+            if stream:
+                with client.stream("POST", "/api/generate", json=payload) as response:
+                    response.raise_for_status()
+                    text, _ = stream_ndjson(response.iter_lines(), unique_id)
+                    return text
+            response = client.post("/api/generate", json=payload)
             response.raise_for_status()
-            result = response.json()
-            generated_text = result['response']
+            return response.json()['response']
+
+        try:
+            if cache:
+                cache_key = ResponseCache.make_key("ollama", model, payload["prompt"], max_tokens=max_tokens, temperature=temperature, seed=seed)
+                generated_text = cache.cached(cache_key, request)
+            else:
+                generated_text = request()
 
             # 分割正面和负面提示词
             if prompt_type == "sdxl":
@@ -140,11 +156,12 @@ class OllamaPromptExtractor:
                 negative_prompt = "low quality, bad hands, watermark"
             
             return (positive_prompt, negative_prompt)
-        except requests.RequestException as e:
+        except httpx.HTTPError as e:
             error_message = f"Error: {str(e)}"
             return (error_message, "")
 
-OllamaPromptExtractor.initialize()
+# 后台预取模型列表，不阻塞启动
+get_ollama_discovery().refresh(default_ollama_host())
 
 NODE_CLASS_MAPPINGS = {
     "OllamaPromptExtractor": OllamaPromptExtractor
@@ -1,6 +1,5 @@
 import os
 import sys
-from groq import Groq
 import random
 
 # 添加父目录到 Python 路径
@@ -8,7 +7,11 @@ parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if parent_dir not in sys.path:
     sys.path.append(parent_dir)
 
-from api_utils import load_api_key
+from api_clients import get_registry
+from response_cache import ResponseCache, get_response_cache
+from streaming import stream_chat_completion
+from hedging import HEDGE_PROVIDERS, hedged_chat
+from rate_limit import call_with_limits, estimate_request_tokens
 
 class SDPromptAgent:
     def __init__(self):
@@ -16,10 +19,8 @@ class SDPromptAgent:
         self.load_api_key()
 
     def load_api_key(self):
-        api_key = load_api_key('GROQ_API_KEY')
-        if api_key:
-            self.client = Groq(api_key=api_key)
-        else:
+        self.client = get_registry().groq()
+        if not self.client:
             print("Error: GROQ_API_KEY not found in api_key.ini")
 
     @classmethod
@@ -33,16 +34,23 @@ class SDPromptAgent:
                 "prompt_type": (["sdxl", "kolors", "flux"],),
                 "seed": ("INT", {"default": -1, "min": -1, "max": 0xffffffffffffffff}),
             },
+            "optional": {
+                "stream": ("BOOLEAN", {"default": False}),
+                "hedge_provider": (HEDGE_PROVIDERS, {"default": "none", "tooltip": "主服务商超时未返回时同时请求的备用服务商；开启 stream 时不做对冲，只请求主服务商"}),
+            },
+            "hidden": {
+                "unique_id": "UNIQUE_ID",
+            },
         }
 
-    RETURN_TYPES = ("STRING", "STRING")
-    RETURN_NAMES = ("positive_prompt", "negative_prompt")
+    RETURN_TYPES = ("STRING", "STRING", "STRING")
+    RETURN_NAMES = ("positive_prompt", "negative_prompt", "provider")
     FUNCTION = "generate_sd_prompt"
     CATEGORY = "🌙DW/prompt_utils"
 
-    def generate_sd_prompt(self, model, theme, max_tokens, temperature, prompt_type, seed):
+    def generate_sd_prompt(self, model, theme, max_tokens, temperature, prompt_type, seed, stream=False, hedge_provider="none", unique_id=None):
         if not self.client:
-            return ("Error: GROQ_API_KEY not set or invalid. Please check your api_key.ini file.", "")
+            return ("Error: GROQ_API_KEY not set or invalid. Please check your api_key.ini file.", "", "")
 
         if prompt_type == "sdxl":
             system_message = """你是一位有艺术气息的Stable Diffusion prompt 助理。你的任务是根据给定的主题生成高质量的Stable Diffusion提示词。请严格遵循以下要求：
@@ -98,23 +106,51 @@ class SDPromptAgent:
 
         prompt = f"根据以下主题生成{'Stable Diffusion' if prompt_type == 'sdxl' else prompt_type}提示词：{theme}"
 
+        # 固定种子的请求结果可复用；随机种子和对冲请求（备用服务商不带种子）不走缓存
+        hedged = hedge_provider not in ("none", "groq") and not stream  # 对冲结果无法逐字推送到界面，流式输出时不对冲
+        cache = get_response_cache() if seed != -1 and not hedged else None
+
         # 设置随机种子
         if seed == -1:
             seed = random.randint(0, 0xffffffffffffffff)
         random.seed(seed)
 
-        try:
+        messages = [
+            {"role": "system", "content": system_message},
+            {"role": "user", "content": prompt}
+        ]
+
+        def complete():
             chat_completion = self.client.chat.completions.create(
                 model=model,
-                messages=[
-                    {"role": "system", "content": system_message},
-                    {"role": "user", "content": prompt}
-                ],
+                messages=messages,
                 max_tokens=max_tokens,
                 temperature=temperature,
-                seed=seed
+                seed=seed,
+                stream=stream
             )
-            response = chat_completion.choices[0].message.content
+            if stream:
+                return stream_chat_completion(chat_completion, unique_id)
+            return chat_completion.choices[0].message.content
+
+        # 命中缓存时不会调用 request，服务商记为 cache
+        served_by = ["cache"]
+
+        def request():
+            if hedged:
+                # 对冲模式下 Groq 超过等待时间未返回时同时请求备用服务商，先返回者胜出
+                response, served_by[0] = hedged_chat("groq", model, messages, temperature, max_tokens, hedge_provider)
+                return response
+            served_by[0] = "groq"
+            return call_with_limits("groq", complete, estimate_request_tokens(messages, max_tokens=max_tokens))
+
+        try:
+            if cache:
+                cache_key = ResponseCache.make_key("groq", model, messages, max_tokens=max_tokens, temperature=temperature, seed=seed,
+                                                   hedge_provider=hedge_provider)
+                response = cache.cached(cache_key, request)
+            else:
+                response = request()
 
             # 分割正面和负面提示词
             if prompt_type == "sdxl":
@@ -132,9 +168,9 @@ class SDPromptAgent:
                 positive_prompt = response.strip()
                 negative_prompt = "low quality, bad hands, watermark, blurry, distorted, deformed, disfigured, mutated, unnatural, artificial, fake, inaccurate, inconsistent, out of focus, poorly rendered, amateur, amateurish"
             
-            return (positive_prompt, negative_prompt)
+            return (positive_prompt, negative_prompt, served_by[0])
         except Exception as e:
-            return (f"Error: {str(e)}", "")
+            return (f"Error: {str(e)}", "", "")
 
 NODE_CLASS_MAPPINGS = {
     "SDPromptAgent": SDPromptAgent
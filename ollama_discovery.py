@@ -0,0 +1,85 @@
+import time
+import threading
+
+from api_clients import default_ollama_host, get_registry
+from api_utils import load_setting
+
+class _HostState:
+    __slots__ = ("models", "fetched_at", "probing", "probed")
+
+    def __init__(self):
+        self.models = []
+        self.fetched_at = 0.0
+        self.probing = False
+        self.probed = threading.Event()
+
+class OllamaModelDiscovery:
+    """所有 Ollama 节点共享的模型列表：后台短超时探测，按 TTL 缓存并异步刷新，从不阻塞启动"""
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                instance = super(OllamaModelDiscovery, cls).__new__(cls)
+                instance._lock = threading.Lock()
+                instance._hosts = {}
+                instance.ttl = load_setting("OLLAMA", "model_list_ttl", 60.0, float)
+                instance.timeout = load_setting("OLLAMA", "discovery_timeout", 2.0, float)
+                cls._instance = instance
+        return cls._instance
+
+    def _state(self, host):
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = _HostState()
+        return state
+
+    def refresh(self, host=None):
+        """在后台线程刷新模型列表，已有探测在进行时直接返回"""
+        host = (host or default_ollama_host()).rstrip("/")
+        with self._lock:
+            state = self._state(host)
+            if state.probing:
+                return
+            state.probing = True
+        threading.Thread(target=self._probe, args=(host, state), name="dw-ollama-discovery", daemon=True).start()
+
+    def _probe(self, host, state):
+        models = None
+        try:
+            response = get_registry().http(host).get("/api/tags", timeout=self.timeout)
+            response.raise_for_status()
+            models = [model['name'] for model in response.json().get('models', [])]
+        except Exception as e:
+            # 连接失败或返回格式不符时都按探测失败处理，不能让线程带着 probing 状态退出
+            print(f"Error connecting to Ollama at {host}: {str(e)}")
+        finally:
+            with self._lock:
+                # 探测失败时保留上一次的列表，等下个 TTL 周期重试
+                if models is not None:
+                    state.models = models
+                state.fetched_at = time.monotonic()
+                state.probing = False
+            state.probed.set()
+
+    def models(self, host=None):
+        """返回缓存的模型列表；过期时触发后台刷新，仅首次调用最多等待一个探测超时"""
+        host = (host or default_ollama_host()).rstrip("/")
+        with self._lock:
+            state = self._state(host)
+            stale = time.monotonic() - state.fetched_at > self.ttl
+        if stale:
+            self.refresh(host)
+        if not state.probed.is_set():
+            state.probed.wait(self.timeout + 0.5)
+        with self._lock:
+            return list(state.models)
+
+def get_ollama_discovery():
+    return OllamaModelDiscovery()
+
+def ollama_model_choices(host=None):
+    """供 INPUT_TYPES 使用的模型下拉选项"""
+    models = get_ollama_discovery().models(host)
+    return (models,) if models else (["No models found"],)
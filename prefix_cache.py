@@ -0,0 +1,94 @@
+import copy
+import threading
+from collections import OrderedDict
+
+import torch
+
+class PrefixKVCache:
+    """固定提示词前缀（系统提示词、对话模板开头）的 past_key_values 缓存，与模型一起常驻，每次生成只预填充后缀"""
+
+    def __init__(self, max_items=4):
+        self.max_items = max_items
+        self.enabled = max_items > 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, model, tokenizer, prefix):
+        """返回 (前缀 token ids, 前缀的 KV 缓存)；缓存不可用时 KV 为 None"""
+        with self._lock:
+            entry = self._entries.get(prefix)
+            if entry is not None:
+                self._entries.move_to_end(prefix)
+                return entry
+        prefix_ids = tokenizer(prefix, return_tensors="pt").input_ids.to(model.device)
+        past_key_values = self._prefill(model, prefix_ids) if self.enabled else None
+        entry = (prefix_ids, past_key_values)
+        if past_key_values is not None:
+            with self._lock:
+                self._entries[prefix] = entry
+                while len(self._entries) > self.max_items:
+                    self._entries.popitem(last=False)
+        return entry
+
+    def _prefill(self, model, prefix_ids):
+        try:
+            from transformers import DynamicCache
+            with torch.no_grad():
+                return model(prefix_ids, past_key_values=DynamicCache(), use_cache=True).past_key_values
+        except (ImportError, TypeError, ValueError, AttributeError) as e:
+            # 部分模型或 transformers 版本不支持外部传入的缓存，之后直接完整预填充；显存不足等其他错误直接抛出
+            print(f"[PrefixKVCache] prefix caching disabled: {e}")
+            self.disable()
+            return None
+
+    def disable(self):
+        with self._lock:
+            self.enabled = False
+            self._entries.clear()
+
+    def generate(self, model, tokenizer, prefix, suffix, **generate_kwargs):
+        """以 prefix + suffix 为输入调用 model.generate，命中前缀缓存时只预填充 suffix；返回包含输入在内的完整序列"""
+        prefix_ids, past_key_values = self.get(model, tokenizer, prefix)
+        suffix_ids = tokenizer(suffix, add_special_tokens=False, return_tensors="pt").input_ids.to(prefix_ids.device)
+        input_ids = torch.cat([prefix_ids, suffix_ids], dim=-1)
+        attention_mask = torch.ones_like(input_ids)
+        if past_key_values is not None:
+            try:
+                # generate 会原地扩展缓存，每次使用副本
+                return model.generate(input_ids, attention_mask=attention_mask,
+                                      past_key_values=copy.deepcopy(past_key_values), **generate_kwargs)
+            except (TypeError, ValueError, AttributeError) as e:
+                # 只有缓存对象被拒绝时才关闭前缀缓存，其他错误（如显存不足）直接抛出，不再重复生成
+                print(f"[PrefixKVCache] cached prefix rejected by generate, falling back to full prefill: {e}")
+                self.disable()
+        return model.generate(input_ids, attention_mask=attention_mask, **generate_kwargs)
+
+    def generate_batch(self, model, tokenizer, prefix, suffixes, pad_token_id, **generate_kwargs):
+        """多个后缀共享同一前缀做一次批量生成，返回每行新生成的 token ids"""
+        # 后缀在前缀之后向左补齐，补齐位置由 attention_mask 屏蔽（位置编码按 mask 累加），所有行共用同一份前缀 KV
+        prefix_ids, past_key_values = self.get(model, tokenizer, prefix)
+        encoded = [tokenizer(suffix, add_special_tokens=False).input_ids for suffix in suffixes]
+        batch, width = len(encoded), max(len(ids) for ids in encoded)
+        suffix_ids = torch.full((batch, width), pad_token_id, dtype=torch.long)
+        suffix_mask = torch.zeros((batch, width), dtype=torch.long)
+        for row, ids in enumerate(encoded):
+            if ids:
+                suffix_ids[row, width - len(ids):] = torch.tensor(ids, dtype=torch.long)
+                suffix_mask[row, width - len(ids):] = 1
+        device = prefix_ids.device
+        input_ids = torch.cat([prefix_ids.expand(batch, -1), suffix_ids.to(device)], dim=-1)
+        attention_mask = torch.cat([torch.ones_like(prefix_ids).expand(batch, -1), suffix_mask.to(device)], dim=-1)
+
+        if past_key_values is not None:
+            try:
+                cache = copy.deepcopy(past_key_values)
+                if batch > 1:
+                    cache.batch_repeat_interleave(batch)
+                outputs = model.generate(input_ids, attention_mask=attention_mask, past_key_values=cache,
+                                         pad_token_id=pad_token_id, **generate_kwargs)
+                return outputs[:, input_ids.shape[-1]:]
+            except (TypeError, ValueError, AttributeError) as e:
+                print(f"[PrefixKVCache] cached prefix rejected by batched generate, falling back to full prefill: {e}")
+                self.disable()
+        outputs = model.generate(input_ids, attention_mask=attention_mask, pad_token_id=pad_token_id, **generate_kwargs)
+        return outputs[:, input_ids.shape[-1]:]
@@ -0,0 +1,206 @@
+import time
+import random
+import asyncio
+import threading
+import functools
+from email.utils import parsedate_to_datetime
+
+from api_utils import load_setting
+from chat_history import estimate_tokens
+
+# 可以重试的 HTTP 状态码：超时、冲突、限流和服务端错误
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504, 529}
+
+class TokenBucket:
+    """按分钟配额的令牌桶，允许透支：reserve 返回需要等待的秒数，0 表示不限制"""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount=1):
+        if not self.capacity:
+            return 0.0
+        with self._lock:
+            self._refill()
+            self.tokens -= min(amount, self.capacity)
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def pause(self, seconds):
+        """服务商要求等待时清空令牌，让所有排队的请求都至少等待 seconds 秒"""
+        if not self.capacity:
+            return
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.tokens, -seconds * self.rate)
+
+class ProviderLimiter:
+    def __init__(self, provider):
+        self.provider = provider
+        self.requests = TokenBucket(load_setting("RATE_LIMITS", f"{provider}_rpm", 0, int))
+        self.tokens = TokenBucket(load_setting("RATE_LIMITS", f"{provider}_tpm", 0, int))
+        self._pause_lock = threading.Lock()
+        self.paused_until = 0.0
+
+    def reserve(self, tokens=0):
+        delay = max(self.requests.reserve(1), self.tokens.reserve(tokens) if tokens else 0.0)
+        with self._pause_lock:
+            return max(delay, self.paused_until - time.monotonic())
+
+    def pause(self, seconds):
+        with self._pause_lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.requests.pause(seconds)
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+_in_flight = None
+
+def get_limiter(provider):
+    with _limiters_lock:
+        if provider not in _limiters:
+            _limiters[provider] = ProviderLimiter(provider)
+        return _limiters[provider]
+
+def _in_flight_semaphore():
+    global _in_flight
+    with _limiters_lock:
+        if _in_flight is None:
+            _in_flight = threading.BoundedSemaphore(max(1, load_setting("RATE_LIMITS", "max_in_flight", 8, int)))
+        return _in_flight
+
+def estimate_request_tokens(messages=None, prompt=None, max_tokens=0):
+    """估算一次请求消耗的 token：提示词加上最大输出"""
+    text_tokens = estimate_tokens(prompt) if isinstance(prompt, str) else 0
+    for message in messages or []:
+        content = message.get("content")
+        if isinstance(content, str):
+            text_tokens += estimate_tokens(content)
+    return text_tokens + (max_tokens or 0)
+
+def _status_code(exc):
+    for attr in ("status_code", "status", "code"):
+        value = getattr(exc, attr, None)
+        if isinstance(value, int):
+            return value
+    response = getattr(exc, "response", None)
+    value = getattr(response, "status_code", None)
+    return value if isinstance(value, int) else None
+
+def _parse_retry_after(exc):
+    retry_after = getattr(exc, "retry_after", None)
+    if retry_after is not None:
+        return float(retry_after)
+    headers = getattr(getattr(exc, "response", None), "headers", None) or getattr(exc, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def classify_error(exc):
+    """返回 (是否可重试, 服务商要求的等待秒数)"""
+    status = _status_code(exc)
+    if status is not None and 100 <= status < 600:
+        return status in RETRYABLE_STATUS, _parse_retry_after(exc)
+    # 没有状态码的异常只重试连接和超时类错误
+    if isinstance(exc, (ConnectionError, TimeoutError, asyncio.TimeoutError)):
+        return True, None
+    name = type(exc).__name__
+    return ("Timeout" in name or "Connection" in name or name in ("RemoteProtocolError", "ServerDisconnectedError")), None
+
+def backoff_delay(attempt, retry_after=None):
+    """带完全抖动的指数退避，服务商给出 Retry-After 时至少等待该时长"""
+    base = load_setting("RATE_LIMITS", "base_backoff", 1.0, float)
+    cap = load_setting("RATE_LIMITS", "max_backoff", 30.0, float)
+    delay = random.uniform(0, min(cap, base * 2 ** attempt))
+    return max(delay, retry_after) if retry_after is not None else delay
+
+def call_with_limits(provider, func, tokens=0):
+    """在服务商限流和全局并发上限内调用 func，按错误类型重试"""
+    limiter = get_limiter(provider)
+    max_attempts = max(1, load_setting("RATE_LIMITS", "max_attempts", 3, int))
+    for attempt in range(max_attempts):
+        wait = limiter.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        try:
+            with _in_flight_semaphore():
+                return func()
+        except Exception as e:
+            retryable, retry_after = classify_error(e)
+            if not retryable or attempt == max_attempts - 1:
+                raise
+            if retry_after is not None:
+                limiter.pause(retry_after)
+            delay = backoff_delay(attempt, retry_after)
+            print(f"[{provider}] request failed ({e}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+async def _acquire_in_flight():
+    """在事件循环中获取全局并发名额，与同步请求共用同一个信号量"""
+    semaphore = _in_flight_semaphore()
+    if semaphore.acquire(blocking=False):
+        return semaphore
+    # 名额已满时在线程池中等待，不阻塞事件循环
+    future = asyncio.get_running_loop().run_in_executor(None, semaphore.acquire)
+    try:
+        await asyncio.shield(future)
+    except asyncio.CancelledError:
+        # 对冲请求被取消时，等后台获取完成后立即归还名额
+        future.add_done_callback(lambda _: semaphore.release())
+        raise
+    return semaphore
+
+async def call_with_limits_async(provider, coro_factory, tokens=0):
+    """call_with_limits 的协程版本，用于事件循环中的请求"""
+    limiter = get_limiter(provider)
+    max_attempts = max(1, load_setting("RATE_LIMITS", "max_attempts", 3, int))
+    for attempt in range(max_attempts):
+        wait = limiter.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        try:
+            semaphore = await _acquire_in_flight()
+            try:
+                return await coro_factory()
+            finally:
+                semaphore.release()
+        except Exception as e:
+            retryable, retry_after = classify_error(e)
+            if not retryable or attempt == max_attempts - 1:
+                raise
+            if retry_after is not None:
+                limiter.pause(retry_after)
+            await asyncio.sleep(backoff_delay(attempt, retry_after))
+
+def rate_limited(provider, tokens=None):
+    """装饰器形式的 call_with_limits，tokens 为根据调用参数估算 token 数的函数"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return call_with_limits(provider, lambda: func(*args, **kwargs), tokens(*args, **kwargs) if tokens else 0)
+        return wrapper
+    return decorator
@@ -0,0 +1,75 @@
+import json
+import time
+
+from server import PromptServer
+
+STREAM_EVENT = "DW-Chat.stream"
+
+class StreamPusher:
+    """累积流式输出，并按最小间隔把当前文本推送给前端节点"""
+
+    def __init__(self, node_id, min_interval=0.05):
+        self.node_id = node_id
+        self.min_interval = min_interval
+        self.parts = []
+        self._last_push = 0.0
+
+    @property
+    def text(self):
+        return "".join(self.parts)
+
+    def feed(self, delta):
+        if not delta:
+            return
+        self.parts.append(delta)
+        now = time.perf_counter()
+        if now - self._last_push >= self.min_interval:
+            self._last_push = now
+            self._send(done=False)
+
+    def finish(self):
+        self._send(done=True)
+        return self.text
+
+    def _send(self, done):
+        if self.node_id is None:
+            return
+        server = PromptServer.instance
+        if server.client_id is None:
+            return
+        server.send_sync(STREAM_EVENT, {"node": self.node_id, "text": self.text, "done": done}, server.client_id)
+
+def stream_chat_completion(chunks, node_id):
+    """消费 OpenAI 兼容 SDK（openai、groq）的流式结果，返回完整文本"""
+    pusher = StreamPusher(node_id)
+    for chunk in chunks:
+        if chunk.choices:
+            pusher.feed(chunk.choices[0].delta.content)
+    return pusher.finish()
+
+def stream_sse_lines(lines, node_id):
+    """消费 OpenAI 兼容接口的 SSE 原始行（data: {...}），返回完整文本"""
+    pusher = StreamPusher(node_id)
+    for line in lines:
+        if not line.startswith("data:"):
+            continue
+        data = line[len("data:"):].strip()
+        if data == "[DONE]":
+            break
+        choices = json.loads(data).get("choices") or []
+        if choices:
+            pusher.feed(choices[0].get("delta", {}).get("content"))
+    return pusher.finish()
+
+def stream_ndjson(chunks, node_id, key="response"):
+    """消费 Ollama 的 NDJSON 流（字典或原始行），返回完整文本和最后一个数据块"""
+    pusher = StreamPusher(node_id)
+    last = {}
+    for chunk in chunks:
+        if isinstance(chunk, (str, bytes)):
+            if not chunk.strip():
+                continue
+            chunk = json.loads(chunk)
+        last = chunk
+        pusher.feed(chunk.get(key))
+    return pusher.finish(), last
@@ -0,0 +1,101 @@
+import os
+import re
+import threading
+import unicodedata
+
+from api_utils import load_setting
+from response_cache import CACHE_DIR, ResponseCache
+
+LINE_SPLIT = re.compile(r'(\r?\n)')
+TAG_SPLIT = re.compile(r'(\s*[,，]\s*)')
+SENTENCE_SPLIT = re.compile(r'((?<=[.!?])\s+|(?<=[。！？]))')
+
+def normalize_segment(segment):
+    return " ".join(unicodedata.normalize("NFKC", segment).split())
+
+def _is_tag_line(line):
+    # 逗号分隔的短语（如提示词标签）按短语切分，普通句子按句切分
+    tags = TAG_SPLIT.split(line)[::2]
+    return len(tags) >= 3 and sum(len(tag) for tag in tags) / len(tags) <= 40
+
+def split_segments(text):
+    """把文本切成 [片段, 分隔符, 片段, ...]，偶数位是可翻译片段，分隔符原样保留"""
+    parts = []
+    for i, piece in enumerate(LINE_SPLIT.split(text)):
+        if i % 2:
+            parts.append(piece)
+            continue
+        splitter = TAG_SPLIT if _is_tag_line(piece) else SENTENCE_SPLIT
+        parts.extend(splitter.split(piece))
+    return parts
+
+def _localize_separator(separator, target_lang):
+    # 换行原样保留；逗号和句间分隔换成目标语言的写法，例如中文的 "，" 译成英文后应为 ", "
+    if "\n" in separator:
+        return separator
+    comma = separator.strip() in (",", "，")
+    if target_lang == "en":
+        return ", " if comma else " "
+    if target_lang == "zh":
+        return "，" if comma else ""
+    return separator
+
+def join_segments(parts, translations, target_lang=None):
+    """用翻译结果替换片段位，保留原有的首尾空白；给出 target_lang 时分隔符换成目标语言的写法"""
+    joined = []
+    for i, part in enumerate(parts):
+        if i % 2:
+            if target_lang and parts[i - 1].strip() and i + 1 < len(parts) and parts[i + 1].strip():
+                part = _localize_separator(part, target_lang)
+            joined.append(part)
+            continue
+        key = normalize_segment(part)
+        if key and key in translations:
+            leading = part[:len(part) - len(part.lstrip())]
+            trailing = part[len(part.rstrip()):]
+            joined.append(f"{leading}{translations[key]}{trailing}")
+        else:
+            joined.append(part)
+    return "".join(joined)
+
+class TranslationMemory:
+    """片段级翻译记忆，按 (规范化片段, 源语言, 目标语言, 国家) 寻址，复用响应缓存的持久化与淘汰"""
+
+    def __init__(self, store):
+        self.store = store
+
+    @staticmethod
+    def make_key(segment, source_lang, target_lang, country=""):
+        return ResponseCache.make_key("translation-memory", "deepseek-chat", normalize_segment(segment),
+                                      source_lang=source_lang, target_lang=target_lang, country=country.strip())
+
+    def lookup(self, segments, source_lang, target_lang, country=""):
+        """返回 {规范化片段: 译文}，只包含命中的片段"""
+        found = {}
+        for segment in segments:
+            value = self.store.get(self.make_key(segment, source_lang, target_lang, country))
+            if value is not None:
+                found[normalize_segment(segment)] = value
+        return found
+
+    def remember(self, translations, source_lang, target_lang, country=""):
+        for segment, translation in translations.items():
+            if translation and translation.strip():
+                self.store.set(self.make_key(segment, source_lang, target_lang, country), translation.strip())
+
+_translation_memory = None
+_translation_memory_lock = threading.Lock()
+
+def get_translation_memory():
+    """返回进程共享的翻译记忆，在 api_key.ini 的 [TRANSLATION_MEMORY] 中关闭时返回 None"""
+    global _translation_memory
+    if not load_setting("TRANSLATION_MEMORY", "enabled", True, bool):
+        return None
+    with _translation_memory_lock:
+        if _translation_memory is None:
+            _translation_memory = TranslationMemory(ResponseCache(
+                os.path.join(CACHE_DIR, "translation_memory.sqlite3"),
+                max_bytes=load_setting("TRANSLATION_MEMORY", "max_mb", 32, int) * 1024 * 1024,
+                max_age=load_setting("TRANSLATION_MEMORY", "max_age_days", 90, float) * 24 * 3600,
+            ))
+        return _translation_memory
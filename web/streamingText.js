@@ -0,0 +1,97 @@
+import { app } from "../../scripts/app.js";
+import { api } from "../../scripts/api.js";
+
+const MAX_LINES = 8;
+
+function wrapText(ctx, text, maxWidth) {
+    const lines = [];
+    for (const paragraph of text.split("\n")) {
+        let line = "";
+        for (const ch of paragraph) {
+            if (ctx.measureText(line + ch).width > maxWidth && line) {
+                lines.push(line);
+                line = ch;
+            } else {
+                line += ch;
+            }
+        }
+        lines.push(line);
+    }
+    // 只显示最新的几行
+    return lines.slice(-MAX_LINES);
+}
+
+function drawStreamText(node, ctx) {
+    if (node.flags.collapsed || !node.dw_stream_text) {
+        return;
+    }
+    const padding = 6;
+    const lineHeight = 14;
+    const width = node.size[0];
+
+    ctx.save();
+    ctx.font = "12px sans-serif";
+    const lines = wrapText(ctx, node.dw_stream_text, width - padding * 2);
+    const height = lines.length * lineHeight + padding * 2;
+    const top = node.size[1] + 4;
+
+    ctx.fillStyle = node.dw_stream_done ? "#29b56088" : "#ffa50088";
+    ctx.beginPath();
+    ctx.roundRect(0, top, width, height, 5);
+    ctx.fill();
+
+    ctx.fillStyle = "white";
+    lines.forEach((line, i) => {
+        ctx.fillText(line, padding, top + padding + (i + 1) * lineHeight - 3);
+    });
+    ctx.restore();
+}
+
+function swizzleNode(node) {
+    if (node.dw_stream_swizzled) {
+        return;
+    }
+    const orig = node.onDrawForeground ?? node.__proto__.onDrawForeground;
+    node.onDrawForeground = function (ctx) {
+        const r = orig?.apply?.(node, arguments);
+        if (app.ui.settings.getSettingValue("DW.StreamingText.Enabled", true)) {
+            drawStreamText(node, ctx);
+        }
+        return r;
+    };
+    node.dw_stream_swizzled = true;
+}
+
+app.registerExtension({
+    name: "DW-Chat.StreamingText",
+    async setup() {
+        app.ui.settings.addSetting({
+            id: "DW.StreamingText.Enabled",
+            name: "Show Streaming Text",
+            type: "boolean",
+            defaultValue: true,
+        });
+
+        api.addEventListener("DW-Chat.stream", ({ detail }) => {
+            const node = app.graph.getNodeById(detail.node);
+            if (node) {
+                node.dw_stream_text = detail.text;
+                node.dw_stream_done = detail.done;
+                app.graph.setDirtyCanvas(true, false);
+            }
+        });
+
+        api.addEventListener("execution_start", () => {
+            app.graph._nodes.forEach(node => {
+                node.dw_stream_text = undefined;
+                node.dw_stream_done = undefined;
+            });
+        });
+    },
+    async nodeCreated(node) {
+        swizzleNode(node);
+    },
+    async loadedGraphNode(node) {
+        swizzleNode(node);
+    }
+});